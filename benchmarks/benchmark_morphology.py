@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from skimage import draw
+
+from gunpowder.morphology import enlarge_binary_map
+
+
+def create_skeleton_map(shape, num_segments, segment_length, seed=42):
+
+    rng = np.random.RandomState(seed)
+    binary_map = np.zeros(shape, dtype=np.uint8)
+    for _ in range(num_segments):
+        begin = rng.randint(0, shape)
+        end = np.clip(
+            begin + rng.randint(-segment_length, segment_length, size=len(shape)),
+            0,
+            np.array(shape) - 1,
+        )
+        binary_map[draw.line_nd(begin, end, endpoint=True)] = 1
+    return binary_map
+
+
+@pytest.mark.parametrize("blockwise", [False, True], ids=["global", "blockwise"])
+@pytest.mark.parametrize("ring_fraction", [None, 0.5], ids=["ball", "ring"])
+@pytest.mark.parametrize("num_segments", [10, 100, 1000])
+def test_enlarge_binary_map(benchmark, blockwise, ring_fraction, num_segments):
+
+    binary_map = create_skeleton_map((64, 256, 256), num_segments, 20)
+
+    benchmark.extra_info["foreground_fraction"] = float(binary_map.mean())
+    benchmark(
+        enlarge_binary_map,
+        binary_map,
+        np.array([3.0]),
+        (1, 1, 1),
+        ring_fraction=ring_fraction,
+        blockwise=blockwise,
+    )
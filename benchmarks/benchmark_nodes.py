@@ -0,0 +1,285 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+import gunpowder as gp
+
+from conftest import SIZE_PARAMS, create_skeleton, request_batches
+
+
+def full_request(keys, dims, shape, arrays=("raw", "labels"), graphs=()):
+    """Request the whole volume."""
+
+    roi = gp.Roi((0,) * dims, shape)
+    request = gp.BatchRequest()
+    for name in arrays:
+        request[keys[name]] = gp.ArraySpec(roi=roi)
+    for name in graphs:
+        request[keys[name]] = gp.GraphSpec(roi=roi)
+    return request
+
+
+def center_request(keys, dims, shape, arrays=("raw", "labels"), graphs=()):
+    """Request the central half of the volume, to leave room for augmentations
+    that need context."""
+
+    shape = gp.Coordinate(shape)
+    roi = gp.Roi(shape / 4, shape / 2)
+    request = gp.BatchRequest()
+    for name in arrays:
+        request[keys[name]] = gp.ArraySpec(roi=roi)
+    for name in graphs:
+        request[keys[name]] = gp.GraphSpec(roi=roi)
+    return request
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+def test_elastic_augment(benchmark, keys, source_factory, size):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    pipeline = source + gp.ElasticAugment(
+        control_point_spacing=(10,) * dims,
+        jitter_sigma=(1,) * dims,
+        rotation_interval=(0, math.pi / 2),
+        spatial_dims=dims,
+    )
+    request = center_request(keys, dims, shape, graphs=("skeleton",))
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+def test_simple_augment(benchmark, keys, source_factory, size):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    pipeline = source + gp.SimpleAugment()
+
+    # transposes need the same extent in each dimension
+    side = min(shape) // 2
+    begin = gp.Coordinate(s // 2 - side // 2 for s in shape)
+    roi = gp.Roi(begin, (side,) * dims)
+    request = gp.BatchRequest()
+    request[keys["raw"]] = gp.ArraySpec(roi=roi)
+    request[keys["labels"]] = gp.ArraySpec(roi=roi)
+    request[keys["skeleton"]] = gp.GraphSpec(roi=roi)
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+@pytest.mark.parametrize("long_range", [False, True], ids=["short", "long"])
+def test_add_affinities(benchmark, keys, source_factory, size, long_range):
+
+    dims, shape = size
+    neighborhood = [list(row) for row in -np.eye(dims, dtype=int)]
+    if long_range:
+        neighborhood += [list(row) for row in -3 * np.eye(dims, dtype=int)]
+        neighborhood += [list(row) for row in -6 * np.eye(dims, dtype=int)]
+
+    source = source_factory(dims, shape)
+    pipeline = source + gp.AddAffinities(
+        neighborhood,
+        labels=keys["labels"],
+        affinities=keys["affs"],
+        affinities_mask=keys["affs_mask"],
+    )
+    request = center_request(keys, dims, shape, arrays=("affs", "affs_mask"))
+
+    request_batches(
+        benchmark,
+        pipeline,
+        request,
+        dims=dims,
+        shape=shape,
+        neighborhood_size=len(neighborhood),
+    )
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+def test_grow_boundary(benchmark, keys, source_factory, size):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    pipeline = source + gp.GrowBoundary(keys["labels"], steps=2)
+    request = full_request(keys, dims, shape, arrays=("labels",))
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+def test_balance_labels(benchmark, keys, source_factory, size):
+
+    dims, shape = size
+    neighborhood = [list(row) for row in -np.eye(dims, dtype=int)]
+    source = source_factory(dims, shape)
+    pipeline = (
+        source
+        + gp.AddAffinities(
+            neighborhood,
+            labels=keys["labels"],
+            affinities=keys["affs"],
+            affinities_mask=keys["affs_mask"],
+        )
+        + gp.BalanceLabels(
+            keys["affs"], keys["weights"], mask=keys["affs_mask"], slab=(1,) * dims
+        )
+    )
+    request = center_request(keys, dims, shape, arrays=("weights",))
+
+    benchmark.extra_info["stage"] = "add_affinities+balance_labels"
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+@pytest.mark.parametrize(
+    "mode,edges,inner_radius_fraction",
+    [("ball", True, None), ("ball", True, 0.5), ("peak", False, None)],
+    ids=["ball-edges", "ring-edges", "peak"],
+)
+def test_rasterize_graph(
+    benchmark, keys, source_factory, size, mode, edges, inner_radius_fraction
+):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    pipeline = source + gp.RasterizeGraph(
+        keys["skeleton"],
+        keys["rasterized"],
+        array_spec=gp.ArraySpec(voxel_size=(1,) * dims, dtype=np.uint8),
+        settings=gp.RasterizationSettings(
+            radius=3,
+            mode=mode,
+            edges=edges,
+            inner_radius_fraction=inner_radius_fraction,
+        ),
+    )
+    request = full_request(
+        keys, dims, shape, arrays=("rasterized",), graphs=("skeleton",)
+    )
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS)
+@pytest.mark.parametrize(
+    "edges,inner_radius_fraction",
+    [(False, None), (True, 0.5)],
+    ids=["ball", "ring-edges"],
+)
+def test_rasterize_graph_masked(
+    benchmark, keys, source_factory, size, edges, inner_radius_fraction
+):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    pipeline = source + gp.RasterizeGraph(
+        keys["skeleton"],
+        keys["rasterized"],
+        array_spec=gp.ArraySpec(voxel_size=(1,) * dims, dtype=np.uint8),
+        settings=gp.RasterizationSettings(
+            radius=3,
+            mask=keys["labels"],
+            edges=edges,
+            inner_radius_fraction=inner_radius_fraction,
+        ),
+    )
+    request = full_request(keys, dims, shape, arrays=("rasterized",))
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS[:1] + SIZE_PARAMS[2:3])
+def test_scan(benchmark, keys, source_factory, size):
+
+    dims, shape = size
+    source = source_factory(dims, shape)
+    chunk = gp.BatchRequest()
+    chunk[keys["raw"]] = gp.ArraySpec(roi=gp.Roi((0,) * dims, (16,) * dims))
+    pipeline = source + gp.Scan(chunk)
+    request = full_request(keys, dims, shape, arrays=("raw",))
+
+    request_batches(benchmark, pipeline, request, dims=dims, shape=shape)
+
+
+@pytest.mark.parametrize("num_nodes", [1000, 10000])
+@pytest.mark.parametrize("operation", ["crop", "trim", "shift"])
+def test_graph_operations(benchmark, keys, num_nodes, operation):
+
+    shape = (100, 100, 100)
+    nodes, edges = create_skeleton(shape, (1, 1, 1), num_nodes)
+    graph = gp.Graph(nodes, edges, gp.GraphSpec(roi=gp.Roi((0, 0, 0), shape)))
+    roi = gp.Roi((25, 25, 25), (50, 50, 50))
+
+    if operation == "crop":
+        run = lambda: graph.crop(roi)
+    elif operation == "trim":
+        run = lambda: graph.trim(roi)
+    else:
+        run = lambda: graph.copy().shift(gp.Coordinate((1, 1, 1)))
+
+    benchmark.extra_info["num_nodes"] = num_nodes
+    benchmark(run)
+
+
+class ArtifactSource(gp.BatchProvider):
+    """Provides random artifacts and alpha masks of any requested size,
+    slowed down by ``delay`` seconds per request to model an upstream
+    pipeline."""
+
+    def __init__(self, artifacts, artifacts_mask, delay=0.005):
+        self.artifacts = artifacts
+        self.artifacts_mask = artifacts_mask
+        self.delay = delay
+
+    def setup(self):
+        for key in [self.artifacts, self.artifacts_mask]:
+            self.provides(
+                key,
+                gp.ArraySpec(
+                    roi=gp.Roi((0, 0, 0), (1000, 1000, 1000)),
+                    voxel_size=(1, 1, 1),
+                    interpolatable=True,
+                    dtype=np.float32,
+                ),
+            )
+
+    def provide(self, request):
+        time.sleep(self.delay)
+        batch = gp.Batch()
+        for key in [self.artifacts, self.artifacts_mask]:
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch[key] = gp.Array(
+                np.random.rand(*spec.roi.get_shape()).astype(np.float32), spec
+            )
+        return batch
+
+
+@pytest.mark.parametrize("size", SIZE_PARAMS[2:])
+@pytest.mark.parametrize("pool_size", [0, 16], ids=["no-pool", "pool"])
+def test_defect_augment(benchmark, keys, source_factory, size, pool_size):
+
+    dims, shape = size
+    artifacts = gp.ArrayKey("ARTIFACTS")
+    artifacts_mask = gp.ArrayKey("ARTIFACTS_MASK")
+
+    source = source_factory(dims, shape)
+    pipeline = source + gp.DefectAugment(
+        keys["raw"],
+        prob_missing=0.1,
+        prob_low_contrast=0.1,
+        prob_artifact=0.3,
+        artifact_source=ArtifactSource(artifacts, artifacts_mask),
+        artifacts=artifacts,
+        artifacts_mask=artifacts_mask,
+        artifact_pool_size=pool_size,
+    )
+    request = full_request(keys, dims, shape, arrays=("raw",))
+
+    request_batches(
+        benchmark, pipeline, request, dims=dims, shape=shape, pool_size=pool_size
+    )
@@ -0,0 +1,186 @@
+"""End-to-end pipelines modelled after ``examples/cremi``, without the
+network, to track the throughput of data loading and augmentation."""
+
+import math
+
+import numpy as np
+import pytest
+
+import gunpowder as gp
+from gunpowder.ext import torch, NoSuchModule
+
+
+class FakePredict(gp.BatchFilter):
+    """Stand-in for a network: derives a three-channel float32 prediction
+    from ``raw``."""
+
+    def __init__(self, raw, prediction):
+        self.raw = raw
+        self.prediction = prediction
+
+    def setup(self):
+        spec = self.spec[self.raw].copy()
+        spec.dtype = np.float32
+        self.provides(self.prediction, spec)
+
+    def prepare(self, request):
+        deps = gp.BatchRequest()
+        deps[self.raw] = request[self.prediction].copy()
+        return deps
+
+    def process(self, batch, request):
+        raw = batch[self.raw]
+        spec = raw.spec.copy()
+        spec.dtype = np.float32
+        outputs = gp.Batch()
+        outputs[self.prediction] = gp.Array(
+            np.stack([raw.data, 1.0 - raw.data, raw.data ** 2]).astype(np.float32),
+            spec,
+        )
+        return outputs
+
+
+class ToTensor(gp.BatchFilter):
+    """Stand-in for the model boundary of ``gp.torch.Train``: converts the
+    given arrays to tensors."""
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def prepare(self, request):
+        pass
+
+    def process(self, batch, request):
+        from gunpowder.torch.helpers import array_to_tensor
+
+        for key in self.keys:
+            array_to_tensor(batch[key].data, "cpu")
+
+
+@pytest.mark.skipif(isinstance(torch, NoSuchModule), reason="torch is not installed")
+@pytest.mark.parametrize("contiguous", [False, True], ids=["views", "contiguous"])
+def test_augmentation_copies(benchmark, keys, container_files, contiguous):
+    """Copies of array data along a typical augmentation chain up to the
+    model boundary, reported as ``array_data_copies`` per node."""
+
+    voxel_size = gp.Coordinate((40, 4, 4))
+    input_size = gp.Coordinate((48, 164, 164)) * voxel_size
+    output_size = gp.Coordinate((20, 76, 76)) * voxel_size
+
+    request = gp.BatchRequest()
+    request.add(keys["raw"], input_size)
+    request.add(keys["labels"], output_size)
+    request.add(keys["affs"], output_size)
+    request.add(keys["weights"], output_size)
+
+    pipeline = (
+        gp.ZarrSource(
+            container_files["zarr"],
+            datasets={keys["raw"]: "volumes/raw", keys["labels"]: "volumes/labels"},
+        )
+        + gp.Normalize(keys["raw"])
+        + gp.RandomLocation()
+        + gp.SimpleAugment(transpose_only=[1, 2], contiguous=contiguous)
+        + gp.IntensityAugment(keys["raw"], 0.9, 1.1, -0.1, 0.1)
+        + gp.AddAffinities(
+            [[-1, 0, 0], [0, -1, 0], [0, 0, -1]],
+            labels=keys["labels"],
+            affinities=keys["affs"],
+        )
+        + gp.BalanceLabels(keys["affs"], keys["weights"])
+        + ToTensor([keys["raw"], keys["labels"], keys["affs"], keys["weights"]])
+    )
+
+    with gp.build(pipeline):
+        batch = benchmark(pipeline.request_batch, request)
+
+    copies = {
+        "%s.%s" % node: allocations["array_data"]
+        for node, allocations in batch.profiling_stats.get_allocations().items()
+        if allocations["array_data"] > 0
+    }
+    benchmark.extra_info["contiguous"] = contiguous
+    benchmark.extra_info["array_data_copies"] = copies
+    benchmark.extra_info["total_array_data_copies"] = sum(copies.values())
+
+
+@pytest.mark.parametrize("source_type", ["hdf5", "zarr"])
+def test_train_pipeline(benchmark, keys, container_files, source_type):
+
+    voxel_size = gp.Coordinate((40, 4, 4))
+    input_size = gp.Coordinate((48, 164, 164)) * voxel_size
+    output_size = gp.Coordinate((20, 76, 76)) * voxel_size
+
+    request = gp.BatchRequest()
+    request.add(keys["raw"], input_size)
+    request.add(keys["labels"], output_size)
+    request.add(keys["affs"], output_size)
+    request.add(keys["weights"], output_size)
+
+    datasets = {keys["raw"]: "volumes/raw", keys["labels"]: "volumes/labels"}
+    if source_type == "hdf5":
+        source = gp.Hdf5Source(container_files["hdf5"], datasets=datasets)
+    else:
+        source = gp.ZarrSource(container_files["zarr"], datasets=datasets)
+
+    pipeline = (
+        source
+        + gp.Normalize(keys["raw"])
+        + gp.RandomLocation()
+        + gp.ElasticAugment(
+            control_point_spacing=[4, 40, 40],
+            jitter_sigma=[0, 2, 2],
+            rotation_interval=[0, math.pi / 2.0],
+            prob_slip=0.05,
+            prob_shift=0.05,
+            max_misalign=10,
+            subsample=8,
+        )
+        + gp.SimpleAugment(transpose_only=[1, 2])
+        + gp.IntensityAugment(keys["raw"], 0.9, 1.1, -0.1, 0.1, z_section_wise=True)
+        + gp.GrowBoundary(keys["labels"], steps=1, only_xy=True)
+        + gp.AddAffinities(
+            [[-1, 0, 0], [0, -1, 0], [0, 0, -1]],
+            labels=keys["labels"],
+            affinities=keys["affs"],
+        )
+        + gp.BalanceLabels(keys["affs"], keys["weights"])
+    )
+
+    benchmark.extra_info["source"] = source_type
+    with gp.build(pipeline):
+        benchmark(pipeline.request_batch, request)
+
+
+def test_predict_pipeline(benchmark, keys, container_files, tmp_path):
+
+    voxel_size = gp.Coordinate((40, 4, 4))
+    chunk_size = gp.Coordinate((20, 64, 64)) * voxel_size
+    total_roi = gp.Roi((0, 0, 0), gp.Coordinate((40, 128, 128)) * voxel_size)
+
+    chunk_request = gp.BatchRequest()
+    chunk_request.add(keys["raw"], chunk_size)
+    chunk_request.add(keys["prediction"], chunk_size)
+
+    pipeline = (
+        gp.ZarrSource(
+            container_files["zarr"],
+            datasets={keys["raw"]: "volumes/raw"},
+            array_specs={keys["raw"]: gp.ArraySpec(interpolatable=True)},
+        )
+        + gp.Normalize(keys["raw"])
+        + FakePredict(keys["raw"], keys["prediction"])
+        + gp.ZarrWrite(
+            dataset_names={keys["prediction"]: "volumes/prediction"},
+            output_dir=str(tmp_path),
+            output_filename="prediction.zarr",
+        )
+        + gp.Scan(chunk_request)
+    )
+
+    request = gp.BatchRequest()
+    request[keys["raw"]] = gp.ArraySpec(roi=total_roi)
+    request[keys["prediction"]] = gp.ArraySpec(roi=total_roi)
+
+    with gp.build(pipeline):
+        benchmark.pedantic(pipeline.request_batch, args=(request,), rounds=3)
@@ -0,0 +1,178 @@
+import copy
+
+import h5py
+import numpy as np
+import pytest
+import zarr
+from scipy import ndimage
+
+import gunpowder as gp
+
+# (dims, shape in voxels) of the synthetic volumes
+SIZES = {
+    2: [(128, 128), (512, 512)],
+    3: [(32, 64, 64), (64, 128, 128)],
+}
+
+SIZE_PARAMS = [
+    pytest.param((dims, shape), id="%dd-%s" % (dims, "x".join(map(str, shape))))
+    for dims, shapes in SIZES.items()
+    for shape in shapes
+]
+
+
+def create_labels(shape, num_segments, seed=42):
+    """Random Voronoi segmentation with ``num_segments`` segments."""
+
+    rng = np.random.RandomState(seed)
+    seeds = np.zeros(shape, dtype=np.uint64)
+    coordinates = tuple(rng.randint(0, s, size=num_segments) for s in shape)
+    seeds[coordinates] = np.arange(1, num_segments + 1)
+    _, indices = ndimage.distance_transform_edt(seeds == 0, return_indices=True)
+    return seeds[tuple(indices)]
+
+
+def create_skeleton(shape, voxel_size, num_nodes, seed=42):
+    """Random walks through the volume, as lists of nodes and edges in world
+    units."""
+
+    rng = np.random.RandomState(seed)
+    end = np.array(shape) * np.array(voxel_size)
+    nodes = []
+    edges = []
+    location = rng.uniform(0, end)
+    for i in range(num_nodes):
+        if i % 50 == 0:
+            # start a new walk
+            location = rng.uniform(0, end)
+        else:
+            location = np.clip(
+                location + rng.normal(0, 2, size=len(shape)) * voxel_size,
+                0,
+                end - 1,
+            )
+            edges.append(gp.Edge(i - 1, i))
+        nodes.append(gp.Node(i, location=location.astype(np.float32)))
+    return nodes, edges
+
+
+class InMemorySource(gp.BatchProvider):
+    """Provides ``RAW`` (float32), ``LABELS`` (uint64), and ``SKELETON``
+    from memory."""
+
+    def __init__(self, raw, labels, skeleton, shape, voxel_size, num_nodes=1000):
+
+        self.raw = raw
+        self.labels = labels
+        self.skeleton = skeleton
+        self.voxel_size = gp.Coordinate(voxel_size)
+        self.roi = gp.Roi((0,) * len(shape), gp.Coordinate(shape) * self.voxel_size)
+
+        rng = np.random.RandomState(42)
+        self.raw_data = rng.rand(*shape).astype(np.float32)
+        self.labels_data = create_labels(shape, num_segments=100)
+        nodes, edges = create_skeleton(shape, voxel_size, num_nodes)
+        self.graph = gp.Graph(nodes, edges, gp.GraphSpec(roi=self.roi))
+
+    def setup(self):
+
+        self.provides(
+            self.raw,
+            gp.ArraySpec(
+                roi=self.roi,
+                voxel_size=self.voxel_size,
+                interpolatable=True,
+                dtype=np.float32,
+            ),
+        )
+        self.provides(
+            self.labels,
+            gp.ArraySpec(
+                roi=self.roi,
+                voxel_size=self.voxel_size,
+                interpolatable=False,
+                dtype=np.uint64,
+            ),
+        )
+        self.provides(self.skeleton, gp.GraphSpec(roi=self.roi))
+
+    def provide(self, request):
+
+        batch = gp.Batch()
+
+        for key, data in [(self.raw, self.raw_data), (self.labels, self.labels_data)]:
+            if key not in request:
+                continue
+            roi = request[key].roi
+            spec = copy.deepcopy(self.spec[key])
+            spec.roi = roi
+            slices = ((roi - self.roi.get_offset()) / self.voxel_size).to_slices()
+            batch[key] = gp.Array(data[slices].copy(), spec)
+
+        if self.skeleton in request:
+            batch[self.skeleton] = self.graph.crop(request[self.skeleton].roi)
+
+        return batch
+
+
+@pytest.fixture
+def keys():
+
+    return {
+        "raw": gp.ArrayKey("RAW"),
+        "labels": gp.ArrayKey("LABELS"),
+        "affs": gp.ArrayKey("AFFINITIES"),
+        "affs_mask": gp.ArrayKey("AFFINITIES_MASK"),
+        "weights": gp.ArrayKey("LOSS_WEIGHTS"),
+        "rasterized": gp.ArrayKey("RASTERIZED"),
+        "prediction": gp.ArrayKey("PREDICTION"),
+        "skeleton": gp.GraphKey("SKELETON"),
+    }
+
+
+@pytest.fixture
+def source_factory(keys):
+    """Create an :class:`InMemorySource` for the given dims and shape."""
+
+    def create(dims, shape):
+        voxel_size = (1,) * dims
+        return InMemorySource(
+            keys["raw"], keys["labels"], keys["skeleton"], shape, voxel_size
+        )
+
+    return create
+
+
+@pytest.fixture(scope="session")
+def container_files(tmp_path_factory):
+    """A temporary HDF5 and zarr container, each with a ``raw`` (uint8) and
+    ``labels`` (uint64) dataset of shape (100, 300, 300) and voxel size (40,
+    4, 4), similar to a CREMI sample."""
+
+    path = tmp_path_factory.mktemp("containers")
+    shape = (100, 300, 300)
+    rng = np.random.RandomState(42)
+    raw = rng.randint(0, 256, size=shape, dtype=np.uint8)
+    labels = create_labels(shape, num_segments=500)
+
+    hdf5_filename = str(path / "sample.hdf")
+    with h5py.File(hdf5_filename, "w") as f:
+        for name, data in [("volumes/raw", raw), ("volumes/labels", labels)]:
+            dataset = f.create_dataset(name, data=data, chunks=(10, 64, 64))
+            dataset.attrs["resolution"] = (40, 4, 4)
+
+    zarr_filename = str(path / "sample.zarr")
+    root = zarr.open(zarr_filename, "w")
+    for name, data in [("volumes/raw", raw), ("volumes/labels", labels)]:
+        dataset = root.create_dataset(name, data=data, chunks=(10, 64, 64))
+        dataset.attrs["resolution"] = (40, 4, 4)
+
+    return {"hdf5": hdf5_filename, "zarr": zarr_filename, "shape": shape}
+
+
+def request_batches(benchmark, pipeline, request, **extra_info):
+    """Build ``pipeline`` and benchmark requesting ``request`` from it."""
+
+    benchmark.extra_info.update(extra_info)
+    with gp.build(pipeline):
+        benchmark(pipeline.request_batch, request)
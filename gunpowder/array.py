@@ -1,5 +1,6 @@
 from .freezable import Freezable
-from copy import deepcopy
+from .profiling import count_allocation
+from copy import copy as shallow_copy, deepcopy
 from gunpowder.coordinate import Coordinate
 from gunpowder.roi import Roi
 import logging
@@ -29,12 +30,13 @@ class Array(Freezable):
 
     def __init__(self, data, spec=None, attrs=None):
 
-        self.spec = deepcopy(spec)
+        self.spec = None
+        if spec is not None:
+            self.spec = spec.copy()
+            count_allocation('array_spec')
         self.data = np.asarray(data)
-        self.attrs = attrs
-
-        if attrs is None:
-            self.attrs = {}
+        self.__attrs = attrs if attrs is not None else {}
+        self.__attrs_shared = False
 
         if (
                 spec is not None and
@@ -55,9 +57,27 @@ class Array(Freezable):
 
         self.freeze()
 
+    @property
+    def attrs(self):
+        # a cropped array shares the attrs of the array it was cropped from
+        # until it accesses them
+        if self.__attrs_shared:
+            self.__attrs = deepcopy(self.__attrs)
+            self.__attrs_shared = False
+            count_allocation('array_attrs')
+        return self.__attrs
+
+    @attrs.setter
+    def attrs(self, attrs):
+        self.__attrs = attrs
+        self.__attrs_shared = False
+
     def crop(self, roi, copy=True):
         '''Create a cropped copy of this Array.
 
+        Unless ``copy`` is set, the data of the cropped array is a view into
+        the data of this array. The ``attrs`` are copied only when accessed.
+
         Args:
 
             roi (:class:`Roi`):
@@ -86,11 +106,19 @@ class Array(Freezable):
         data = self.data[slices]
         if copy:
             data = np.array(data)
-
-        spec = deepcopy(self.spec)
-        attrs = deepcopy(self.attrs)
-        spec.roi = deepcopy(roi)
-        return Array(data, spec, attrs)
+            count_allocation('array_data')
+
+        # bypass __init__, the cropped array is consistent by construction
+        cropped = shallow_copy(self)
+        cropped.data = data
+        cropped.spec = shallow_copy(self.spec)
+        cropped.spec.roi = roi.copy()
+        count_allocation('array_spec')
+        # only the cropped array copies the attrs on access, this array keeps
+        # its own
+        cropped.__attrs_shared = True
+
+        return cropped
 
     def merge(self, array, copy_from_self=False, copy=False):
         '''Merge this array with another one. The resulting array will have the
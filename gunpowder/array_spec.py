@@ -83,7 +83,11 @@ class ArraySpec(Freezable):
 
     def copy(self):
         '''Create a copy of this spec.'''
-        return copy.deepcopy(self)
+        # all attributes but the ROI are immutable, a shallow copy suffices
+        spec = copy.copy(self)
+        if self.roi is not None:
+            spec.roi = self.roi.copy()
+        return spec
 
     def __eq__(self, other):
 
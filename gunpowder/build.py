@@ -1,15 +1,42 @@
 import logging
 
+from .pipeline import Pipeline
+
 logger = logging.getLogger(__name__)
 
 class build(object):
+    '''Context manager to set up a pipeline on enter and tear it down on
+    exit::
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+    Args:
+
+        pipeline (:class:`Pipeline`):
+
+            The pipeline to build.
+
+        consistency_checks (``string``, optional):
+
+            Which nodes should check the batches they provide against the
+            request they answer: ``full`` (default) for every node,
+            ``boundary`` for the output node of the pipeline only, or ``off``.
+    '''
 
-    def __init__(self, pipeline):
+    def __init__(self, pipeline, consistency_checks='full'):
         self.pipeline = pipeline
+        self.consistency_checks = consistency_checks
 
     def __enter__(self):
         try:
-            self.pipeline.setup()
+            if isinstance(self.pipeline, Pipeline):
+                self.pipeline.setup(self.consistency_checks)
+            else:
+                # a single node, it is its own boundary
+                self.pipeline.enable_consistency_checks(
+                    self.consistency_checks != 'off')
+                self.pipeline.setup()
         except:
             logger.error("something went wrong during the setup of the pipeline, calling tear down")
             self.pipeline.internal_teardown()
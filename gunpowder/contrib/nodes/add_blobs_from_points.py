@@ -1,8 +1,11 @@
 import logging
-import itertools
 import numpy as np
 
 from gunpowder.array import Array
+from gunpowder.batch import Batch
+from gunpowder.batch_request import BatchRequest
+from gunpowder.graph_spec import GraphSpec
+from gunpowder.morphology import create_ball_kernel
 from gunpowder.nodes.batch_filter import BatchFilter
 
 logger = logging.getLogger(__name__)
@@ -22,7 +25,8 @@ class AddBlobsFromPoints(BatchFilter):
 
             `blob_name` : dict (
 
-                'points_key' : Desired point type to use for blob locations
+                'points_key' : Desired :class:`GraphKey` to use for blob
+                locations
 
                 'output_array_key': Desired array type name for output map
 
@@ -37,24 +41,29 @@ class AddBlobsFromPoints(BatchFilter):
 
                 'restrictive_mask_key': Array type of restrictive mask
 
-                'id_mapper': Functor (class with a __call__ function) that can
-                take an ID and map it to some other value. This class should
-                also have a 'make_map' method that will be called at the
-                beggining of each process step and given all ids in all arrays
-                to be processed for that batch.
+                'id_mapper' (optional): Functor (class with a __call__
+                function) that can take an ID and map it to some other value.
+                This class should also have a 'make_map' method that will be
+                called at the beggining of each process step and given all
+                graphs to be processed for that batch.
+
+                'partner_points' (optional): :class:`GraphKey` of the partner
+                points. If given, no blobs are placed for points without a
+                partner.
             )
 
-            This is an example blob_setting for presynaptic blobs in the cremi
-            dataset::
+            The marker of each blob is the ``synapse_id`` attribute of its
+            node. This is an example blob_setting for presynaptic blobs in the
+            cremi dataset::
 
               add_blob_data = {
                 'PRESYN': {
-                  'points_key': PointsTypes.PRESYN,
-                  'output_array_key': ArrayTypes.PRESYN_BLOB,
+                  'points_key': GraphKeys.PRESYN,
+                  'output_array_key': ArrayKeys.PRESYN_BLOB,
                   'output_array_dtype': 'int64',
                   'radius': 60,
                   'output_voxel_size': voxel_size,
-                  'restrictive_mask_key': ArrayTypes.GT_LABELS,
+                  'restrictive_mask_key': ArrayKeys.GT_LABELS,
                   'max_desired_overlap': 0.05
                 }
               }
@@ -73,139 +82,133 @@ class AddBlobsFromPoints(BatchFilter):
 
     def setup(self):
         for blob_name, settings in self.blob_settings.items():
-            self.provides(
-                settings['output_array_key'],
-                self.spec[settings['restrictive_mask_key']]
-                )
+            spec = self.spec[settings['restrictive_mask_key']].copy()
+            spec.dtype = np.dtype(settings['output_array_dtype'])
+            self.provides(settings['output_array_key'], spec)
 
     def prepare(self, request):
 
+        deps = BatchRequest()
+
         for blob_name, settings in self.blob_settings.items():
             array_key = settings['output_array_key']
-            if array_key in request:
-
-                points_key = settings['points_key']
-                request_roi = request[array_key].roi
-
-
-                # If point is not already requested, add to request
-                if points_key not in request.points_specs:
-                    request.add(points_key, request_roi.get_shape())
-                else:
-                    request[points_key].roi =\
-                     request[points_key].roi.union(request_roi)
-
-                # Get correct size for restrictive_mask_key
-                restrictive_mask_key = settings['restrictive_mask_key']
-                if restrictive_mask_key not in request.array_specs:
-                    request.add(restrictive_mask_key, request_roi.get_shape())
-                else:
-                    request[restrictive_mask_key].roi =\
-                     request[restrictive_mask_key].roi.union(request_roi)
-            else:
-                # do nothing if no blobs of this type were requested
-                logger.warning('%s output array type for %s never requested. \
-                    Deleting entry...'%(settings['output_array_key'], blob_name))
-                del self.blob_settings[blob_name]
-
+            if array_key not in request:
+                continue
 
-    def process(self, batch, request):
+            request_roi = request[array_key].roi
 
-        # check arrays and gather all IDs and synapse IDs
-        all_points = {}
-        all_synapse_ids = {}
+            for points_key in [
+                    settings['points_key'],
+                    settings.get('partner_points')]:
+                if points_key is None:
+                    continue
+                roi = request_roi
+                if points_key in deps:
+                    roi = roi.union(deps[points_key].roi)
+                deps[points_key] = GraphSpec(roi=roi)
 
-        for blob_name, settings in self.blob_settings.items():
-            # Unpack settings
-            points_key = settings['points_key']
             restrictive_mask_key = settings['restrictive_mask_key']
+            roi = request_roi
+            if restrictive_mask_key in deps:
+                roi = roi.union(deps[restrictive_mask_key].roi)
+            deps[restrictive_mask_key] = self.spec[restrictive_mask_key].copy()
+            deps[restrictive_mask_key].roi = roi
 
+        return deps
 
-            # Make sure both the necesary point types and arrays are present
-            assert points_key in batch.points, "Upstream does not provide required point type\
-            : %s"%points_key
-
-            assert restrictive_mask_key in batch.arrays, "Upstream does not provide required \
-            array type: %s"%restrictive_mask_key
-
-            # Get point data
-            points = batch.points[points_key]
+    def process(self, batch, request):
 
-            # If point doesn't have it's corresponding partner, delete it
-            if 'partner_points' in settings.keys() and settings['partner_points'] is not None:
-                partner_points = batch.points[settings['partner_points']]
-                synapse_ids = []
-                for point_id, point in points.data.items():
-                    # pdb.set_trace()
-                    if not point.partner_ids[0] in partner_points.data.keys():
-                        logger.warning('Point %s has no partner. Deleting...'%point_id)
-                        del points.data[point_id]
-                    else:
-                        synapse_ids.append(point.synapse_id)
+        outputs = Batch()
 
-            all_synapse_ids[points_key] = synapse_ids
-            all_points[points_key] = points
+        # gather all requested graphs
+        all_points = {}
+        for blob_name, settings in self.blob_settings.items():
+            if settings['output_array_key'] in request:
+                points_key = settings['points_key']
+                all_points[points_key] = batch.graphs[points_key]
 
         for blob_name, settings in self.blob_settings.items():
 
             # Unpack settings
             points_key = settings['points_key']
             array_key = settings['output_array_key']
-            voxel_size = settings['output_voxel_size']
-            restrictive_mask_key = settings['restrictive_mask_key']
-            restrictive_mask = batch.arrays[restrictive_mask_key].crop(request[array_key].roi)
+            if array_key not in request:
+                continue
 
-            id_mapper = settings['id_mapper']
+            voxel_size = np.asarray(settings['output_voxel_size'])
+            roi = request[array_key].roi
+            restrictive_mask = batch.arrays[
+                settings['restrictive_mask_key']].crop(roi, copy=False)
+
+            id_mapper = settings.get('id_mapper')
             dtype = settings['output_array_dtype']
 
             if id_mapper is not None:
                 id_mapper.make_map(all_points)
 
-            # Initialize output array
-            shape_array = np.asarray(request[array_key].roi.get_shape())/voxel_size
-            blob_map = np.zeros(shape_array, dtype=dtype)
-
-            # Get point data
-            points = batch.points[points_key]
-
-
-            offset = np.asarray(points.spec.roi.get_offset())
-            for point_id, point_data in points.data.items():
-                voxel_location = np.round(((point_data.location - offset)/(voxel_size))).astype('int32')
-
-                synapse_id = point_data.synapse_id
-                # if mapping exists, do it
-                if id_mapper is not None:
-                    synapse_id = id_mapper(synapse_id)
+            points = batch.graphs[points_key]
+            partner_points = None
+            if settings.get('partner_points') is not None:
+                partner_points = batch.graphs[settings['partner_points']]
+
+            # get locations and markers of all points with a partner (if
+            # required)
+            point_ids = []
+            synapse_ids = []
+            locations = []
+            for node in points.nodes:
+                if partner_points is not None:
+                    partner_ids = node.attrs.get('partner_ids', [])
+                    if (
+                            len(partner_ids) == 0 or
+                            not partner_points.contains(partner_ids[0])):
+                        logger.warning(
+                            'Point %s has no partner, skipping it', node.id)
+                        continue
+                synapse_id = node.attrs['synapse_id']
+                point_ids.append(node.id)
+                synapse_ids.append(synapse_id)
+                locations.append(node.location)
+
+            markers = synapse_ids
+            if id_mapper is not None:
+                markers = [id_mapper(synapse_id) for synapse_id in synapse_ids]
 
-                settings['blob_placer'].place(blob_map, voxel_location,
-                    synapse_id, restrictive_mask.data)
+            # Initialize output array and place all blobs
+            shape_array = tuple(np.asarray(roi.get_shape())//voxel_size)
+            blob_map = np.zeros(shape_array, dtype=dtype)
 
+            if len(locations) > 0:
+                offset = np.asarray(roi.get_offset())
+                voxel_locations = np.round(
+                    (np.asarray(locations) - offset)/voxel_size).astype('int32')
+                settings['blob_placer'].place_all(
+                    blob_map,
+                    voxel_locations,
+                    markers,
+                    restrictive_mask.data)
 
             # Provide array
-            batch.arrays[array_key] = Array(blob_map, spec=request[array_key].copy())
-            batch.arrays[array_key].spec.dtype = dtype
+            spec = self.spec[array_key].copy()
+            spec.roi = roi
+            outputs.arrays[array_key] = Array(blob_map, spec=spec)
 
             # add id_mapping to attributes
             if id_mapper is not None:
                 id_map_list = np.array(list(id_mapper.get_map().items()))
-                batch.arrays[array_key].attrs['id_mapping'] = id_map_list
+                outputs.arrays[array_key].attrs['id_mapping'] = id_map_list
 
-            batch.arrays[array_key].attrs['point_ids'] = points.data.keys()
-            batch.arrays[array_key].attrs['synapse_ids'] = all_synapse_ids[points_key]
+            outputs.arrays[array_key].attrs['point_ids'] = point_ids
+            outputs.arrays[array_key].attrs['synapse_ids'] = synapse_ids
 
-            # Crop all other requests
-        for array_key, array in request.array_specs.items():
-            batch.arrays[array_key] = batch.arrays[array_key].crop(array.roi)
-
-        for points_key, points in request.points_specs.items():
-            batch.points[points_key] = batch.points[points_key].spec.roi = points.roi
+        return outputs
 
 class BlobPlacer:
     ''' Places synapse array blobs from location data.
         Args:
             radius: int - that desired radius of synaptic blobs
             voxel_size: array, list, tuple - voxel size in physical
+            dtype: the dtype of the placed blobs
         '''
 
     def __init__(self, radius, voxel_size, dtype='uint64'):
@@ -214,26 +217,22 @@ class BlobPlacer:
         if isinstance(self.voxel_size, (list, tuple)):
             self.voxel_size = np.asarray(self.voxel_size)
 
-        self.radius = (radius/self.voxel_size)
-        self.sphere_map = np.zeros(self.radius*2, dtype=dtype)
-        self.center = (np.asarray(self.sphere_map.shape))/2
-
-        ranges = [range(0, self.radius[0]*2),
-                  range(0, self.radius[1]*2),
-                  range(0, self.radius[2]*2)]
+        # the cached ball kernel of the morphology module, centered at the
+        # blob location
+        kernel = create_ball_kernel(radius, self.voxel_size)
+        self.sphere_map = kernel.astype(dtype)
+        self.radius = np.asarray(kernel.shape)//2
+        self.sphere_offsets = (
+            np.stack(np.nonzero(kernel), axis=1) - self.radius)
 
-        for index in np.asarray(list(itertools.product(*ranges))):
-            # if distance less than r, place a 1
-            if np.linalg.norm((self.center - index)*self.voxel_size) <= radius:
-                self.sphere_map[tuple(index)] = 1
-
-        self.sphere_voxel_array = np.sum(self.sphere_map, axis=(0, 1, 2))
+        self.sphere_voxel_array = np.sum(self.sphere_map)
 
     def place(self, matrix, location, marker, mask):
         ''' Places synapse
         Args:
-            matrix: 4D np array - 1st dim are for layers to avoid overlap
-            (3 should be more than enough)
+            matrix: np array - either of the same shape as the mask, or 4D
+            where the 1st dim are layers to avoid overlap (3 should be more
+            than enough)
             location: np array - location where to place synaptic blob within given matrix
             marker: int - the ID used to mark this paricular synapse in the matrix
             mask:   3D np array - when placing a blob, will sample mask at
@@ -241,24 +240,62 @@ class BlobPlacer:
         the same ID. Usually used to restrict synaptic blobs inside their
         respective cells (using segmentation)
         '''
-        # Calculate cube circumscribing the sphere to place
-        start = location - self.radius
-        end = location + self.radius
-
-        # check if sphere fits in matrix
-        if np.all(start >= 0) and np.all(np.asarray(matrix.shape) - end >= 0):
 
-            # calculate actual synapse shape from intersection between sphere and restrictive mask
-            restricting_label = mask[location[0], location[1], location[2]]
+        placed = self.place_all(matrix, [location], [marker], mask)
+        return matrix, placed[0]
 
-            restricting_mask = \
-            mask[start[0]:end[0], start[1]:end[1], start[2]:end[2]] == restricting_label
+    def place_all(self, matrix, locations, markers, mask):
+        ''' Places several synapses at once, see :meth:`place`.
 
-            shape = (self.sphere_map*restricting_mask)
+        Blobs that do not fit entirely into ``matrix`` are not placed. If
+        ``matrix`` has layers, each blob is placed in the first layer it does
+        not overlap with any other blob (or the last layer, if there is no
+        such layer). Otherwise, overlapping blobs are added up.
 
-            # place shape in chosen layer
-            matrix[start[0]:end[0], start[1]:end[1], start[2]:end[2]] += shape*marker
-            return matrix, True
+        Returns:
+            A boolean array indicating which blobs have been placed.
+        '''
 
-        logger.warning('Location %s out of bounds'%(location))
-        return matrix, False
+        locations = np.asarray(locations, dtype=np.int64).reshape(
+            -1, len(self.radius))
+        markers = np.asarray(markers)
+        spatial_shape = np.asarray(matrix.shape[-len(self.radius):])
+
+        # check which spheres fit in matrix
+        placed = np.logical_and(
+            np.all(locations - self.radius >= 0, axis=1),
+            np.all(locations + self.radius < spatial_shape, axis=1))
+        for location in locations[np.logical_not(placed)]:
+            logger.warning('Location %s out of bounds'%(location))
+
+        locations = locations[placed]
+        markers = markers[placed]
+        if len(locations) == 0:
+            return placed
+
+        # all voxels of all spheres
+        voxels = locations[:, None, :] + self.sphere_offsets[None, :, :]
+        voxels = tuple(np.moveaxis(voxels, 2, 0))
+
+        # calculate actual synapse shape from intersection between sphere and
+        # restrictive mask
+        restricting_labels = mask[tuple(locations.T)]
+        inside = mask[voxels] == restricting_labels[:, None]
+
+        if matrix.ndim == len(self.radius):
+            blob_ids = np.nonzero(inside)[0]
+            np.add.at(
+                matrix,
+                tuple(v[inside] for v in voxels),
+                markers[blob_ids].astype(matrix.dtype))
+            return placed
+
+        # place each blob in the first layer it does not overlap with
+        for b in range(len(locations)):
+            blob_voxels = tuple(v[b][inside[b]] for v in voxels)
+            for layer in range(len(matrix)):
+                if not np.any(matrix[layer][blob_voxels]):
+                    break
+            matrix[layer][blob_voxels] += markers[b].astype(matrix.dtype)
+
+        return placed
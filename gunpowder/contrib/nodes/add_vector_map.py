@@ -1,13 +1,12 @@
 import copy
 import logging
 import numpy as np
-from scipy.spatial import KDTree
 
 from gunpowder.array import Array
 from gunpowder.array_spec import ArraySpec
 from gunpowder.batch_request import BatchRequest
 from gunpowder.coordinate import Coordinate
-from gunpowder.morphology import enlarge_binary_map
+from gunpowder.morphology import create_ball_kernel
 from gunpowder.nodes.batch_filter import BatchFilter
 from gunpowder.graph_spec import GraphSpec
 
@@ -119,12 +118,13 @@ class AddVectorMap(BatchFilter):
                 )
                 deps[trg_points_key] = GraphSpec(padded_roi)
 
-        for (
-            array_key,
-            stayinside_array_key,
-        ) in self.array_keys_to_stayinside_array_keys.items():
-            if array_key in request:
-                deps[stayinside_array_key] = copy.deepcopy(request[array_key])
+        if self.array_keys_to_stayinside_array_keys is not None:
+            for (
+                array_key,
+                stayinside_array_key,
+            ) in self.array_keys_to_stayinside_array_keys.items():
+                if array_key in request:
+                    deps[stayinside_array_key] = copy.deepcopy(request[array_key])
 
         return deps
 
@@ -148,120 +148,97 @@ class AddVectorMap(BatchFilter):
         src_points_key, trg_points_key = self.array_to_src_trg_points[
             vector_map_array_key
         ]
-        dim_vectors = len(request[vector_map_array_key].roi.get_shape())
-        voxel_size_vm = self.voxel_sizes[vector_map_array_key]
-        offset_vector_map_phys = request[vector_map_array_key].roi.get_offset()
+        roi = request[vector_map_array_key].roi
+        dim_vectors = roi.dims()
+        voxel_size_vm = np.asarray(self.voxel_sizes[vector_map_array_key])
+        offset_vector_map_phys = np.asarray(roi.get_offset())
+        shape_vx = np.asarray(roi.get_shape()) // voxel_size_vm
         vector_map_total = np.zeros(
-            (dim_vectors,)
-            + (request[vector_map_array_key].roi.get_shape() // voxel_size_vm),
-            dtype=np.float32,
+            (dim_vectors,) + tuple(shape_vx), dtype=np.float32
         )
 
         if batch.graphs[src_points_key].num_vertices() == 0:
             return vector_map_total
 
+        # all source locations in the vector map with their partner locations
+        src_locations = []
+        partner_locations = []
         for node in batch.graphs[src_points_key].nodes:
-
-            if request[vector_map_array_key].roi.contains(Coordinate(node.location)):
-
-                # get all partner locations which should be considered
+            if roi.contains(Coordinate(node.location)):
                 relevant_partner_loc = self.__get_relevant_partner_locations(
                     batch, node, trg_points_key
                 )
                 if len(relevant_partner_loc) > 0:
+                    src_locations.append(node.location)
+                    partner_locations.append(np.asarray(relevant_partner_loc))
+
+        if len(src_locations) == 0:
+            return vector_map_total
+
+        src_locations = np.asarray(src_locations)
+
+        # candidate voxels (where to set vectors) for all source locations at
+        # once
+        src_ids, locations_to_fill_vx = self.__get_candidates(
+            batch,
+            vector_map_array_key,
+            src_locations,
+            offset_vector_map_phys,
+            shape_vx,
+        )
+        locations_to_fill_abs_phys = (
+            locations_to_fill_vx * voxel_size_vm + offset_vector_map_phys
+        )
+
+        # the target location of each candidate voxel, for sources with a
+        # single partner this is the partner location
+        num_partners = np.array([len(p) for p in partner_locations])
+        trg_locations = np.asarray([p[0] for p in partner_locations])[src_ids]
+
+        # each partner gets the same number of voxels (the last one the rest),
+        # sources with less voxels than partners get no vectors
+        num_candidates = np.bincount(src_ids, minlength=len(src_locations))
+        num_src_vectors_per_trg_loc = num_candidates // num_partners
+        valid = num_src_vectors_per_trg_loc[src_ids] > 0
+
+        # split the voxels of sources with several partners: starting with the
+        # partner furthest away, each partner gets the voxels closest to it
+        candidates_begin = np.concatenate(([0], np.cumsum(num_candidates)))
+        for src_id in np.nonzero(
+            (num_partners > 1) & (num_src_vectors_per_trg_loc > 0)
+        )[0]:
+
+            partners = partner_locations[src_id]
+            distances = np.linalg.norm(partners - src_locations[src_id], axis=1)
+            remaining = np.arange(
+                candidates_begin[src_id], candidates_begin[src_id + 1]
+            )
+
+            for nr, partner_id in enumerate(
+                np.argsort(-distances, kind="stable")
+            ):
+                trg_loc_abs_phys = partners[partner_id]
+                if nr == len(partners) - 1:
+                    trg_locations[remaining] = trg_loc_abs_phys
+                    break
+                distances_to_trg = np.linalg.norm(
+                    locations_to_fill_abs_phys[remaining] - trg_loc_abs_phys, axis=1
+                )
+                closest = np.argsort(distances_to_trg, kind="stable")
+                num_closest = num_src_vectors_per_trg_loc[src_id]
+                trg_locations[remaining[closest[:num_closest]]] = trg_loc_abs_phys
+                remaining = np.sort(remaining[closest[num_closest:]])
+
+        # place all vectors with a single write, where regions of sources
+        # overlap the later source wins
+        vectors = (trg_locations - locations_to_fill_abs_phys)[valid]
+        indices = np.ravel_multi_index(
+            tuple(locations_to_fill_vx[valid].T), tuple(shape_vx)
+        )
+        indices, last = np.unique(indices[::-1], return_index=True)
+        vectors = vectors[::-1][last]
+        vector_map_total.reshape(dim_vectors, -1)[:, indices] = vectors.T
 
-                    # get locations where to set vectors around source location
-                    # (look only at region close to src location (to avoid np.nonzero() over entire array))
-                    mask = self.__get_mask(
-                        batch, request, vector_map_array_key, node.location
-                    )
-                    offset_vx_considered_mask = [
-                        (
-                            (
-                                node.location[dim]
-                                - self.radius_phys
-                                - offset_vector_map_phys[dim]
-                            )
-                            // voxel_size_vm[dim]
-                        )
-                        for dim in range(dim_vectors)
-                    ]
-                    clipped_offset_vx_considered_mask = np.clip(
-                        offset_vx_considered_mask, a_min=0, a_max=np.inf
-                    )
-                    slices = tuple(
-                        slice(
-                            int(np.max((0, offset_vx_considered_mask[dim]))),
-                            int(
-                                np.min(
-                                    (
-                                        offset_vx_considered_mask[dim]
-                                        + (2 * self.radius_phys // voxel_size_vm[dim]),
-                                        ((mask.shape[dim])),
-                                    )
-                                )
-                            ),
-                        )
-                        for dim in range(dim_vectors)
-                    )
-                    considered_region_mask = mask[slices]
-                    locations_to_fill_vx = np.reshape(
-                        np.nonzero(considered_region_mask), [dim_vectors, -1]
-                    ).T
-                    locations_to_fill_abs_phys = (
-                        (
-                            (locations_to_fill_vx + clipped_offset_vx_considered_mask)
-                            * voxel_size_vm
-                        )
-                        + offset_vector_map_phys
-                    ).tolist()
-
-                    # check for target node with largest distance first and add vector pointing to it to vector_map_total
-                    num_src_vectors_per_trg_loc = len(
-                        locations_to_fill_abs_phys
-                    ) // len(relevant_partner_loc)
-                    if num_src_vectors_per_trg_loc > 0:
-                        dist_to_locs = {}
-                        for phys_loc in relevant_partner_loc:
-                            dist_to_locs[
-                                np.linalg.norm(node.location - phys_loc)
-                            ] = phys_loc
-                        for nr, dist in enumerate(
-                            reversed(np.sort(list(dist_to_locs.keys())))
-                        ):
-                            trg_loc_abs_phys = dist_to_locs[dist]
-                            kdtree_locs_vector_map = KDTree(locations_to_fill_abs_phys)
-                            if nr == len(relevant_partner_loc) - 1:
-                                num_src_vectors_per_trg_loc = len(
-                                    locations_to_fill_abs_phys
-                                )
-                            distances, ids = kdtree_locs_vector_map.query(
-                                trg_loc_abs_phys, k=num_src_vectors_per_trg_loc
-                            )
-
-                            try:
-                                len(ids)
-                            except TypeError:
-                                ids = [ids]
-
-                            for src_voxel_id in ids:
-                                # remove node from list which are taken as neighbors of THIS target location
-                                neighbor_loc_abs_phys = kdtree_locs_vector_map.data[
-                                    src_voxel_id
-                                ]
-                                locations_to_fill_abs_phys.remove(
-                                    neighbor_loc_abs_phys.tolist()
-                                )
-
-                                # get vector for THIS neighbor to THIS target location, get its location and place it
-                                vector = trg_loc_abs_phys - neighbor_loc_abs_phys
-                                neighbor_loc_shifted_vx = (
-                                    neighbor_loc_abs_phys - offset_vector_map_phys
-                                ) // voxel_size_vm
-                                for dim in range(dim_vectors):
-                                    vector_map_total[dim][
-                                        tuple([int(l)] for l in neighbor_loc_shifted_vx)
-                                    ] = vector[dim]
         return vector_map_total
 
     def __get_relevant_partner_locations(self, batch, node, trg_points_key):
@@ -293,44 +270,60 @@ class AddVectorMap(BatchFilter):
                     stored_pos = partner_loc.copy()
             return [stored_pos]
 
-    def __get_mask(self, batch, request, vector_map_array_key, src_location):
-        """ create binary mask encoding where to place vectors for in region around considered src_location """
+    def __get_candidates(
+        self, batch, vector_map_array_key, src_locations, offset_bm_phys, shape_vx
+    ):
+        """Get all voxels where to place vectors around the given source
+        locations: within ``radius_phys`` and, optionally, in the same object
+        of the stayinside array. Returns the source index and voxel of each
+        candidate, ordered by source."""
+
+        voxel_size = np.asarray(self.voxel_sizes[vector_map_array_key])
 
-        voxel_size = self.voxel_sizes[vector_map_array_key]
+        # voxels of a ball around each source location
+        kernel = create_ball_kernel(self.radius_phys, voxel_size)
+        kernel_offsets = np.stack(np.nonzero(kernel), axis=1) - (
+            np.asarray(kernel.shape) // 2
+        )
+        src_locations_vx = (src_locations - offset_bm_phys).astype(
+            np.int32
+        ) // voxel_size
+        candidates = src_locations_vx[:, None, :] + kernel_offsets[None, :, :]
+
+        # restricted to a window around each source location
+        window_begin = (src_locations - self.radius_phys - offset_bm_phys) // voxel_size
+        window_end = np.minimum(
+            window_begin + (2 * self.radius_phys // voxel_size), shape_vx
+        )
+        window_begin = np.maximum(window_begin, 0)
+        inside = np.all(
+            (candidates >= window_begin[:, None, :])
+            & (candidates < window_end[:, None, :]),
+            axis=2,
+        )
+        src_ids, kernel_ids = np.nonzero(inside)
+        candidates = candidates[src_ids, kernel_ids]
 
-        offset_bm_phys = request[vector_map_array_key].roi.get_offset()
-        shape_bm_array_vx = request[vector_map_array_key].roi.get_shape() // voxel_size
-        binary_map = np.zeros(shape_bm_array_vx, dtype="uint8")
+        if self.array_keys_to_stayinside_array_keys is not None:
 
-        if self.array_keys_to_stayinside_array_keys is None:
-            mask = np.ones_like(binary_map)
-        else:
             stayinside_array_key = self.array_keys_to_stayinside_array_keys[
                 vector_map_array_key
             ]
             mask = batch.arrays[stayinside_array_key].data
 
-        if mask.shape > binary_map.shape:
-            # assumption: binary map is centered in the mask array
-            padding = (np.asarray(mask.shape) - np.asarray(binary_map.shape)) / 2.0
-            slices = [slice(np.floor(pad), -np.ceil(pad)) for pad in padding]
-            mask = mask[slices]
-
-        binary_map_total = np.zeros_like(binary_map)
-
-        shifted_loc = src_location - np.asarray(offset_bm_phys)
-        shifted_loc = shifted_loc.astype(np.int32) // voxel_size
-        object_id = mask[tuple([loc] for loc in shifted_loc)][
-            0
-        ]  # 0 index, otherwise numpy array with single number
+            if np.any(np.asarray(mask.shape) > shape_vx):
+                # assumption: binary map is centered in the mask array
+                padding = (np.asarray(mask.shape) - shape_vx) / 2.0
+                mask = mask[
+                    tuple(
+                        slice(int(np.floor(pad)), int(np.floor(pad)) + s)
+                        for pad, s in zip(padding, shape_vx)
+                    )
+                ]
 
-        binary_map[tuple([loc] for loc in shifted_loc)] = 1
-        binary_map = enlarge_binary_map(
-            binary_map, radius=self.radius_phys, voxel_size=voxel_size
-        )
-        binary_map[mask != object_id] = 0
-        binary_map_total += binary_map
-        binary_map.fill(0)
-        binary_map_total[binary_map_total != 0] = 1
+            object_ids = mask[tuple(src_locations_vx.T)]
+            same_object = mask[tuple(candidates.T)] == object_ids[src_ids]
+            src_ids = src_ids[same_object]
+            candidates = candidates[same_object]
 
-        return binary_map_total
+        return src_ids, candidates
@@ -247,6 +247,63 @@ class Graph(Freezable):
                 )
             yield v
 
+    @property
+    def node_ids(self):
+        """
+        The ids of all nodes in this graph, in the same order as
+        :attr:`locations`.
+        """
+        return list(self.__graph.nodes)
+
+    @property
+    def locations(self) -> np.ndarray:
+        """
+        The locations of all nodes in this graph as an array of shape
+        ``(N, D)``, in the same order as :attr:`node_ids`.
+
+        The returned array is a copy. To move nodes, assign a new array of
+        the same shape to this property.
+        """
+        if self.__graph.number_of_nodes() == 0:
+            return np.zeros((0, self.__dims()), dtype=self.spec.dtype)
+        return np.stack(
+            [attrs["location"] for attrs in self.__graph.nodes.values()]
+        ).astype(self.spec.dtype, copy=False)
+
+    @locations.setter
+    def locations(self, locations: np.ndarray):
+        locations = np.array(locations, dtype=self.spec.dtype, copy=True)
+        assert locations.shape[0] == self.__graph.number_of_nodes(), (
+            f"Got {locations.shape[0]} locations for a graph with "
+            f"{self.__graph.number_of_nodes()} nodes"
+        )
+        # each node owns its location, such that they do not alias each other
+        for attrs, location in zip(self.__graph.nodes.values(), locations):
+            attrs["location"] = location.copy()
+
+    def __dims(self):
+        return self.spec.roi.dims() if self.spec.roi is not None else 0
+
+    def affine_transform(self, matrix: np.ndarray, offset: np.ndarray = None):
+        """
+        Move all nodes with a single affine transformation, i.e., replace each
+        node location ``x`` with ``matrix @ x + offset``.
+
+        Args:
+
+            matrix (``np.ndarray``):
+
+                A ``(D, D)`` matrix to multiply each location with.
+
+            offset (``np.ndarray``, optional):
+
+                A ``D`` dimensional vector to add after the multiplication.
+        """
+        locations = self.locations @ np.asarray(matrix).T
+        if offset is not None:
+            locations += offset
+        self.locations = locations
+
     def num_vertices(self):
         return self.__graph.number_of_nodes()
 
@@ -349,6 +406,11 @@ class Graph(Freezable):
         Note there is a helper function `trim` that will remove B and replace it with
         a node at the intersection of the edge (A, B) and the bounding box of `roi`.
 
+        The cropped graph is built directly from the contained nodes and edges
+        instead of copying and pruning ``self``. Node and edge attribute
+        dictionaries and node locations are copied, other attribute values are
+        shared with ``self``.
+
         Args:
 
             roi (:class:`Roi`):
@@ -356,41 +418,81 @@ class Graph(Freezable):
                 ROI in world units to crop to.
         """
 
-        cropped = self.copy()
+        cropped, _, _ = self.__crop(roi)
+        cropped.spec.roi = roi
+        return cropped
 
-        contained_nodes = set([v.id for v in cropped.nodes if roi.contains(v.location)])
-        all_contained_edges = set(
-            [
-                e
-                for e in cropped.edges
-                if e.u in contained_nodes or e.v in contained_nodes
-            ]
+    def contained_nodes(self, roi: Roi) -> Set[int]:
+        """
+        Get the ids of all nodes contained in `roi`, using a single vectorized
+        bounds test over all node locations.
+        """
+
+        if self.__graph.number_of_nodes() == 0:
+            return set()
+
+        node_ids = self.node_ids
+        locations = self.locations
+
+        begin = np.array(
+            [-np.inf if b is None else b for b in roi.get_begin()], dtype=np.float64
         )
-        fully_contained_edges = set(
-            [
-                e
-                for e in all_contained_edges
-                if e.u in contained_nodes and e.v in contained_nodes
-            ]
+        end = np.array(
+            [np.inf if e is None else e for e in roi.get_end()], dtype=np.float64
         )
-        partially_contained_edges = all_contained_edges - fully_contained_edges
-        contained_edge_nodes = set(list(itertools.chain(*all_contained_edges)))
-        all_nodes = contained_edge_nodes | contained_nodes
-        dangling_nodes = all_nodes - contained_nodes
-
-        for node in list(cropped.nodes):
-            if node.id not in all_nodes:
-                cropped.remove_node(node)
-        for edge in list(cropped.edges):
-            if edge not in all_contained_edges:
-                cropped.remove_edge(edge)
+        contained = np.logical_and(locations >= begin, locations < end).all(axis=1)
 
-        cropped.spec.roi = roi
-        return cropped
+        return set(
+            node_id for node_id, inside in zip(node_ids, contained) if inside
+        )
+
+    def __crop(self, roi: Roi):
+        """
+        Create a new graph containing only the nodes contained in `roi`, the
+        edges with at least one contained end point, and the dangling nodes
+        of those edges.
+
+        Returns the new graph, the set of contained node ids, and the list of
+        edges crossing the boundary of `roi`.
+        """
+
+        contained_nodes = self.contained_nodes(roi)
+
+        contained_edges = []
+        crossing_edges = []
+        all_nodes = set(contained_nodes)
+        for (u, v), attrs in self.__graph.edges.items():
+            u_in = u in contained_nodes
+            v_in = v in contained_nodes
+            if u_in or v_in:
+                contained_edges.append((u, v, dict(attrs)))
+                if not (u_in and v_in):
+                    crossing_edges.append(Edge(u, v, attrs))
+                    all_nodes.add(v if u_in else u)
+
+        graph = self.__graph.__class__()
+        graph.add_nodes_from(
+            (node_id, self.__copy_node_attrs(attrs))
+            for node_id, attrs in self.__graph.nodes.items()
+            if node_id in all_nodes
+        )
+        graph.add_edges_from(contained_edges)
+
+        cropped = Graph([], [], self.spec.copy())
+        cropped.__graph = graph
+
+        return cropped, contained_nodes, crossing_edges
+
+    @staticmethod
+    def __copy_node_attrs(attrs):
+        copied = dict(attrs)
+        copied["location"] = np.array(attrs["location"])
+        return copied
 
     def shift(self, offset):
-        for node in self.nodes:
-            node.location += offset
+        if self.__graph.number_of_nodes() == 0:
+            return
+        self.locations = self.locations + np.asarray(offset)
 
     def new_graph(self):
         if self.directed():
@@ -407,32 +509,14 @@ class Graph(Freezable):
         contained, and thus B is kept as a "dangling" node.
         """
 
-        trimmed = self.copy()
+        trimmed, contained_nodes, crossing_edges = self.__crop(roi)
 
-        contained_nodes = set([v.id for v in trimmed.nodes if roi.contains(v.location)])
-        all_contained_edges = set(
-            [
-                e
-                for e in trimmed.edges
-                if e.u in contained_nodes or e.v in contained_nodes
-            ]
+        next_node = (
+            0 if self.__graph.number_of_nodes() == 0 else max(self.__graph.nodes) + 1
         )
-        fully_contained_edges = set(
-            [
-                e
-                for e in all_contained_edges
-                if e.u in contained_nodes and e.v in contained_nodes
-            ]
-        )
-        partially_contained_edges = all_contained_edges - fully_contained_edges
-        contained_edge_nodes = set(list(itertools.chain(*all_contained_edges)))
-        all_nodes = contained_edge_nodes | contained_nodes
-        dangling_nodes = all_nodes - contained_nodes
-
-        next_node = 0 if len(all_nodes) == 0 else max(all_nodes) + 1
 
         trimmed._handle_boundaries(
-            partially_contained_edges,
+            crossing_edges,
             contained_nodes,
             roi,
             node_id=itertools.count(next_node),
@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 from scipy.ndimage.morphology import distance_transform_edt
 
@@ -7,7 +9,8 @@ def enlarge_binary_map(
     radius,
     voxel_size,
     ring_fraction=None,
-    in_place=False):
+    in_place=False,
+    blockwise=True):
     '''Enlarge existing regions in a binary map.
 
     Args:
@@ -36,19 +39,41 @@ def enlarge_binary_map(
             If set to ``True``, argument ``binary_map`` will be modified
             directly.
 
+        blockwise (bool, optional):
+
+            If set (the default), foreground is enlarged only locally: for
+            very sparse maps (like rasterized points), by stamping cached
+            kernels (see :func:`create_ball_kernel`), otherwise with distance
+            transforms in blocks around foreground voxels (e.g., for
+            rasterized skeletons). The result is the same. For dense maps, a
+            single distance transform over the whole map is used in either
+            case.
+
     Returns:
 
         A matrix with 0s and 1s of same dimension as input binary_map with
         enlarged regions (indicated with 1), unless ``in_place`` is set.
     '''
 
-    if len(np.unique(binary_map)) == 1:
+    if binary_map.size == 0 or np.all(binary_map == binary_map.flat[0]):
         # Check whether there are regions at all. If there is no region (or
         # everything is full), return the same map.
         return binary_map
 
     if voxel_size is None:
-        voxel_size = (1,)*binary_map.shape[0]
+        voxel_size = (1,)*binary_map.ndim
+
+    enlarged = None
+    if blockwise:
+        enlarged = _enlarge_locally(binary_map, radius, voxel_size, ring_fraction)
+
+    if enlarged is not None:
+
+        if in_place:
+            binary_map[:] = enlarged
+            return None
+
+        return enlarged
 
     voxel_size = np.asarray(voxel_size).astype(np.float32)
 
@@ -77,19 +102,136 @@ def enlarge_binary_map(
     return binary_map
 
 
-def create_ball_kernel(radius, voxel_size):
+# rough costs of stamping a kernel (per kernel, and per kernel voxel) and
+# computing a distance transform (per voxel), relative to each other
+_STAMP_OVERHEAD = 500
+_STAMP_COST = 1
+_EDT_COST = 20
+
+
+def _enlarge_locally(binary_map, radius, voxel_size, ring_fraction):
+    '''Enlarge foreground only around foreground voxels, either by stamping
+    precomputed kernels or with blockwise distance transforms, whatever is
+    cheaper. Returns ``None`` if neither is cheaper than a distance transform
+    over the whole map.'''
+
+    radius, voxel_size = _kernel_key(radius, voxel_size)
+    kernel = _get_kernel(radius, voxel_size, 1.0, None)
+    foreground = np.nonzero(binary_map)
+    num_foreground = len(foreground[0])
+
+    num_kernels = 1 if ring_fraction is None else 2
+    stamp_cost = (
+        num_kernels*num_foreground*(_STAMP_OVERHEAD + _STAMP_COST*kernel.size))
+
+    # normalize, such that radius == 1 in all dimensions
+    sampling = np.array(voxel_size).astype(np.float32)/np.array(radius)
+    blocks = _get_foreground_blocks(binary_map.shape, foreground, sampling)
+    blocks_size = sum(
+        np.prod([s.stop - s.start for s in block])
+        for block in blocks)
+
+    edt_cost = _EDT_COST*min(blocks_size, binary_map.size)
+
+    if stamp_cost < edt_cost:
+
+        enlarged = np.zeros(binary_map.shape, dtype=bool)
+        for center in zip(*foreground):
+            stamp_kernel(enlarged, kernel, center)
+
+        if ring_fraction is not None:
+            inner_kernel = _get_kernel(radius, voxel_size, 1.0 - ring_fraction, None)
+            inner = np.zeros(binary_map.shape, dtype=bool)
+            for center in zip(*foreground):
+                stamp_kernel(inner, inner_kernel, center)
+            enlarged &= np.logical_not(inner)
+
+        return enlarged
+
+    if blocks_size < binary_map.size:
+        return _enlarge_blockwise(binary_map, blocks, sampling, ring_fraction)
+
+    return None
+
+
+def _get_foreground_blocks(shape, foreground, voxel_size):
+    '''Split an array of the given shape into blocks and get the ones that
+    contain ``foreground`` (as returned by ``np.nonzero``), each as a tuple of
+    slices grown by the (normalized) radius.'''
+
+    shape = np.array(shape)
+    context = np.ceil(1.0/voxel_size).astype(np.int64)
+
+    # large enough for the context not to dominate
+    block_size = np.maximum(16, 4*context)
+
+    block_indices = np.unique(
+        np.stack(foreground, axis=1)//block_size,
+        axis=0)
+
+    begins = np.maximum(block_indices*block_size - context, 0)
+    ends = np.minimum((block_indices + 1)*block_size + context, shape)
+
+    return [
+        tuple(slice(b, e) for b, e in zip(begin, end))
+        for begin, end in zip(begins, ends)
+    ]
+
+
+def _enlarge_blockwise(binary_map, blocks, voxel_size, ring_fraction):
+
+    # every foreground voxel influences only voxels within the grown block it
+    # is contained in, and the distance transform in a grown block is exact
+    # for those voxels up to the (normalized) radius of 1
+    foreground = binary_map != 0
+    enlarged = np.zeros(binary_map.shape, dtype=bool)
+    if ring_fraction is not None:
+        inner = np.zeros(binary_map.shape, dtype=bool)
+
+    for block in blocks:
+
+        background = np.logical_not(foreground[block])
+        if not background.any():
+            enlarged[block] = True
+            if ring_fraction is not None:
+                inner[block] = True
+            continue
+
+        edtmap = distance_transform_edt(background, sampling=voxel_size)
+
+        enlarged[block] |= edtmap <= 1.0
+        if ring_fraction is not None:
+            inner[block] |= edtmap <= 1.0 - ring_fraction
+
+    # a voxel is only part of a ring if it is not inside any other ring
+    if ring_fraction is not None:
+        enlarged &= np.logical_not(inner)
+
+    return enlarged
+
+
+def create_ball_kernel(radius, voxel_size, ring_fraction=None):
     '''Generates a ball-shaped structuring element.
 
+    Kernels are cached (see :func:`set_kernel_cache_size`), repeated calls
+    with the same arguments return the same read-only array.
+
     Args:
 
-        radius (``ndarray`` of ``float``):
+        radius (``float`` or ``ndarray`` of ``float``):
 
             The radius of the ball-shaped structuring element in world-units.
+            Can be given per dimension for anisotropic kernels.
 
         voxel_size (tuple, list or numpy array):
 
             Indicates the physical voxel size of the structuring element.
 
+        ring_fraction (``float``, optional):
+
+            If set, create a ring (a hollow ball) instead, as in
+            :func:`enlarge_binary_map`.
+
     Returns:
 
         The structuring element where elements of the neighborhood are 1 and 0
@@ -97,16 +239,130 @@ def create_ball_kernel(radius, voxel_size):
         voxel_size. For instance voxel_size = [2, 1, 1], radius = 5 produces an
         array of shape (7, 11, 11)
     '''
-    voxel_size = np.asarray(voxel_size)
+
+    radius, voxel_size = _kernel_key(radius, voxel_size)
+
+    if ring_fraction is None:
+        return _get_kernel(radius, voxel_size, 1.0, None)
+    return _get_kernel(radius, voxel_size, 1.0, 1.0 - ring_fraction)
+
+
+def stamp_kernel(array, kernel, center, mask=None, label=None):
+    '''Stamp a binary kernel into an array, i.e., set all elements of
+    ``array`` that are covered by non-zero elements of ``kernel`` to 1. Parts
+    of the kernel outside of the array are ignored.
+
+    Args:
+
+        array (numpy array):
+
+            The array to stamp into, modified in place.
+
+        kernel (numpy array):
+
+            The kernel to stamp, with an odd shape.
+
+        center (tuple of ``int``):
+
+            Where to center the kernel in ``array``, in voxels.
+
+        mask (numpy array, optional):
+
+            If given, only stamp where ``mask`` is non-zero, or equal to
+            ``label`` if ``label`` is given. Has to have the same shape as
+            ``array``.
+
+        label (``int``, optional):
+
+            See ``mask``.
+    '''
+
+    begin = np.asarray(center) - np.array(kernel.shape)//2
+    end = begin + np.array(kernel.shape)
+    array_begin = np.maximum(begin, 0)
+    array_end = np.minimum(end, array.shape)
+
+    if np.any(array_end <= array_begin):
+        return
+
+    array_slices = tuple(
+        slice(b, e)
+        for b, e in zip(array_begin, array_end))
+    kernel_slices = tuple(
+        slice(b - o, e - o)
+        for b, e, o in zip(array_begin, array_end, begin))
+
+    stamp = kernel[kernel_slices]
+    if mask is not None:
+        if label is None:
+            stamp = np.logical_and(stamp, mask[array_slices])
+        else:
+            stamp = np.logical_and(stamp, mask[array_slices] == label)
+
+    target = array[array_slices]
+    np.logical_or(target, stamp, out=target)
+
+
+def set_kernel_cache_size(size):
+    '''Set the number of kernels to keep in the cache of
+    :func:`create_ball_kernel` (and the stamping in
+    :func:`enlarge_binary_map`). The least recently used kernels are evicted
+    first. This also clears the cache.'''
+
+    global _get_kernel
+    _get_kernel = functools.lru_cache(maxsize=size)(_create_kernel)
+
+
+def clear_kernel_cache():
+    '''Remove all cached kernels.'''
+
+    _get_kernel.cache_clear()
+
+
+def kernel_cache_info():
+    '''Get hits, misses, maximal and current size of the kernel cache, as
+    returned by ``functools.lru_cache``.'''
+
+    return _get_kernel.cache_info()
+
+
+def _kernel_key(radius, voxel_size):
+    '''Convert radius and voxel size to hashable tuples of the same
+    length.'''
+
+    voxel_size = tuple(float(v) for v in np.asarray(voxel_size).flatten())
+    radius = np.broadcast_to(
+        np.asarray(radius, dtype=np.float64).flatten(),
+        (len(voxel_size),))
+    return tuple(float(r) for r in radius), voxel_size
+
+
+def _create_kernel(radius, voxel_size, max_distance, min_distance):
+    '''Create a read-only kernel with 1 for all voxels with a distance to the
+    center (normalized by radius) in (min_distance, max_distance].'''
+
+    radius = np.array(radius)
+    voxel_size = np.array(voxel_size)
 
     # Calculate shape for new kernel, make it sufficiently large (--> ceil)
-    radius_voxel = np.ceil(radius/voxel_size).astype(np.int)
-    kernel_shape = np.array(radius_voxel)*2 + 1
+    radius_voxel = np.ceil(radius/voxel_size).astype(int)
+    kernel_shape = radius_voxel*2 + 1
+
+    background = np.ones(kernel_shape, dtype=bool)
+    background[tuple(kernel_shape//2)] = False
+
+    # the same normalization as in enlarge_binary_map
+    sampling = voxel_size.astype(np.float32)/radius
+    edtmap = distance_transform_edt(background, sampling=sampling)
 
-    kernel = np.zeros(kernel_shape, dtype=np.uint8)
-    middle_point = kernel_shape//2
-    kernel[tuple(middle_point)] = 1
+    kernel = edtmap <= max_distance
+    if min_distance is not None:
+        kernel &= edtmap > min_distance
 
-    enlarge_binary_map(kernel, radius, voxel_size, in_place=True)
+    kernel = kernel.astype(np.uint8)
+    kernel.flags.writeable = False
 
     return kernel
+
+
+_get_kernel = functools.lru_cache(maxsize=128)(_create_kernel)
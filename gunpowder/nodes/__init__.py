@@ -12,6 +12,9 @@ from .downsample import DownSample
 from .dvid_source import DvidSource
 from .elastic_augment import ElasticAugment
 from .exclude_labels import ExcludeLabels
+from .export_metrics import ExportMetrics
+from .graph_source import GraphSource
+from .graph_write import GraphWrite
 from .grow_boundary import GrowBoundary
 from .hdf5_source import Hdf5Source
 from .hdf5_write import Hdf5Write
@@ -36,6 +39,7 @@ from .snapshot import Snapshot
 from .specified_location import SpecifiedLocation
 from .squeeze import Squeeze
 from .stack import Stack
+from .trace_profiling_stats import TraceProfilingStats
 from .unsqueeze import Unsqueeze
 from .upsample import UpSample
 from .zarr_source import ZarrSource
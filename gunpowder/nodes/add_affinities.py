@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import numpy as np
 
@@ -10,59 +11,135 @@ from gunpowder.coordinate import Coordinate
 logger = logging.getLogger(__name__)
 
 
-def seg_to_affgraph(seg, nhood):
+def seg_to_affgraph(
+        seg,
+        nhood,
+        dtype=np.int32,
+        crop=None,
+        labels_mask=None,
+        unlabelled=None,
+        affinities_mask=False,
+        num_workers=1):
+    '''Construct an affinity graph from an n-dimensional segmentation.
 
-    nhood = np.array(nhood)
+    The affinity for voxel ``p`` and offset ``o`` is 1 iff ``seg[p] ==
+    seg[p + o]`` and both labels are non-zero. Affinities to neighbors outside
+    of ``seg`` are 0.
 
-    # constructs an affinity graph from a segmentation
-    # assume affinity graph is represented as:
-    # shape = (e, z, y, x)
-    # nhood.shape = (edges, 3)
-    shape = seg.shape
-    nEdge = nhood.shape[0]
-    dims = nhood.shape[1]
-    aff = np.zeros((nEdge,) + shape, dtype=np.int32)
-
-    if dims == 2:
-
-        for e in range(nEdge):
-            aff[e, \
-                max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1])] = \
-                            (seg[max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1])] == \
-                             seg[max(0,nhood[e,0]):min(shape[0],shape[0]+nhood[e,0]), \
-                                max(0,nhood[e,1]):min(shape[1],shape[1]+nhood[e,1])] ) \
-                            * ( seg[max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1])] > 0 ) \
-                            * ( seg[max(0,nhood[e,0]):min(shape[0],shape[0]+nhood[e,0]), \
-                                max(0,nhood[e,1]):min(shape[1],shape[1]+nhood[e,1])] > 0 )
-
-    elif dims == 3:
-
-        for e in range(nEdge):
-            aff[e, \
-                max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1]), \
-                max(0,-nhood[e,2]):min(shape[2],shape[2]-nhood[e,2])] = \
-                            (seg[max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1]), \
-                                max(0,-nhood[e,2]):min(shape[2],shape[2]-nhood[e,2])] == \
-                             seg[max(0,nhood[e,0]):min(shape[0],shape[0]+nhood[e,0]), \
-                                max(0,nhood[e,1]):min(shape[1],shape[1]+nhood[e,1]), \
-                                max(0,nhood[e,2]):min(shape[2],shape[2]+nhood[e,2])] ) \
-                            * ( seg[max(0,-nhood[e,0]):min(shape[0],shape[0]-nhood[e,0]), \
-                                max(0,-nhood[e,1]):min(shape[1],shape[1]-nhood[e,1]), \
-                                max(0,-nhood[e,2]):min(shape[2],shape[2]-nhood[e,2])] > 0 ) \
-                            * ( seg[max(0,nhood[e,0]):min(shape[0],shape[0]+nhood[e,0]), \
-                                max(0,nhood[e,1]):min(shape[1],shape[1]+nhood[e,1]), \
-                                max(0,nhood[e,2]):min(shape[2],shape[2]+nhood[e,2])] > 0 )
+    Args:
 
-    else:
+        seg (``ndarray``):
+
+            The segmentation. It is not cast to another type.
+
+        nhood (array-like of shape ``(e, dims)``):
+
+            The offsets to compute affinities for.
+
+        dtype (``dtype``, optional):
+
+            The type of the returned affinities (and mask), written to
+            directly.
+
+        crop (``tuple`` of ``slice``, optional):
+
+            Compute affinities only for the voxels of ``seg`` in this region.
+            Neighbors are still looked up in all of ``seg``.
+
+        labels_mask (``ndarray``, optional):
 
-        raise RuntimeError(
-            f"AddAffinities works only in 2 or 3 dimensions, not {dims}")
+            A mask for ``seg``. Affinities connecting at least one masked out
+            voxel are masked out in the affinities mask.
 
+        unlabelled (``ndarray``, optional):
+
+            A binary array with 0 for unlabelled voxels. Affinities between
+            unlabelled voxels are masked out in the affinities mask.
+
+        affinities_mask (``bool``, optional):
+
+            If set, also compute the affinities mask (in the same pass) and
+            return it as second value.
+
+        num_workers (``int``, optional):
+
+            Number of threads to compute the offsets in parallel.
+
+    Returns:
+
+        The affinities of shape ``(e,) + shape``, where ``shape`` is the shape
+        of ``crop`` (or ``seg``), and the affinities mask, if requested.
+    '''
+
+    nhood = np.array(nhood)
+    assert nhood.ndim == 2 and nhood.shape[1] == seg.ndim, (
+        "neighborhood of shape %s does not match %d-dimensional "
+        "segmentation" % (nhood.shape, seg.ndim))
+
+    if crop is None:
+        crop = tuple(slice(0, s) for s in seg.shape)
+    begin = [c.start for c in crop]
+    shape = tuple(c.stop - c.start for c in crop)
+
+    aff = np.zeros((len(nhood),) + shape, dtype=dtype)
+    if affinities_mask:
+        if labels_mask is None:
+            mask = np.ones((len(nhood),) + shape, dtype=dtype)
+        else:
+            mask = np.zeros((len(nhood),) + shape, dtype=dtype)
+    else:
+        mask = None
+
+    # computed once and shared by all offsets: since affinities require equal
+    # labels, it is enough to test the source voxel for foreground
+    foreground = seg > 0
+    if labels_mask is not None:
+        labels_foreground = labels_mask > 0
+    if unlabelled is not None:
+        unlabelled = unlabelled == 0
+
+    def compute_offset(e):
+
+        # the part of the output for which both voxel and neighbor are in seg,
+        # and the corresponding slices into seg for voxel and neighbor
+        out = []
+        src = []
+        dst = []
+        for b, s, n, o in zip(begin, shape, seg.shape, nhood[e]):
+            lower = max(0, -b - o)
+            upper = min(s, n - b - o)
+            if upper <= lower:
+                return
+            out.append(slice(lower, upper))
+            src.append(slice(b + lower, b + upper))
+            dst.append(slice(b + lower + o, b + upper + o))
+        out = (e,) + tuple(out)
+        src = tuple(src)
+        dst = tuple(dst)
+
+        np.equal(seg[src], seg[dst], out=aff[out])
+        np.multiply(aff[out], foreground[src], out=aff[out])
+
+        if mask is None:
+            return
+
+        if labels_mask is not None:
+            np.equal(labels_mask[src], labels_mask[dst], out=mask[out])
+            np.multiply(mask[out], labels_foreground[src], out=mask[out])
+
+        if unlabelled is not None:
+            both_unlabelled = np.logical_and(unlabelled[src], unlabelled[dst])
+            np.multiply(mask[out], ~both_unlabelled, out=mask[out])
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(compute_offset, range(len(nhood))))
+    else:
+        for e in range(len(nhood)):
+            compute_offset(e)
+
+    if affinities_mask:
+        return aff, mask
     return aff
 
 
@@ -105,6 +182,17 @@ class AddAffinities(BatchFilter):
 
             The array to generate containing the affinitiy mask, as derived
             from parameter ``labels_mask``.
+
+        dtype (``dtype``, optional):
+
+            The dtype of the affinities and affinities mask. Defaults to
+            ``uint8``.
+
+        num_workers (``int``, optional):
+
+            Number of threads to compute the affinities with, each processing
+            a subset of the neighborhood. Useful for long-range neighborhoods
+            on large arrays.
     '''
 
     def __init__(
@@ -115,7 +203,8 @@ class AddAffinities(BatchFilter):
             labels_mask=None,
             unlabelled=None,
             affinities_mask=None,
-            dtype=np.uint8):
+            dtype=np.uint8,
+            num_workers=1):
 
         self.affinity_neighborhood = np.array(affinity_neighborhood)
         self.labels = labels
@@ -124,6 +213,7 @@ class AddAffinities(BatchFilter):
         self.affinities = affinities
         self.affinities_mask = affinities_mask
         self.dtype = dtype
+        self.num_workers = num_workers
 
     def setup(self):
 
@@ -199,58 +289,41 @@ class AddAffinities(BatchFilter):
 
         affinities_roi = request[self.affinities].roi
 
-        logger.debug("computing ground-truth affinities from labels")
-
-        affinities = seg_to_affgraph(
-            batch.arrays[self.labels].data.astype(np.int32),
-            self.affinity_neighborhood
-        ).astype(self.dtype)
-
-        # crop affinities to requested ROI
+        # the requested ROI in voxels, relative to the labels
         offset = affinities_roi.get_offset()
         shift = -offset - self.padding_neg
         crop_roi = affinities_roi.shift(shift)
         crop_roi /= self.spec[self.labels].voxel_size
         crop = crop_roi.get_bounding_box()
 
-        logger.debug("cropping with " + str(crop))
-        affinities = affinities[(slice(None),)+crop]
+        compute_mask = bool(
+            self.affinities_mask and self.affinities_mask in request)
+
+        logger.debug("computing ground-truth affinities from labels in %s", crop)
+
+        affinities = seg_to_affgraph(
+            batch.arrays[self.labels].data,
+            self.affinity_neighborhood,
+            dtype=self.dtype,
+            crop=crop,
+            labels_mask=(
+                batch.arrays[self.labels_mask].data
+                if compute_mask and self.labels_mask else None),
+            unlabelled=(
+                batch.arrays[self.unlabelled].data
+                if compute_mask and self.unlabelled else None),
+            affinities_mask=compute_mask,
+            num_workers=self.num_workers)
+
+        if compute_mask:
+            affinities, affinities_mask = affinities
 
         spec = self.spec[self.affinities].copy()
         spec.roi = affinities_roi
         outputs.arrays[self.affinities] = Array(affinities, spec)
 
-        if self.affinities_mask and self.affinities_mask in request:
-
-            if self.labels_mask:
-
-                logger.debug("computing ground-truth affinities mask from "
-                             "labels mask")
-                affinities_mask = seg_to_affgraph(
-                    batch.arrays[self.labels_mask].data.astype(np.int32),
-                    self.affinity_neighborhood)
-                affinities_mask = affinities_mask[(slice(None),)+crop]
-
-            else:
-
-                affinities_mask = np.ones_like(affinities)
-
-            if self.unlabelled:
-
-                # 1 for all affinities between unlabelled voxels
-                unlabelled = (1 - batch.arrays[self.unlabelled].data)
-                unlabelled_mask = seg_to_affgraph(
-                    unlabelled.astype(np.int32),
-                    self.affinity_neighborhood)
-                unlabelled_mask = unlabelled_mask[(slice(None),)+crop]
-
-                # 0 for all affinities between unlabelled voxels
-                unlabelled_mask = (1 - unlabelled_mask)
-
-                # combine with mask
-                affinities_mask = affinities_mask*unlabelled_mask
+        if compute_mask:
 
-            affinities_mask = affinities_mask.astype(affinities.dtype)
             outputs.arrays[self.affinities_mask] = Array(affinities_mask, spec)
 
         else:
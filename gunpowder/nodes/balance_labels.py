@@ -2,7 +2,6 @@ from .batch_filter import BatchFilter
 from gunpowder.array import Array
 from gunpowder.batch_request import BatchRequest
 from collections.abc import Iterable
-import itertools
 import logging
 import numpy as np
 
@@ -107,11 +106,10 @@ class BalanceLabels(BatchFilter):
 
         labels = batch.arrays[self.labels]
 
-        assert len(np.unique(labels.data)) <= self.num_classes, (
-            "Found more unique labels than classes in %s."%self.labels)
-        assert 0 <= np.min(labels.data) < self.num_classes, (
-            "Labels %s are not in [0, num_classes)."%self.labels)
-        assert 0 <= np.max(labels.data) < self.num_classes, (
+        if not np.issubdtype(labels.data.dtype, np.integer):
+            assert len(np.unique(labels.data)) <= self.num_classes, (
+                "Found more unique labels than classes in %s."%self.labels)
+        assert 0 <= labels.data.min() and labels.data.max() < self.num_classes, (
             "Labels %s are not in [0, num_classes)."%self.labels)
 
         # initialize error scale with 1s
@@ -136,37 +134,60 @@ class BalanceLabels(BatchFilter):
                 m if s == -1 else s
                 for m, s in zip(error_scale.shape, self.slab))
 
-        slab_ranges = (
-            range(0, m, s)
-            for m, s in zip(error_scale.shape, slab))
-
-        for start in itertools.product(*slab_ranges):
-            slices = tuple(
-                slice(start[d], start[d] + slab[d])
-                for d in range(len(slab)))
-            self.__balance(
-                labels.data[slices],
-                error_scale[slices])
+        self.__balance(labels.data, error_scale, slab)
 
         spec = self.spec[self.scales].copy()
         spec.roi = labels.spec.roi
         batch.arrays[self.scales] = Array(error_scale, spec)
 
-    def __balance(self, labels, scale):
-
-        labels = labels.astype(np.int64)
-
-        # in the masked-in area, compute the fraction of per-class samples
-        masked_in = scale.sum()
-        classes, counts = np.unique(labels[np.nonzero(scale)], return_counts=True)
-        fracs = counts.astype(float) / masked_in if masked_in > 0 else np.zeros(counts.size)
+    def __balance(self, labels, scale, slab):
+
+        # the index of the slab each voxel belongs to
+        slab_index = np.zeros((1,)*scale.ndim, dtype=np.int64)
+        num_slabs = 1
+        for d, (m, s) in enumerate(zip(scale.shape, slab)):
+            shape = [1]*scale.ndim
+            shape[d] = m
+            index = (np.arange(m, dtype=np.int64)//s).reshape(shape)
+            slab_index = slab_index*((m - 1)//s + 1) + index
+            num_slabs *= (m - 1)//s + 1
+
+        # a combined (slab, class) index to count all slabs and classes at
+        # once
+        num_keys = num_slabs*self.num_classes
+        keys = np.empty(scale.shape, dtype=np.int64)
+        np.multiply(slab_index, self.num_classes, out=keys)
+        np.add(keys, labels, out=keys, casting='unsafe')
+
+        # in the masked-in area of each slab, compute the fraction of per-class
+        # samples
+        masked_in = np.bincount(
+            keys.ravel(),
+            weights=scale.ravel(),
+            minlength=num_keys).reshape(
+                num_slabs,
+                self.num_classes).sum(axis=1)
+        # count masked-out samples in an extra key
+        np.putmask(keys, scale == 0, num_keys)
+        counts = np.bincount(
+            keys.ravel(),
+            minlength=num_keys + 1)[:num_keys].reshape(
+                num_slabs,
+                self.num_classes)
+        fracs = np.zeros(counts.shape)
+        np.divide(
+            counts,
+            masked_in[:, None],
+            out=fracs,
+            where=masked_in[:, None] > 0)
         if self.clipmin is not None or self.clipmax is not None:
             np.clip(fracs, self.clipmin, self.clipmax, fracs)
 
-        # compute the class weights
-        w_sparse = 1.0 / float(self.num_classes) / fracs
-        w = np.zeros(self.num_classes)
-        w[classes] = w_sparse
+        # compute the class weights, classes without samples get 0
+        w = np.zeros(num_keys + 1)
+        present = counts.ravel() > 0
+        w[:num_keys][present] = (
+            1.0 / float(self.num_classes) / fracs.ravel()[present])
 
         # scale the masked-in scale with the class weights
-        scale *= np.take(w, labels)
+        scale *= np.take(w, keys)
@@ -179,9 +179,14 @@ class BatchFilter(BatchProvider):
             else:
                 node_batch = batch
             downstream_request.remove_placeholders()
+            input_data = {
+                key: array.data for key, array in node_batch.arrays.items()
+            }
             processed_batch = self.process(node_batch, downstream_request)
             if processed_batch is None:
                 processed_batch = node_batch
+            timing_process.add_array_bytes(
+                self.__added_array_bytes(input_data, processed_batch))
             batch = batch.merge(processed_batch, merge_profiling_stats=False).crop(
                 downstream_request
             )
@@ -193,6 +198,16 @@ class BatchFilter(BatchProvider):
 
         return batch
 
+    def __added_array_bytes(self, input_data, batch):
+        """Get the number of bytes of arrays in ``batch`` that are not in
+        ``input_data``."""
+
+        return sum(
+            array.data.nbytes
+            for key, array in batch.arrays.items()
+            if key not in input_data or array.data is not input_data[key]
+        )
+
     def __can_skip(self, request):
         """Check if this filter needs to be run for the given request."""
 
@@ -63,6 +63,21 @@ class BatchProvider(object):
             return True
         return self._remove_placeholders
 
+    @property
+    def consistency_checks(self):
+        if not hasattr(self, '_consistency_checks'):
+            return True
+        return self._consistency_checks
+
+    def enable_consistency_checks(self, enable=True):
+        '''Enable or disable the check of each batch provided by this node
+        against the request it answers. Enabled by default.
+
+        This is usually not called directly, but set for all nodes of a
+        pipeline via the ``consistency_checks`` argument of :class:`build`.
+        '''
+        self._consistency_checks = enable
+
     def setup(self):
         '''To be implemented in subclasses.
 
@@ -188,7 +203,8 @@ class BatchProvider(object):
 
             request.remove_placeholders()
 
-            self.check_batch_consistency(batch, request)
+            if self.consistency_checks:
+                self.check_batch_consistency(batch, request)
 
             self.remove_unneeded(batch, request)
 
@@ -311,15 +327,18 @@ class BatchProvider(object):
                     f"{self.name()} should provide directed={request_spec.directed}"
                 )
 
-            for node in graph.nodes:
-                contained = graph.spec.roi.contains(node.location)
-                dangling = not contained and all(
+            contained_nodes = graph.contained_nodes(graph.spec.roi)
+            for node_id in graph.node_ids:
+                if node_id in contained_nodes:
+                    continue
+                node = graph.node(node_id)
+                dangling = all(
                     [
-                        graph.spec.roi.contains(v.location)
+                        v.id in contained_nodes
                         for v in graph.neighbors(node)
                     ]
                 )
-                assert contained or dangling, (
+                assert dangling, (
                     f"graph {graph_key} provided by {self.name()} with ROI {graph.spec.roi} "
                     f"contain point at {node.location} which is neither contained nor "
                     f"'dangling'"
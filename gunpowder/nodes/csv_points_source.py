@@ -1,5 +1,8 @@
-import numpy as np
+import json
 import logging
+import os
+
+import numpy as np
 from gunpowder.batch import Batch
 from gunpowder.coordinate import Coordinate
 from gunpowder.nodes.batch_provider import BatchProvider
@@ -46,10 +49,19 @@ class CsvPointsSource(BatchProvider):
 
             Each line may optionally contain an id for each point. This parameter
             specifies its location, has to come after the position values.
+
+        use_index (``bool``, optional):
+
+            If set, the points are sorted into a regular grid of buckets and
+            stored in a binary index next to the CSV file (in a directory
+            ``<filename>.index``). Subsequent runs memory-map the index instead
+            of parsing the CSV file, and requests only read the buckets that
+            intersect the requested ROI. The index is rebuilt whenever the CSV
+            file changes. Requires a positive ``scale``, if given.
     '''
 
     def __init__(self, filename, points, points_spec=None, scale=None,
-                 ndims=None, id_dim=None):
+                 ndims=None, id_dim=None, use_index=False):
 
         self.filename = filename
         self.points = points
@@ -57,19 +69,30 @@ class CsvPointsSource(BatchProvider):
         self.scale = scale
         self.ndims = ndims
         self.id_dim = id_dim
+        self.use_index = use_index
         self.data = None
+        self.index = None
 
     def setup(self):
 
-        self._parse_csv()
+        if self.use_index:
+            self.index = CsvPointsIndex(self.filename, self.ndims, self.scale)
+            self.ndims = self.index.ndims
+        else:
+            self._parse_csv()
 
         if self.points_spec is not None:
 
             self.provides(self.points, self.points_spec)
             return
 
-        min_bb = Coordinate(np.floor(np.amin(self.data[:,:self.ndims], 0)))
-        max_bb = Coordinate(np.ceil(np.amax(self.data[:,:self.ndims], 0)) + 1)
+        if self.index is not None:
+            min_bb, max_bb = self.index.bounding_box()
+        else:
+            min_bb = np.amin(self.data[:,:self.ndims], 0)
+            max_bb = np.amax(self.data[:,:self.ndims], 0)
+        min_bb = Coordinate(np.floor(min_bb))
+        max_bb = Coordinate(np.ceil(max_bb) + 1)
 
         roi = Roi(min_bb, max_bb - min_bb)
 
@@ -87,12 +110,14 @@ class CsvPointsSource(BatchProvider):
             "CSV points source got request for %s",
             request[self.points].roi)
 
-        point_filter = np.ones((self.data.shape[0],), dtype=np.bool)
-        for d in range(self.ndims):
-            point_filter = np.logical_and(point_filter, self.data[:,d] >= min_bb[d])
-            point_filter = np.logical_and(point_filter, self.data[:,d] < max_bb[d])
-
-        points_data = self._get_points(point_filter)
+        if self.index is not None:
+            points_data = self._get_indexed_points(min_bb, max_bb)
+        else:
+            point_filter = np.ones((self.data.shape[0],), dtype=bool)
+            for d in range(self.ndims):
+                point_filter = np.logical_and(point_filter, self.data[:,d] >= min_bb[d])
+                point_filter = np.logical_and(point_filter, self.data[:,d] < max_bb[d])
+            points_data = self._get_points(point_filter)
         points_spec = GraphSpec(roi=request[self.points].roi.copy())
 
         batch = Batch()
@@ -117,6 +142,20 @@ class CsvPointsSource(BatchProvider):
             for i, p in zip(ids, filtered)
         ]
 
+    def _get_indexed_points(self, min_bb, max_bb):
+
+        rows, row_ids = self.index.query(min_bb, max_bb)
+
+        if self.id_dim is not None:
+            ids = rows[:,self.id_dim]
+        else:
+            ids = row_ids
+
+        return [
+            Node(id=i, location=p)
+            for i, p in zip(ids, rows[:,:self.ndims])
+        ]
+
     def _parse_csv(self):
         '''Read one point per line. If ``ndims`` is None, all values in one line
         are considered as the location of the point. If positive, only the
@@ -124,14 +163,255 @@ class CsvPointsSource(BatchProvider):
         used.
         '''
 
-        with open(self.filename, "r") as f:
-            self.data = np.array(
-                [[float(t.strip(",")) for t in line.split()] for line in f],
-                dtype=np.float32,
-            )
+        self.data = _read_csv(self.filename)
 
         if self.ndims is None:
             self.ndims = self.data.shape[1]
 
         if self.scale is not None:
             self.data[:,:self.ndims] *= self.scale
+
+
+def _read_csv(filename):
+
+    with open(filename, "r") as f:
+        return np.array(
+            [[float(t.strip(",")) for t in line.split()] for line in f],
+            dtype=np.float32,
+        )
+
+
+class CsvPointsIndex:
+    '''A grid-bucket index of the points in a CSV file, see
+    :class:`CsvPointsSource`.
+
+    The rows of the CSV file are sorted by the grid cell their location falls
+    into, such that the points of each cell are stored contiguously. The
+    sorted rows, their original row numbers, and the offset of each cell are
+    stored as ``.npy`` files in ``<filename>.index`` and memory-mapped on
+    later runs.
+
+    Args:
+
+        filename (``string``):
+
+            The CSV file to index.
+
+        ndims (``int``):
+
+            Which columns hold the location, as in :class:`CsvPointsSource`.
+
+        scale (scalar or array-like):
+
+            The scale to apply to the locations. The index itself is stored in
+            the (unscaled) coordinates of the CSV file.
+
+        points_per_cell (``int``, optional):
+
+            The average number of points per grid cell to aim for when
+            building the index.
+    '''
+
+    version = 1
+
+    def __init__(self, filename, ndims=None, scale=None, points_per_cell=64):
+
+        self.filename = filename
+        self.index_dir = filename + '.index'
+        self.points_per_cell = points_per_cell
+
+        if scale is not None:
+            scale = np.asarray(scale, dtype=np.float64)
+            assert np.all(scale > 0), (
+                "An indexed CSV points source needs a positive scale, got "
+                "%s"%scale)
+        self.scale = scale
+
+        if not self.__load(ndims):
+            self.__build(ndims)
+
+        self.ndims = self.meta['ndims']
+        self.origin = np.array(self.meta['origin'])
+        self.cell_size = np.array(self.meta['cell_size'])
+        self.grid_shape = np.array(self.meta['grid_shape'], dtype=np.int64)
+
+    def bounding_box(self):
+        '''Get the minimal and maximal (scaled) location of all points.'''
+
+        min_bb = np.array(self.meta['min'])
+        max_bb = np.array(self.meta['max'])
+        if self.scale is not None:
+            min_bb = min_bb*self.scale
+            max_bb = max_bb*self.scale
+        return min_bb, max_bb
+
+    def query(self, min_bb, max_bb):
+        '''Get the (scaled) rows and row numbers of all points in
+        ``[min_bb, max_bb)``, in the order they appear in the CSV file.'''
+
+        dims = len(self.grid_shape)
+        num_columns = self.points.shape[1]
+
+        lower = np.array(
+            [-np.inf if b is None else b for b in min_bb], dtype=np.float64)
+        upper = np.array(
+            [np.inf if e is None else e for e in max_bb], dtype=np.float64)
+
+        raw_lower, raw_upper = lower, upper
+        if self.scale is not None:
+            raw_lower = lower/self.scale
+            raw_upper = upper/self.scale
+
+        if (
+                np.any(raw_upper < self.origin) or
+                np.any(raw_lower > np.array(self.meta['max']))):
+            return (
+                np.zeros((0, num_columns), dtype=np.float32),
+                np.zeros((0,), dtype=np.int64))
+
+        # the range of cells (inclusive) intersecting the ROI
+        cell_begin = np.floor((raw_lower - self.origin)/self.cell_size)
+        cell_end = np.floor((raw_upper - self.origin)/self.cell_size)
+        cell_begin = np.clip(cell_begin, 0, self.grid_shape - 1).astype(np.int64)
+        cell_end = np.clip(cell_end, 0, self.grid_shape - 1).astype(np.int64)
+
+        # the cells are stored in C order, i.e., every row of cells along the
+        # last dimension is a contiguous range of points
+        first_cells = np.zeros((1,), dtype=np.int64)
+        for d in range(dims - 1):
+            first_cells = (
+                first_cells[:, None]*self.grid_shape[d] +
+                np.arange(cell_begin[d], cell_end[d] + 1)[None, :]).ravel()
+        first_cells = first_cells*self.grid_shape[-1] + cell_begin[-1]
+        last_cells = first_cells + cell_end[-1] - cell_begin[-1]
+
+        begins = self.offsets[first_cells]
+        ends = self.offsets[last_cells + 1]
+
+        # merge adjacent ranges
+        keep = np.ones(len(begins), dtype=bool)
+        keep[1:] = begins[1:] != ends[:-1]
+        begins = begins[keep]
+        ends = ends[np.append(keep[1:], True)]
+
+        rows = np.concatenate(
+            [self.points[b:e] for b, e in zip(begins, ends)] +
+            [np.zeros((0, num_columns), dtype=np.float32)])
+        row_ids = np.concatenate(
+            [self.row_ids[b:e] for b, e in zip(begins, ends)] +
+            [np.zeros((0,), dtype=np.int64)])
+
+        if self.scale is not None:
+            rows[:,:self.ndims] *= self.scale.astype(np.float32)
+
+        # restrict to points inside the ROI
+        locations = rows[:,:self.ndims]
+        inside = np.logical_and(
+            np.all(locations >= lower, axis=1),
+            np.all(locations < upper, axis=1))
+        rows = rows[inside]
+        row_ids = row_ids[inside]
+
+        order = np.argsort(row_ids, kind='stable')
+        return rows[order], row_ids[order]
+
+    def __csv_stat(self):
+
+        stat = os.stat(self.filename)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def __load(self, ndims):
+
+        meta_file = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.isfile(meta_file):
+            return False
+
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+
+        if (
+                meta.get('version') != self.version or
+                meta.get('csv') != self.__csv_stat() or
+                (ndims is not None and meta.get('ndims') != ndims)):
+            logger.info("CSV index %s is outdated", self.index_dir)
+            return False
+
+        logger.debug("Reading CSV index %s", self.index_dir)
+
+        self.meta = meta
+        self.points = np.load(
+            os.path.join(self.index_dir, 'points.npy'), mmap_mode='r')
+        self.row_ids = np.load(
+            os.path.join(self.index_dir, 'row_ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(self.index_dir, 'offsets.npy'))
+
+        return True
+
+    def __build(self, ndims):
+
+        logger.info("Building CSV index for %s", self.filename)
+
+        csv_stat = self.__csv_stat()
+        data = _read_csv(self.filename)
+        if ndims is None:
+            ndims = data.shape[1]
+
+        locations = data[:,:ndims]
+        dims = locations.shape[1]
+        if len(data) > 0:
+            min_bb = np.amin(locations, axis=0).astype(np.float64)
+            max_bb = np.amax(locations, axis=0).astype(np.float64)
+        else:
+            min_bb = np.zeros((dims,))
+            max_bb = np.zeros((dims,))
+
+        # cubic cells with about points_per_cell points on average (if the
+        # points were uniformly distributed), where dimensions thinner than a
+        # cell (e.g., of a flat point cloud) get a single cell
+        extent = max_bb - min_bb
+        num_cells = max(1, len(data)//self.points_per_cell)
+        spanned = extent > 0
+        cell_size = 1.0
+        while np.any(spanned):
+            cell_size = (
+                np.prod(extent[spanned])/num_cells)**(1.0/np.sum(spanned))
+            thin = np.logical_and(spanned, extent < cell_size)
+            if not np.any(thin):
+                break
+            spanned = np.logical_and(spanned, np.logical_not(thin))
+        cell_size = np.full((dims,), cell_size)
+        grid_shape = np.floor(extent/cell_size).astype(np.int64) + 1
+
+        cells = np.floor((locations - min_bb)/cell_size).astype(np.int64)
+        cells = np.minimum(cells, grid_shape - 1)
+        cell_ids = np.ravel_multi_index(tuple(cells.T), tuple(grid_shape))
+
+        order = np.argsort(cell_ids, kind='stable')
+        counts = np.bincount(cell_ids, minlength=np.prod(grid_shape))
+
+        self.points = data[order]
+        self.row_ids = order.astype(np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.meta = {
+            'version': self.version,
+            'csv': csv_stat,
+            'ndims': ndims,
+            'origin': min_bb.tolist(),
+            'cell_size': cell_size.tolist(),
+            'grid_shape': grid_shape.tolist(),
+            'min': min_bb.tolist(),
+            'max': max_bb.tolist(),
+        }
+
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            np.save(os.path.join(self.index_dir, 'points.npy'), self.points)
+            np.save(os.path.join(self.index_dir, 'row_ids.npy'), self.row_ids)
+            np.save(os.path.join(self.index_dir, 'offsets.npy'), self.offsets)
+            # written last, an index without meta data is incomplete
+            with open(os.path.join(self.index_dir, 'meta.json'), 'w') as f:
+                json.dump(self.meta, f)
+        except OSError as e:
+            logger.warning(
+                "Could not write CSV index %s (%s), keeping it in memory only",
+                self.index_dir, e)
@@ -1,4 +1,6 @@
 import logging
+import multiprocessing
+import queue
 import random
 import numpy as np
 
@@ -66,6 +68,14 @@ class DefectAugment(BatchFilter):
         axis (``int``, optional):
 
             Along which axis sections are cut.
+
+        artifact_pool_size (``int``, optional):
+
+            If set, keep this many artifacts (and their alpha masks) in memory
+            instead of requesting one from ``artifact_source`` for each
+            augmented section. Artifacts are drawn randomly from the pool, used
+            ones are replaced with new ones from ``artifact_source``, which are
+            requested in a separate process (see :class:`ArtifactPool`).
     '''
 
     def __init__(
@@ -80,7 +90,8 @@ class DefectAugment(BatchFilter):
             artifacts=None,
             artifacts_mask=None,
             deformation_strength=20,
-            axis=0):
+            axis=0,
+            artifact_pool_size=0):
         self.intensities = intensities
         self.prob_missing = prob_missing
         self.prob_low_contrast = prob_low_contrast
@@ -92,6 +103,8 @@ class DefectAugment(BatchFilter):
         self.artifacts_mask = artifacts_mask
         self.deformation_strength = deformation_strength
         self.axis = axis
+        self.artifact_pool_size = artifact_pool_size
+        self.artifact_pool = None
 
     def setup(self):
 
@@ -100,6 +113,10 @@ class DefectAugment(BatchFilter):
 
     def teardown(self):
 
+        if self.artifact_pool is not None:
+            self.artifact_pool.stop()
+            self.artifact_pool = None
+
         if self.artifact_source is not None:
             self.artifact_source.teardown()
 
@@ -137,7 +154,7 @@ class DefectAugment(BatchFilter):
 
             elif r < prob_low_contrast_threshold:
                 logger.debug("Lower contrast " + str(c))
-                self.slice_to_augmentation[c] = 'lower_contrast'
+                self.slice_to_augmentation[c] = 'low_contrast'
 
             elif r < prob_artifact_threshold:
                 logger.debug("Add artifact " + str(c))
@@ -171,6 +188,8 @@ class DefectAugment(BatchFilter):
 
         deps[self.intensities] = spec
 
+        return deps
+
     def process(self, batch, request):
 
         assert batch.get_total_roi().dims() == 3, "defectaugment works on 3d batches only"
@@ -178,74 +197,107 @@ class DefectAugment(BatchFilter):
         raw = batch.arrays[self.intensities]
         raw_voxel_size = self.spec[self.intensities].voxel_size
 
+        sections = {}
         for c, augmentation_type in self.slice_to_augmentation.items():
+            sections.setdefault(augmentation_type, []).append(c)
 
-            section_selector = tuple(
-                slice(None if d != self.axis else c, None if d != self.axis else c+1)
+        def select(sections):
+            # all given sections at once, as an advanced index along the axis
+            return tuple(
+                sections if d == self.axis else slice(None)
                 for d in range(raw.spec.roi.dims())
             )
 
-            if augmentation_type == 'zero_out':
-                raw.data[section_selector] = 0
-
-            elif augmentation_type == 'low_contrast':
-                section = raw.data[section_selector]
-
-                mean = section.mean()
-                section -= mean
-                section *= self.contrast_scale
-                section += mean
-
-                raw.data[section_selector] = section
+        if 'zero_out' in sections:
+            raw.data[select(sections['zero_out'])] = 0
+
+        if 'low_contrast' in sections:
+            selector = select(sections['low_contrast'])
+
+            # compute in float, to support integer intensities
+            dtype = raw.data.dtype
+            if np.issubdtype(dtype, np.floating):
+                section = raw.data[selector]
+            else:
+                section = raw.data[selector].astype(np.float32)
+
+            spatial_axes = tuple(
+                d for d in range(section.ndim) if d != self.axis)
+            mean = section.mean(axis=spatial_axes, keepdims=True)
+            section -= mean
+            section *= self.contrast_scale
+            section += mean
+
+            if np.issubdtype(dtype, np.integer):
+                section = np.round(section)
+            raw.data[selector] = section.astype(dtype, copy=False)
+
+        if 'artifact' in sections:
+
+            selector = select(sections['artifact'])
+            section = raw.data[selector]
+
+            alpha_voxel_size = self.artifact_source.spec[self.artifacts_mask].voxel_size
+
+            assert raw_voxel_size == alpha_voxel_size, ("Can only alpha blend RAW with "
+                                                        "ALPHA_MASK if both have the same "
+                                                        "voxel size")
+
+            section_shape = tuple(
+                1 if d == self.axis else s
+                for d, s in enumerate(section.shape))
+            # artifacts in the pool should also cover sections grown for a
+            # deformed slice
+            pool_shape = section_shape
+            if (
+                    self.prob_deform > 0 and
+                    'deformed_slice' not in self.slice_to_augmentation.values()):
+                pool_shape = tuple(
+                    s if d == self.axis else s + 2*self.deformation_strength
+                    for d, s in enumerate(section_shape))
+
+            artifacts = self.__get_artifacts(
+                section_shape,
+                pool_shape,
+                raw_voxel_size,
+                len(sections['artifact']))
+
+            artifact_raw = np.concatenate(
+                [a for a, _ in artifacts], axis=self.axis)
+            artifact_alpha = np.concatenate(
+                [a for _, a in artifacts], axis=self.axis)
+
+            # blend all sections at once
+            raw.data[selector] = section*(1.0 - artifact_alpha) + artifact_raw*artifact_alpha
+
+        for c in sections.get('deformed_slice', []):
 
-            elif augmentation_type == 'artifact':
-
-                section = raw.data[section_selector]
-
-                alpha_voxel_size = self.artifact_source.spec[self.artifacts_mask].voxel_size
-
-                assert raw_voxel_size == alpha_voxel_size, ("Can only alpha blend RAW with "
-                                                            "ALPHA_MASK if both have the same "
-                                                            "voxel size")
-
-                artifact_request = BatchRequest()
-                artifact_request.add(self.artifacts, Coordinate(section.shape) * raw_voxel_size, voxel_size=raw_voxel_size)
-                artifact_request.add(self.artifacts_mask, Coordinate(section.shape) * alpha_voxel_size, voxel_size=raw_voxel_size)
-                logger.debug("Requesting artifact batch %s", artifact_request)
-
-                artifact_batch = self.artifact_source.request_batch(artifact_request)
-                artifact_alpha = artifact_batch.arrays[self.artifacts_mask].data
-                artifact_raw   = artifact_batch.arrays[self.artifacts].data
-
-                assert artifact_alpha.dtype == np.float32
-                assert artifact_alpha.min() >= 0.0
-                assert artifact_alpha.max() <= 1.0
-
-                raw.data[section_selector] = section*(1.0 - artifact_alpha) + artifact_raw*artifact_alpha
-
-            elif augmentation_type == 'deformed_slice':
+            section_selector = tuple(
+                slice(None if d != self.axis else c, None if d != self.axis else c+1)
+                for d in range(raw.spec.roi.dims())
+            )
 
-                section = raw.data[section_selector].squeeze()
+            section = raw.data[section_selector].squeeze()
 
-                # set interpolation to cubic, spec interploatable is true, else to 0
-                interpolation = 3 if self.spec[self.intensities].interpolatable else 0
+            # set interpolation to cubic, spec interploatable is true, else to 0
+            interpolation = 3 if self.spec[self.intensities].interpolatable else 0
 
-                # load the deformation fields that were prepared for this slice
-                flow_x, flow_y, line_mask = self.deform_slice_transformations[c]
+            # load the deformation fields that were prepared for this slice
+            flow_x, flow_y, line_mask = self.deform_slice_transformations[c]
 
-                # apply the deformation fields
-                shape = section.shape
-                section = map_coordinates(
-                    section, (flow_y, flow_x), mode='constant', order=interpolation
-                ).reshape(shape)
+            # apply the deformation fields
+            shape = section.shape
+            section = map_coordinates(
+                section, (flow_y, flow_x), mode='constant', order=interpolation
+            ).reshape(shape)
 
-                # things can get smaller than 0 at the boundary, so we clip
-                section = np.clip(section, 0., 1.)
+            # things can get smaller than 0 at the boundary, so we clip
+            section = np.clip(section, 0., 1.)
 
-                # zero-out data below the line mask
-                section[line_mask] = 0.
+            # zero-out data below the line mask
+            section[line_mask] = 0.
 
-                raw.data[section_selector] = section
+            raw.data[section_selector] = section
 
         # in case we needed to change the ROI due to a deformation augment,
         # restore original ROI and crop the array data
@@ -259,6 +311,50 @@ class DefectAugment(BatchFilter):
             raw.data = raw.data[crop]
             raw.spec.roi = old_roi
 
+    def __get_artifacts(
+            self,
+            section_shape,
+            pool_shape,
+            voxel_size,
+            num_artifacts):
+        '''Get ``num_artifacts`` pairs of artifact intensities and alpha
+        masks of the given shape, either from the pool (holding artifacts of
+        at least ``pool_shape``) or directly from the artifact source.'''
+
+        def request_artifact(shape):
+
+            artifact_request = BatchRequest()
+            artifact_request.add(self.artifacts, Coordinate(shape) * voxel_size, voxel_size=voxel_size)
+            artifact_request.add(self.artifacts_mask, Coordinate(shape) * voxel_size, voxel_size=voxel_size)
+            logger.debug("Requesting artifact batch %s", artifact_request)
+
+            artifact_batch = self.artifact_source.request_batch(artifact_request)
+            artifact_alpha = artifact_batch.arrays[self.artifacts_mask].data
+            artifact_raw   = artifact_batch.arrays[self.artifacts].data
+
+            assert artifact_alpha.dtype == np.float32
+            assert artifact_alpha.min() >= 0.0
+            assert artifact_alpha.max() <= 1.0
+
+            return artifact_raw, artifact_alpha
+
+        if not self.artifact_pool_size:
+            return [
+                request_artifact(section_shape)
+                for _ in range(num_artifacts)
+            ]
+
+        # created in the process that uses it
+        if self.artifact_pool is None:
+            self.artifact_pool = ArtifactPool(
+                request_artifact,
+                self.artifact_pool_size)
+
+        return self.artifact_pool.draw(
+            num_artifacts,
+            section_shape,
+            pool_shape)
+
     def __prepare_deform_slice(self, slice_shape):
 
         # grow slice shape by 2 x deformation strength
@@ -312,3 +408,125 @@ class DefectAugment(BatchFilter):
         line_mask = binary_dilation(line_mask, iterations=10)
 
         return flow_x, flow_y, line_mask
+
+
+class ArtifactPool:
+    '''A pool of artifacts, filled by calling ``request_artifact(shape)``.
+
+    All artifacts in the pool have the same shape, artifacts of smaller shapes
+    are cropped from them at random offsets. If a larger shape is needed, the
+    pool is refilled with artifacts of that shape.
+
+    Drawn artifacts are replaced with new ones, which are requested in a
+    single worker process. Requests to the artifact source therefore never
+    run concurrently within a process, and do not reseed the random number
+    generators of the process that draws from the pool.
+
+    Args:
+
+        request_artifact (``callable``):
+
+            Function returning a new artifact of the given shape, as a tuple
+            of intensities and alpha mask.
+
+        size (``int``):
+
+            The number of artifacts to keep in the pool.
+    '''
+
+    def __init__(self, request_artifact, size):
+
+        self.request_artifact = request_artifact
+        self.size = size
+        self.shape = None
+        self.artifacts = []
+        self.used = set()
+        self.fresh = None
+        self.worker = None
+
+    def draw(self, num_artifacts, shape, pool_shape=None):
+        '''Draw ``num_artifacts`` random artifacts (with replacement) of the
+        given shape. If the pool has to be (re)filled, it will hold artifacts
+        of at least ``pool_shape``.'''
+
+        if self.shape is None or any(
+                s > p for s, p in zip(shape, self.shape)):
+            new_shape = np.maximum(
+                shape,
+                shape if pool_shape is None else pool_shape)
+            if self.shape is not None:
+                new_shape = np.maximum(new_shape, self.shape)
+            self.__fill(tuple(int(s) for s in new_shape))
+
+        self.__replace_used()
+
+        indices = [
+            random.randrange(len(self.artifacts))
+            for _ in range(num_artifacts)
+        ]
+        self.used.update(indices)
+
+        return [self.__crop(self.artifacts[i], shape) for i in indices]
+
+    def stop(self):
+
+        if self.worker is not None:
+            self.worker.terminate()
+            self.worker.join()
+            self.worker = None
+
+    def __fill(self, shape):
+
+        self.stop()
+
+        logger.debug("filling artifact pool with artifacts of shape %s", shape)
+
+        # requesting a batch reseeds the random number generators, which
+        # should not change the random state of the pipeline
+        random_state = random.getstate()
+        np_random_state = np.random.get_state()
+        try:
+            self.artifacts = [
+                self.request_artifact(shape)
+                for _ in range(self.size)
+            ]
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+        self.used = set()
+        self.shape = shape
+
+        self.fresh = multiprocessing.Queue(maxsize=self.size)
+        self.worker = multiprocessing.Process(
+            target=self.__produce,
+            args=(shape,),
+            daemon=True)
+        self.worker.start()
+
+    def __replace_used(self):
+
+        while self.used:
+            try:
+                artifact = self.fresh.get_nowait()
+            except queue.Empty:
+                return
+            self.artifacts[self.used.pop()] = artifact
+
+    def __crop(self, artifact, shape):
+
+        offset = [random.randint(0, p - s) for s, p in zip(shape, self.shape)]
+        crop = tuple(slice(o, o + s) for o, s in zip(offset, shape))
+
+        return tuple(a[crop] for a in artifact)
+
+    def __produce(self, shape):
+
+        while True:
+            try:
+                artifact = self.request_artifact(shape)
+            except Exception:
+                logger.exception(
+                    "Failed to request artifact, no more artifacts will be "
+                    "replaced")
+                return
+            self.fresh.put(artifact)
@@ -61,18 +61,21 @@ class ExcludeLabels(BatchFilter):
 
         gt = batch.arrays[self.labels]
 
-        # 0 marks included regions (to be used directly with distance transform
-        # later)
-        include_mask = np.ones(gt.data.shape)
-
-        gt_labels = np.unique(gt.data)
-        logger.debug("batch contains GT labels: " + str(gt_labels))
-        for label in gt_labels:
-            if label in self.exclude:
-                logger.debug("excluding label " + str(label))
-                gt.data[gt.data==label] = self.background_value
-            else:
-                include_mask[gt.data==label] = 0
+        if logger.isEnabledFor(logging.DEBUG):
+            gt_labels = np.unique(gt.data)
+            logger.debug("batch contains GT labels: " + str(gt_labels))
+            logger.debug(
+                "excluding labels " +
+                str(gt_labels[np.isin(gt_labels, list(self.exclude))]))
+
+        # all excluded voxels in a single pass, independent of the number of
+        # labels
+        excluded = np.isin(gt.data, list(self.exclude))
+        gt.data[excluded] = self.background_value
+
+        # 1 marks excluded regions, 0 included regions (to be used directly
+        # with distance transform later)
+        include_mask = excluded
 
         # if no ignore mask is provided or requested, we are done
         if not self.ignore_mask or not self.ignore_mask in request:
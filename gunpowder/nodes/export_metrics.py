@@ -0,0 +1,287 @@
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from .batch_filter import BatchFilter
+from .precache import PreCache
+
+logger = logging.getLogger(__name__)
+
+class ExportMetrics(BatchFilter):
+    '''Collect live metrics of the pipeline upstream of this node and export
+    them while the pipeline is running, either through a local HTTP endpoint
+    in the Prometheus text format, or as a JSON file that is rewritten
+    periodically. No external service is needed for either.
+
+    The metrics are:
+
+        ``gunpowder_batches_total``
+
+            The number of batches that passed through this node.
+
+        ``gunpowder_batches_per_second``
+
+            Throughput over the last ``window`` batches.
+
+        ``gunpowder_node_latency_seconds``
+
+            Median, 90th and 99th percentile of the timings of each upstream
+            node and method over the last ``window`` batches.
+
+        ``gunpowder_precache_queued``, ``gunpowder_precache_capacity``,
+        ``gunpowder_precache_workers``, ``gunpowder_precache_workers_alive``
+
+            Fill level of the queue and number of live workers of each
+            upstream :class:`PreCache`.
+
+    Args:
+
+        port (``int``, optional):
+
+            If given, serve the metrics at ``http://<host>:<port>/metrics``.
+            Use ``0`` to pick a free port, which will be stored in
+            :attr:`port` after the pipeline was built.
+
+        host (``string``, optional):
+
+            The host to bind the HTTP server to. Defaults to ``localhost``.
+
+        filename (``string``, optional):
+
+            If given, write the metrics as JSON to this file every
+            ``interval`` seconds.
+
+        interval (``float``, optional):
+
+            How often to write the JSON file, in seconds.
+
+        window (``int``, optional):
+
+            The number of recent batches to compute throughput and latency
+            percentiles over.
+    '''
+
+    def __init__(
+            self,
+            port=None,
+            host='localhost',
+            filename=None,
+            interval=10,
+            window=100):
+
+        self.port = port
+        self.host = host
+        self.filename = filename
+        self.interval = interval
+        self.window = window
+
+        self.server = None
+        self.writer = None
+
+    def setup(self):
+
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__num_batches = 0
+        self.__batch_times = deque(maxlen=self.window + 1)
+        self.__latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self.__latency_sums = defaultdict(float)
+        self.__latency_counts = defaultdict(int)
+        self.__precaches = self.__find_precaches(self)
+
+        if self.port is not None:
+            self.server = HTTPServer(
+                (self.host, self.port),
+                self.__create_handler())
+            self.port = self.server.server_address[1]
+            threading.Thread(
+                target=self.server.serve_forever,
+                daemon=True).start()
+            logger.info(
+                "serving metrics at http://%s:%d/metrics",
+                self.host,
+                self.port)
+
+        if self.filename is not None:
+            self.writer = threading.Thread(
+                target=self.__run_writer,
+                daemon=True)
+            self.writer.start()
+
+    def teardown(self):
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+        if self.writer is not None:
+            self.__stop.set()
+            self.writer.join()
+            self.writer = None
+            self.__write_json()
+
+    def process(self, batch, request):
+
+        now = time.time()
+        summaries = batch.profiling_stats.get_timing_summaries()
+
+        with self.__lock:
+
+            self.__num_batches += 1
+            self.__batch_times.append(now)
+
+            for id, summary in summaries.items():
+                for t in summary.times:
+                    self.__latencies[id].append(t)
+                    self.__latency_sums[id] += t
+                    self.__latency_counts[id] += 1
+
+    def get_metrics(self):
+        '''Get the current metrics as a ``dict``.'''
+
+        with self.__lock:
+
+            batch_times = list(self.__batch_times)
+            if len(batch_times) > 1 and batch_times[-1] > batch_times[0]:
+                batches_per_second = \
+                    (len(batch_times) - 1)/(batch_times[-1] - batch_times[0])
+            else:
+                batches_per_second = 0.0
+
+            latencies = []
+            for (node_name, method_name), times in sorted(
+                    self.__latencies.items(),
+                    key=lambda item: (item[0][0], item[0][1] or '')):
+                p50, p90, p99 = np.percentile(times, [50, 90, 99])
+                latencies.append({
+                    'node': node_name,
+                    'method': method_name or '',
+                    'count': self.__latency_counts[(node_name, method_name)],
+                    'sum': self.__latency_sums[(node_name, method_name)],
+                    'p50': float(p50),
+                    'p90': float(p90),
+                    'p99': float(p99)
+                })
+
+            num_batches = self.__num_batches
+
+        precaches = []
+        for i, precache in enumerate(self.__precaches):
+            state = precache.get_pool_state()
+            if state is not None:
+                state['index'] = i
+                precaches.append(state)
+
+        return {
+            'time': time.time(),
+            'batches_total': num_batches,
+            'batches_per_second': batches_per_second,
+            'latencies': latencies,
+            'precaches': precaches
+        }
+
+    def get_prometheus_metrics(self):
+        '''Get the current metrics in the Prometheus text format.'''
+
+        metrics = self.get_metrics()
+
+        lines = [
+            "# HELP gunpowder_batches_total Number of batches provided.",
+            "# TYPE gunpowder_batches_total counter",
+            "gunpowder_batches_total %d" % metrics['batches_total'],
+            "# HELP gunpowder_batches_per_second Recent throughput.",
+            "# TYPE gunpowder_batches_per_second gauge",
+            "gunpowder_batches_per_second %f" % metrics['batches_per_second'],
+            "# HELP gunpowder_node_latency_seconds Recent timings per node "
+            "and method.",
+            "# TYPE gunpowder_node_latency_seconds summary"
+        ]
+
+        for latency in metrics['latencies']:
+            labels = 'node="%s",method="%s"' % (
+                latency['node'],
+                latency['method'])
+            for quantile, key in [('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99')]:
+                lines.append(
+                    'gunpowder_node_latency_seconds{%s,quantile="%s"} %f' % (
+                        labels, quantile, latency[key]))
+            lines.append(
+                'gunpowder_node_latency_seconds_sum{%s} %f' % (
+                    labels, latency['sum']))
+            lines.append(
+                'gunpowder_node_latency_seconds_count{%s} %d' % (
+                    labels, latency['count']))
+
+        for name, key, help in [
+                ('queued', 'queued', "Batches waiting in the queue."),
+                ('capacity', 'capacity', "Size of the queue."),
+                ('workers', 'workers', "Number of workers."),
+                ('workers_alive', 'workers_alive', "Number of live workers.")]:
+            lines.append("# HELP gunpowder_precache_%s %s" % (name, help))
+            lines.append("# TYPE gunpowder_precache_%s gauge" % name)
+            for state in metrics['precaches']:
+                if state[key] is None:
+                    continue
+                lines.append(
+                    'gunpowder_precache_%s{index="%d"} %d' % (
+                        name, state['index'], state[key]))
+
+        return "\n".join(lines) + "\n"
+
+    def __find_precaches(self, node):
+
+        precaches = []
+        for upstream in node.get_upstream_providers():
+            if isinstance(upstream, PreCache):
+                precaches.append(upstream)
+            precaches += self.__find_precaches(upstream)
+        return precaches
+
+    def __create_handler(self):
+
+        export_metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                if self.path.rstrip('/') not in ['', '/metrics']:
+                    self.send_error(404)
+                    return
+
+                content = export_metrics.get_prometheus_metrics().encode()
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type',
+                    'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return MetricsHandler
+
+    def __run_writer(self):
+
+        while not self.__stop.wait(self.interval):
+            try:
+                self.__write_json()
+            except Exception as e:
+                logger.error("failed to write metrics: %s", e)
+
+    def __write_json(self):
+
+        metrics = self.get_metrics()
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        os.replace(tmp_filename, self.filename)
@@ -1,11 +1,18 @@
 import logging
 import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import queue
 import time
+import traceback
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
 from gunpowder.nodes.batch_filter import BatchFilter
 from gunpowder.producer_pool import ProducerPool, WorkersDied, NoResult
-from gunpowder.array import ArrayKey
+from gunpowder.array import Array, ArrayKey
 from gunpowder.array_spec import ArraySpec
+from gunpowder.batch import Batch
 from gunpowder.batch_request import BatchRequest
 
 logger = logging.getLogger(__name__)
@@ -36,6 +43,17 @@ class GenericPredict(BatchFilter):
 
         spawn_subprocess (bool, optional): Whether to run ``predict`` in a
             separate process. Default is false.
+
+        max_batch_size (int, optional): If given, run the model in an
+            inference server process instead, which collects the requests of
+            all downstream workers (e.g., of :class:`Scan` or
+            :class:`PreCache`) and predicts up to this many of them at once,
+            see :meth:`predict_batches`. Inputs and outputs are exchanged
+            through shared memory. Only arrays are supported as inputs.
+
+        batch_timeout (float, optional): How long the inference server waits
+            (in seconds) for more requests to fill a batch, before it predicts
+            the ones it has. Default is 0.01.
     '''
 
     def __init__(
@@ -43,15 +61,23 @@ class GenericPredict(BatchFilter):
             inputs,
             outputs,
             array_specs=None,
-            spawn_subprocess=False):
+            spawn_subprocess=False,
+            max_batch_size=None,
+            batch_timeout=0.01):
 
         self.initialized = False
         self.inputs = inputs
         self.outputs = outputs
         self.array_specs = {} if array_specs is None else array_specs
         self.spawn_subprocess = spawn_subprocess
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self.server = None
         self.timer_start = None
 
+        assert max_batch_size is None or max_batch_size >= 1, (
+            "max_batch_size has to be at least 1")
+
     def setup(self):
 
         # get common voxel size of inputs, or None if they differ
@@ -93,7 +119,24 @@ class GenericPredict(BatchFilter):
 
             self.provides(key, spec)
 
-        if self.spawn_subprocess:
+        if self.max_batch_size is not None:
+
+            for key in self.inputs.values():
+                assert isinstance(key, ArrayKey), (
+                    "Only arrays can be used as inputs to an inference "
+                    "server, got %s" % key)
+
+            # start the server before any downstream workers, such that all
+            # of them can reach it
+            self.server = InferenceServer(
+                self.start,
+                self.predict_batches,
+                self.stop,
+                self.max_batch_size,
+                self.batch_timeout)
+            self.server.start()
+
+        elif self.spawn_subprocess:
             # start prediction as a producer pool, so that we can gracefully
             # exit if anything goes wrong
             self.worker = ProducerPool([self.__produce_predict_batch], queue_size=1)
@@ -103,7 +146,10 @@ class GenericPredict(BatchFilter):
             self.worker.start()
 
     def teardown(self):
-        if self.spawn_subprocess:
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+        elif self.spawn_subprocess:
             # signal "stop"
             self.batch_in.put((None, None))
             try:
@@ -116,7 +162,10 @@ class GenericPredict(BatchFilter):
 
     def prepare(self, request):
 
-        if not self.initialized and not self.spawn_subprocess:
+        if (
+                not self.initialized and
+                not self.spawn_subprocess and
+                self.server is None):
             self.start()
             self.initialized = True
 
@@ -128,7 +177,19 @@ class GenericPredict(BatchFilter):
 
     def process(self, batch, request):
 
-        if self.spawn_subprocess:
+        if self.server is not None:
+
+            inputs = {
+                key: batch.arrays[key]
+                for key in self.inputs.values()
+            }
+            outputs = self.server.predict(inputs, request)
+
+            for array_key in self.outputs.values():
+                if array_key in request:
+                    batch.arrays[array_key] = outputs[array_key]
+
+        elif self.spawn_subprocess:
 
             start = time.time()
             self.batch_in_lock.acquire()
@@ -181,6 +242,17 @@ class GenericPredict(BatchFilter):
         and added to ``batch``.'''
         raise NotImplementedError("Class %s does not implement 'predict'"%self.name())
 
+    def predict_batches(self, batches, requests):
+        '''To be overridden in subclasses that can predict several batches
+        at once.
+
+        Called by the inference server (see ``max_batch_size``) with a list of
+        batches and their requests. The default implementation calls
+        :fun:`predict` for each of them.'''
+
+        for batch, request in zip(batches, requests):
+            self.predict(batch, request)
+
     def stop(self):
         '''To be implemented in subclasses.
 
@@ -220,3 +292,251 @@ class GenericPredict(BatchFilter):
 
         return batch
 
+
+
+def _to_shared_memory(data):
+    '''Copy ``data`` into a new shared memory segment. Returns the segment
+    and a description of the array in it.'''
+
+    data = np.asarray(data)
+    shm = SharedMemory(create=True, size=max(data.nbytes, 1))
+    shared = np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
+    shared[...] = data
+    del shared
+
+    return shm, (shm.name, data.shape, data.dtype.str)
+
+
+def _attach_shared_memory(description):
+    '''Open the shared memory segment described by ``description``. Returns
+    the segment and an array in it, which has to be deleted before the
+    segment can be closed.'''
+
+    name, shape, dtype = description
+    shm = SharedMemory(name=name)
+
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _from_shared_memory(description, unlink):
+    '''Copy an array out of the shared memory segment described by
+    ``description``, and optionally remove the segment.'''
+
+    shm, shared = _attach_shared_memory(description)
+    data = shared.copy()
+    del shared
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+    return data
+
+
+class InferenceServer:
+    '''A process that predicts requests of several clients together.
+
+    Clients (possibly in different processes, as long as they have been forked
+    after :meth:`start`) call :meth:`predict` with their input arrays. The
+    server collects up to ``max_batch_size`` requests, waiting at most
+    ``batch_timeout`` seconds after the first one, hands them to
+    ``predict_batches`` together, and sends each client its outputs back.
+    Arrays are exchanged through shared memory, only their descriptions go
+    through queues.
+
+    Args:
+
+        start (callable):
+
+            Called once in the server process, before the first prediction.
+
+        predict_batches (callable):
+
+            Called with a list of batches and a list of requests, adds the
+            predicted outputs to each batch.
+
+        stop (callable):
+
+            Called once in the server process, after the last prediction.
+
+        max_batch_size (int):
+
+            The maximal number of requests to predict at once.
+
+        batch_timeout (float):
+
+            How long to wait for requests to fill a batch.
+    '''
+
+    def __init__(
+            self,
+            start,
+            predict_batches,
+            stop,
+            max_batch_size,
+            batch_timeout):
+
+        self.start_server = start
+        self.predict_batches = predict_batches
+        self.stop_server = stop
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+
+        # enough slots for clients to fill the next batch while one is
+        # predicted
+        num_slots = 2*max_batch_size
+        self.requests = multiprocessing.Queue()
+        self.free_slots = multiprocessing.Queue()
+        self.responses = [multiprocessing.Queue() for _ in range(num_slots)]
+        for slot in range(num_slots):
+            self.free_slots.put(slot)
+
+        self.process = None
+        self.sentinel = None
+
+    def __getstate__(self):
+
+        # the server can only be shared through inheritance, but it might be
+        # pickled as part of an error raised in a worker process
+        return {
+            'max_batch_size': self.max_batch_size,
+            'batch_timeout': self.batch_timeout,
+        }
+
+    def start(self):
+
+        # segments are created and removed by different processes, which
+        # therefore have to share the resource tracker of this process
+        resource_tracker.ensure_running()
+
+        self.process = multiprocessing.Process(target=self.__run, daemon=True)
+        self.process.start()
+        self.sentinel = self.process.sentinel
+
+    def stop(self):
+
+        if self.process is None:
+            return
+
+        # signal "stop"
+        self.requests.put(None)
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            logger.warning("inference server did not stop, terminating it")
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+
+    def predict(self, arrays, request):
+        '''Predict the outputs for ``request`` from ``arrays``, a dictionary
+        from :class:`ArrayKey` to :class:`Array`. Returns a dictionary of the
+        predicted arrays.'''
+
+        slot = self.__get(self.free_slots)
+        shared = []
+        try:
+            inputs = {}
+            for key, array in arrays.items():
+                shm, description = _to_shared_memory(array.data)
+                shared.append(shm)
+                inputs[key] = (array.spec, description)
+
+            self.requests.put((slot, request, inputs))
+            status, result = self.__get(self.responses[slot])
+        finally:
+            for shm in shared:
+                shm.close()
+                shm.unlink()
+            self.free_slots.put(slot)
+
+        if status == 'error':
+            raise RuntimeError(
+                "Prediction in inference server failed:\n%s" % result)
+
+        return {
+            key: Array(_from_shared_memory(description, unlink=True), spec)
+            for key, (spec, description) in result.items()
+        }
+
+    def __get(self, from_queue):
+        '''Get the next item of ``from_queue``, unless the server dies while
+        waiting for it.'''
+
+        while True:
+            try:
+                return from_queue.get(timeout=0.1)
+            except queue.Empty:
+                if multiprocessing.connection.wait([self.sentinel], timeout=0):
+                    raise PredictProcessDied()
+
+    def __run(self):
+
+        self.start_server()
+
+        stopped = False
+        while not stopped:
+
+            item = self.requests.get()
+            if item is None:
+                break
+            items = [item]
+
+            # fill the batch until it is full or the time is up
+            deadline = time.time() + self.batch_timeout
+            while len(items) < self.max_batch_size:
+                try:
+                    item = self.requests.get(
+                        timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopped = True
+                    break
+                items.append(item)
+
+            logger.debug("predicting %d requests at once", len(items))
+            self.__predict(items)
+
+        self.stop_server()
+
+    def __predict(self, items):
+
+        # inputs are used in place, their segments are kept open until all
+        # outputs have been sent
+        segments = []
+        try:
+            self.__predict_segments(items, segments)
+        finally:
+            for shm in segments:
+                shm.close()
+
+    def __predict_segments(self, items, segments):
+
+        batches = []
+        requests = []
+        for slot, request, inputs in items:
+            batch = Batch()
+            for key, (spec, description) in inputs.items():
+                shm, data = _attach_shared_memory(description)
+                segments.append(shm)
+                batch.arrays[key] = Array(data, spec)
+            batches.append(batch)
+            requests.append(request)
+
+        try:
+            self.predict_batches(batches, requests)
+        except Exception:
+            logger.error("prediction failed", exc_info=True)
+            for slot, _, _ in items:
+                self.responses[slot].put(('error', traceback.format_exc()))
+            return
+
+        for (slot, _, inputs), batch in zip(items, batches):
+            outputs = {}
+            for key, array in batch.arrays.items():
+                if key in inputs:
+                    continue
+                # the client removes the segment, once it copied the outputs
+                shm, description = _to_shared_memory(array.data)
+                shm.close()
+                outputs[key] = (array.spec, description)
+            self.responses[slot].put(('ok', outputs))
@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+
+from gunpowder.batch import Batch
+from gunpowder.coordinate import Coordinate
+from gunpowder.graph import Edge, Graph, Node
+from gunpowder.graph_spec import GraphSpec
+from gunpowder.profiling import Timing
+from gunpowder.roi import Roi
+from .batch_provider import BatchProvider
+from .graph_store import GraphStore, open_graph_container
+
+logger = logging.getLogger(__name__)
+
+
+class GraphSource(BatchProvider):
+    '''Read graphs from a zarr or HDF5 container, as written by
+    :class:`GraphWrite`.
+
+    Graphs are stored as columnar arrays with a spatial index, such that only
+    the parts of the arrays close to the requested ROI are read. A request
+    returns all nodes inside the ROI, all edges with at least one node inside
+    the ROI, and the nodes of those edges outside of the ROI (see
+    :func:`Graph.crop`).
+
+    Args:
+
+        filename (``string``):
+
+            The container to read from. Files ending in ``.zarr`` or ``.n5``
+            are opened with zarr, all others with h5py.
+
+        datasets (``dict``, :class:`GraphKey` -> ``string``):
+
+            Dictionary of graph keys to the names of the groups the graphs are
+            stored in.
+
+        graph_specs (``dict``, :class:`GraphKey` -> :class:`GraphSpec`, optional):
+
+            An optional dictionary of graph keys to specs to overwrite the
+            specs determined from the container. This is useful to set the
+            :class:`Roi` manually. Only fields that are not ``None`` in the
+            given specs will be used.
+    '''
+
+    def __init__(self, filename, datasets, graph_specs=None):
+
+        self.filename = filename
+        self.datasets = datasets
+        if graph_specs is None:
+            self.graph_specs = {}
+        else:
+            self.graph_specs = graph_specs
+
+    def setup(self):
+
+        with open_graph_container(self.filename, 'r') as data_file:
+            for graph_key, ds_name in self.datasets.items():
+
+                if ds_name not in data_file:
+                    raise RuntimeError(
+                        "%s not in %s"%(ds_name, self.filename))
+
+                store = GraphStore(data_file[ds_name])
+                spec = self.__read_spec(graph_key, store)
+                self.provides(graph_key, spec)
+
+    def provide(self, request):
+
+        timing = Timing(self)
+        timing.start()
+
+        batch = Batch()
+
+        with open_graph_container(self.filename, 'r') as data_file:
+            for graph_key, request_spec in request.graph_specs.items():
+
+                logger.debug("Reading %s in %s...", graph_key, request_spec.roi)
+
+                store = GraphStore(data_file[self.datasets[graph_key]])
+                ids, locations, node_attrs, edges, edge_attrs = store.read(
+                    request_spec.roi.get_begin(),
+                    request_spec.roi.get_end())
+
+                nodes = [
+                    Node(
+                        id=node_id,
+                        location=location,
+                        attrs={
+                            name: values[i]
+                            for name, values in node_attrs.items()
+                        })
+                    for i, (node_id, location) in enumerate(zip(ids, locations))
+                ]
+                edges = [
+                    Edge(
+                        u, v,
+                        attrs={
+                            name: values[i]
+                            for name, values in edge_attrs.items()
+                        })
+                    for i, (u, v) in enumerate(edges)
+                ]
+
+                spec = self.spec[graph_key].copy()
+                spec.roi = request_spec.roi
+                batch.graphs[graph_key] = Graph(nodes, edges, spec)
+
+        logger.debug("done")
+
+        timing.stop()
+        batch.profiling_stats.add(timing)
+
+        return batch
+
+    def __read_spec(self, graph_key, store):
+
+        if graph_key in self.graph_specs:
+            spec = self.graph_specs[graph_key].copy()
+        else:
+            spec = GraphSpec()
+
+        if spec.roi is None:
+            if 'offset' in store.group.attrs:
+                spec.roi = Roi(
+                    store.group.attrs['offset'],
+                    store.group.attrs['shape'])
+            else:
+                bounding_box = store.bounding_box()
+                if bounding_box is None:
+                    spec.roi = Roi(
+                        (0,)*store.dims,
+                        (0,)*store.dims)
+                else:
+                    begin = Coordinate(np.floor(bounding_box[0]))
+                    end = Coordinate(np.ceil(bounding_box[1]) + 1)
+                    spec.roi = Roi(begin, end - begin)
+
+        if spec.directed is None:
+            spec.directed = store.directed
+
+        return spec
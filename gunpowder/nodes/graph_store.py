@@ -0,0 +1,471 @@
+import logging
+import numpy as np
+
+from gunpowder.compat import ensure_str
+from gunpowder.ext import h5py, ZarrFile
+
+logger = logging.getLogger(__name__)
+
+
+def open_graph_container(filename, mode):
+    '''Open a zarr/N5 or HDF5 container, depending on the file extension.'''
+
+    if filename.endswith('.zarr') or filename.endswith('.n5'):
+        return ZarrFile(ensure_str(filename), mode=mode)
+    return h5py.File(filename, mode)
+
+
+class GraphStore:
+    '''A graph stored as columnar arrays in a group of a zarr or HDF5
+    container, see :class:`GraphSource` and :class:`GraphWrite`.
+
+    Nodes and edges are stored in rows of chunked, appendable arrays::
+
+        <group>/nodes/ids             (N,)        int64
+        <group>/nodes/locations       (N, dims)   float32
+        <group>/nodes/attrs/<name>    (N, ...)
+        <group>/nodes/blocks/<block>  (S, 2)      int64
+
+        <group>/edges/u               (E,)        int64
+        <group>/edges/v               (E,)        int64
+        <group>/edges/other_block     (E, dims)   int64
+        <group>/edges/attrs/<name>    (E, ...)
+        <group>/edges/blocks/<block>  (S, 2)      int64
+
+    Space is divided into blocks of ``block_size`` (in world units), which
+    can be set with the first append if not known when the store is created.
+    Every
+    append sorts its rows by block, and adds one row ``(begin, end)`` to the
+    index of each of these blocks (named after the block coordinates, e.g.,
+    ``0_-1_2``). The rows of a block can therefore be found without reading
+    all rows or the index of other blocks. An edge is stored in the blocks of both
+    of its nodes, together with the block of the respective other node.
+
+    Args:
+
+        group (h5py or zarr group):
+
+            The group of an existing graph, see :meth:`create`.
+    '''
+
+    version = 2
+    rows_per_chunk = 4096
+    ranges_per_chunk = 64
+
+    def __init__(self, group):
+
+        self.group = group
+        assert group.attrs.get('graph_store_version') == self.version, (
+            "%s is not a graph store of version %d"%(group, self.version))
+
+        self.dims = int(group.attrs['dims'])
+        self.block_size = None
+        if 'block_size' in group.attrs:
+            self.block_size = np.array(
+                group.attrs['block_size'], dtype=np.float64)
+        self.directed = bool(group.attrs['directed'])
+        self.node_attrs = list(group.attrs['node_attrs'])
+        self.edge_attrs = list(group.attrs['edge_attrs'])
+
+    @staticmethod
+    def create(
+            container,
+            name,
+            dims,
+            block_size,
+            directed,
+            node_attrs=(),
+            edge_attrs=()):
+        '''Create an empty graph store in ``container``, replacing the group
+        ``name`` if it exists. ``block_size`` can be ``None``, see
+        :meth:`set_block_size`.'''
+
+        if name in container:
+            del container[name]
+        group = container.create_group(name)
+
+        group.attrs['graph_store_version'] = GraphStore.version
+        group.attrs['dims'] = dims
+        group.attrs['directed'] = bool(directed)
+        group.attrs['node_attrs'] = list(node_attrs)
+        group.attrs['edge_attrs'] = list(edge_attrs)
+
+        for prefix in ['nodes', 'edges']:
+            group.create_group(prefix + '/blocks')
+        GraphStore.__create_column(group, 'nodes/ids', (), np.int64)
+        GraphStore.__create_column(
+            group, 'nodes/locations', (dims,), np.float32)
+        GraphStore.__create_column(group, 'edges/u', (), np.int64)
+        GraphStore.__create_column(group, 'edges/v', (), np.int64)
+        GraphStore.__create_column(
+            group, 'edges/other_block', (dims,), np.int64)
+
+        store = GraphStore(group)
+        if block_size is not None:
+            store.set_block_size(block_size)
+
+        return store
+
+    def set_block_size(self, block_size):
+        '''Set the block size of a store that was created without one. This
+        has to happen before the first append.'''
+
+        assert self.block_size is None, "block size is already set"
+
+        self.group.attrs['block_size'] = [float(b) for b in block_size]
+        self.block_size = np.array(block_size, dtype=np.float64)
+
+    def stored(self, ids, locations):
+        '''Get those of the given nodes that are stored already. Only the
+        blocks of the given ``locations`` are searched.'''
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0 or self.block_size is None:
+            return np.zeros((0,), dtype=np.int64)
+
+        locations = np.asarray(locations, dtype=np.float32).reshape(
+            -1, self.dims)
+        blocks = np.unique(self.__blocks(locations), axis=0)
+
+        ranges = self.__block_ranges('nodes', blocks)
+        stored_ids = self.__read_rows('nodes', ['ids'], ranges)['ids']
+
+        return ids[np.isin(ids, stored_ids)]
+
+    def bounding_box(self):
+        '''Get the minimal and maximal location of all stored nodes, or
+        ``None`` if there are none.'''
+
+        if 'min' not in self.group.attrs:
+            return None
+        return (
+            np.array(self.group.attrs['min']),
+            np.array(self.group.attrs['max']))
+
+    def append(
+            self,
+            ids,
+            locations,
+            node_attrs,
+            edges,
+            edge_locations,
+            edge_attrs):
+        '''Append nodes and edges.
+
+        Args:
+
+            ids (``ndarray``):
+
+                The ids of the new nodes.
+
+            locations (``ndarray``):
+
+                The locations of the new nodes, shape ``(N, dims)``.
+
+            node_attrs (``dict``, ``string`` -> ``ndarray``):
+
+                The values of each stored node attribute for the new nodes.
+
+            edges (``ndarray``):
+
+                The new edges as pairs of node ids, shape ``(E, 2)``.
+
+            edge_locations (``ndarray``):
+
+                The locations of both nodes of each edge, shape ``(E, 2,
+                dims)``.
+
+            edge_attrs (``dict``, ``string`` -> ``ndarray``):
+
+                The values of each stored edge attribute for the new edges.
+        '''
+
+        assert self.block_size is not None, "block size has not been set"
+
+        ids = np.asarray(ids, dtype=np.int64)
+        locations = np.asarray(locations, dtype=np.float32).reshape(
+            -1, self.dims)
+
+        if len(ids) > 0:
+            begin, end = locations.min(axis=0), locations.max(axis=0)
+            bounding_box = self.bounding_box()
+            if bounding_box is not None:
+                begin = np.minimum(begin, bounding_box[0])
+                end = np.maximum(end, bounding_box[1])
+            self.group.attrs['min'] = begin.tolist()
+            self.group.attrs['max'] = end.tolist()
+
+            order = self.__append_index('nodes', self.__blocks(locations))
+            self.__append('nodes/ids', ids[order])
+            self.__append('nodes/locations', locations[order])
+            for name in self.node_attrs:
+                self.__append_attr(
+                    'nodes/attrs/' + name,
+                    np.asarray(node_attrs[name])[order])
+
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        if len(edges) == 0:
+            return
+        edge_blocks = self.__blocks(
+            np.asarray(edge_locations).reshape(-1, self.dims)).reshape(
+                -1, 2, self.dims)
+
+        # store each edge with the block of u, and again with the block of v
+        # if it differs
+        crossing = np.nonzero(np.any(
+            edge_blocks[:, 0] != edge_blocks[:, 1],
+            axis=1))[0]
+        rows = np.concatenate([np.arange(len(edges)), crossing])
+        blocks = np.concatenate([edge_blocks[:, 0], edge_blocks[crossing, 1]])
+        other_blocks = np.concatenate(
+            [edge_blocks[:, 1], edge_blocks[crossing, 0]])
+
+        order = self.__append_index('edges', blocks)
+        rows = rows[order]
+        self.__append('edges/u', edges[rows, 0])
+        self.__append('edges/v', edges[rows, 1])
+        self.__append('edges/other_block', other_blocks[order])
+        for name in self.edge_attrs:
+            self.__append_attr(
+                'edges/attrs/' + name,
+                np.asarray(edge_attrs[name])[rows])
+
+    def read(self, begin, end):
+        '''Read all nodes with a location in ``[begin, end)``, all edges with
+        at least one of those nodes, and the other nodes of those edges.
+        Entries of ``begin`` and ``end`` can be ``None`` for unbounded
+        dimensions.
+
+        Returns:
+
+            A tuple ``(ids, locations, node_attrs, edges, edge_attrs)``, where
+            ``node_attrs`` and ``edge_attrs`` are dictionaries from attribute
+            names to arrays. Nodes of edges that are outside of ``[begin,
+            end)`` come last.
+        '''
+
+        begin = np.array(
+            [-np.inf if b is None else b for b in begin], dtype=np.float64)
+        end = np.array(
+            [np.inf if e is None else e for e in end], dtype=np.float64)
+
+        blocks = self.__blocks_intersecting(begin, end)
+
+        nodes = self.__read_rows(
+            'nodes',
+            self.__node_columns(),
+            self.__block_ranges('nodes', blocks))
+        inside = np.logical_and(
+            np.all(nodes['locations'] >= begin, axis=1),
+            np.all(nodes['locations'] < end, axis=1))
+        contained_ids = nodes['ids'][inside]
+
+        # edges with at least one contained node, each only once
+        edges = self.__read_rows(
+            'edges',
+            self.__edge_columns(),
+            self.__block_ranges('edges', blocks))
+        keep = np.logical_or(
+            np.isin(edges['u'], contained_ids),
+            np.isin(edges['v'], contained_ids))
+        edges = {column: values[keep] for column, values in edges.items()}
+        _, unique = np.unique(
+            np.stack([edges['u'], edges['v']], axis=1),
+            axis=0,
+            return_index=True)
+        other_blocks = edges['other_block']
+        edges = {
+            column: values[np.sort(unique)]
+            for column, values in edges.items()
+            if column != 'other_block'
+        }
+
+        # the other nodes of edges leaving the ROI, either in the blocks read
+        # already or in the blocks stored with the edges
+        dangling_ids = np.setdiff1d(
+            np.concatenate([edges['u'], edges['v']]),
+            contained_ids)
+        dangling = np.logical_and(
+            np.logical_not(inside),
+            np.isin(nodes['ids'], dangling_ids))
+        node_rows = np.concatenate([
+            np.nonzero(inside)[0],
+            np.nonzero(dangling)[0]])
+        nodes = {column: values[node_rows] for column, values in nodes.items()}
+
+        missing_ids = np.setdiff1d(dangling_ids, nodes['ids'])
+        if len(missing_ids) > 0:
+            other_blocks = np.unique(other_blocks, axis=0)
+            other_nodes = self.__read_rows(
+                'nodes',
+                self.__node_columns(),
+                self.__block_ranges('nodes', other_blocks))
+            found = np.isin(other_nodes['ids'], missing_ids)
+            _, first = np.unique(other_nodes['ids'][found], return_index=True)
+            rows = np.nonzero(found)[0][np.sort(first)]
+            nodes = {
+                column: np.concatenate([values, other_nodes[column][rows]])
+                for column, values in nodes.items()
+            }
+
+        # drop edges to nodes that were never stored
+        missing_ids = np.setdiff1d(dangling_ids, nodes['ids'])
+        if len(missing_ids) > 0:
+            logger.debug(
+                "Nodes %s are not stored, skipping their edges", missing_ids)
+            keep = np.logical_not(np.logical_or(
+                np.isin(edges['u'], missing_ids),
+                np.isin(edges['v'], missing_ids)))
+            edges = {column: values[keep] for column, values in edges.items()}
+
+        node_attrs = {name: nodes['attrs/' + name] for name in self.node_attrs}
+        edge_attrs = {name: edges['attrs/' + name] for name in self.edge_attrs}
+        edges = np.stack([edges['u'], edges['v']], axis=1)
+
+        return nodes['ids'], nodes['locations'], node_attrs, edges, edge_attrs
+
+    def __node_columns(self):
+        return ['ids', 'locations'] + [
+            'attrs/' + name for name in self.node_attrs]
+
+    def __edge_columns(self):
+        return ['u', 'v', 'other_block'] + [
+            'attrs/' + name for name in self.edge_attrs]
+
+    def __blocks(self, locations):
+        return np.floor(locations/self.block_size).astype(np.int64)
+
+    def __blocks_intersecting(self, begin, end):
+        '''All blocks intersecting ``[begin, end)`` that can contain nodes,
+        i.e., that also intersect the bounding box.'''
+
+        bounding_box = self.bounding_box()
+        if bounding_box is None:
+            return np.zeros((0, self.dims), dtype=np.int64)
+
+        block_begin = np.maximum(
+            np.floor(begin/self.block_size),
+            self.__blocks(bounding_box[0]))
+        block_end = np.minimum(
+            np.ceil(end/self.block_size),
+            self.__blocks(bounding_box[1]) + 1)
+        if np.any(block_end <= block_begin):
+            return np.zeros((0, self.dims), dtype=np.int64)
+
+        grid = np.meshgrid(
+            *[np.arange(b, e) for b, e in zip(block_begin, block_end)],
+            indexing='ij')
+        return np.stack([g.ravel() for g in grid], axis=1).astype(np.int64)
+
+    def __block_ranges(self, prefix, blocks):
+        '''Get the row ranges ``(begin, end)`` of all given blocks.'''
+
+        ranges = [np.zeros((0, 2), dtype=np.int64)]
+        for block in blocks:
+            name = self.__block_name(prefix, block)
+            if name in self.group:
+                ranges.append(self.group[name][:])
+        return np.concatenate(ranges)
+
+    def __block_name(self, prefix, block):
+        return prefix + '/blocks/' + '_'.join(str(int(b)) for b in block)
+
+    def __read_rows(self, prefix, columns, ranges):
+        '''Read the rows of the given ranges for the given columns. Every
+        chunk containing requested rows is read only once, consecutive chunks
+        with a single read.'''
+
+        rows = np.concatenate(
+            [np.arange(b, e) for b, e in ranges] +
+            [np.zeros((0,), dtype=np.int64)])
+        rows = np.sort(rows)
+
+        # spans of consecutive chunks to read, in rows
+        chunks = np.unique(rows//self.rows_per_chunk)
+        new_span = np.ones(len(chunks), dtype=bool)
+        new_span[1:] = chunks[1:] != chunks[:-1] + 1
+        span_begins = chunks[new_span]*self.rows_per_chunk
+        # the last chunk of a span is followed by a new one (or is the last)
+        span_last = np.roll(new_span, -1)
+        span_ends = (chunks[span_last] + 1)*self.rows_per_chunk
+
+        # position of each row in the concatenated spans
+        span_sizes = span_ends - span_begins
+        span_offsets = np.concatenate(([0], np.cumsum(span_sizes)[:-1]))
+        span = np.searchsorted(span_begins, rows, side='right') - 1
+        positions = rows - span_begins[span] + span_offsets[span]
+
+        data = {}
+        for column in columns:
+            if prefix + '/' + column not in self.group:
+                # attribute columns are created with the first row
+                data[column] = np.zeros((0,))
+                continue
+            dataset = self.group[prefix + '/' + column]
+            parts = [
+                dataset[b:e]
+                for b, e in zip(span_begins, span_ends)
+            ] + [np.zeros((0,) + dataset.shape[1:], dtype=dataset.dtype)]
+            data[column] = np.concatenate(parts)[positions]
+        return data
+
+    def __append_index(self, prefix, blocks):
+        '''Add index entries for rows with the given blocks, about to be
+        appended. Returns the order in which to append the rows.'''
+
+        column = 'nodes/ids' if prefix == 'nodes' else 'edges/u'
+        num_rows = self.group[column].shape[0]
+
+        unique_blocks, inverse, counts = np.unique(
+            blocks,
+            axis=0,
+            return_inverse=True,
+            return_counts=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+
+        ends = num_rows + np.cumsum(counts)
+        begins = ends - counts
+        for block, begin, end in zip(unique_blocks, begins, ends):
+            name = self.__block_name(prefix, block)
+            if name not in self.group:
+                self.__create_column(
+                    self.group, name, (2,), np.int64, self.ranges_per_chunk)
+            self.__append(name, np.array([[begin, end]], dtype=np.int64))
+
+        return order
+
+    def __append(self, name, data):
+
+        dataset = self.group[name]
+        if hasattr(dataset, 'append'):
+            # zarr
+            dataset.append(data)
+        else:
+            # h5py
+            num_rows = dataset.shape[0]
+            dataset.resize(num_rows + len(data), axis=0)
+            dataset[num_rows:] = data
+
+    def __append_attr(self, name, data):
+
+        if name not in self.group:
+            self.__create_column(self.group, name, data.shape[1:], data.dtype)
+        self.__append(name, data)
+
+    @staticmethod
+    def __create_column(group, name, shape, dtype, rows_per_chunk=None):
+
+        if rows_per_chunk is None:
+            rows_per_chunk = GraphStore.rows_per_chunk
+
+        kwargs = {}
+        if not hasattr(group, 'store'):
+            # h5py needs to know which dimension can grow
+            kwargs['maxshape'] = (None,) + tuple(shape)
+
+        group.create_dataset(
+            name,
+            shape=(0,) + tuple(shape),
+            chunks=(rows_per_chunk,) + tuple(shape),
+            dtype=dtype,
+            **kwargs)
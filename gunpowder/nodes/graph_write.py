@@ -0,0 +1,185 @@
+import logging
+import multiprocessing
+import numpy as np
+import os
+
+from .batch_filter import BatchFilter
+from gunpowder.batch_request import BatchRequest
+from .graph_store import GraphStore, open_graph_container
+
+logger = logging.getLogger(__name__)
+
+
+class GraphWrite(BatchFilter):
+    '''Append graphs of passing batches to one zarr or HDF5 container. This is
+    useful to store graphs produced by :class:`Scan` on disk without keeping
+    the whole graph in memory. The graphs can be read again with
+    :class:`GraphSource`.
+
+    Only nodes inside the requested ROI of each graph are stored, each node
+    only once (the first time it is seen). Edges are stored together with
+    the first of their nodes to be stored.
+
+    The container is created when the pipeline is set up. Appends are
+    serialized with a lock, such that this node can be used upstream of a
+    :class:`Scan` with several workers.
+
+    Args:
+
+        dataset_names (``dict``, :class:`GraphKey` -> ``string``):
+
+            A dictionary from graph keys to names of the groups to store them
+            in. Existing groups of the same name are replaced.
+
+        output_dir (``string``):
+
+            The directory to save the container. Will be created, if it does
+            not exist.
+
+        output_filename (``string``):
+
+            The output filename of the container. Files ending in ``.zarr`` or
+            ``.n5`` are written with zarr, all others with h5py.
+
+        block_size (:class:`Coordinate`, optional):
+
+            The size of the blocks of the spatial index in world units.
+            Requests to :class:`GraphSource` read all blocks intersecting the
+            requested ROI. Defaults to the shape of the first written request,
+            i.e., the chunk size of :class:`Scan`.
+
+        node_attrs (``list`` of ``string``, optional):
+
+            Names of node attributes to store. Attributes have to have the
+            same shape and type for all nodes.
+
+        edge_attrs (``list`` of ``string``, optional):
+
+            Names of edge attributes to store, see ``node_attrs``.
+    '''
+
+    def __init__(
+            self,
+            dataset_names,
+            output_dir='.',
+            output_filename='graphs.zarr',
+            block_size=None,
+            node_attrs=None,
+            edge_attrs=None):
+
+        self.dataset_names = dataset_names
+        self.output_dir = output_dir
+        self.output_filename = output_filename
+        self.block_size = block_size
+        self.node_attrs = [] if node_attrs is None else list(node_attrs)
+        self.edge_attrs = [] if edge_attrs is None else list(edge_attrs)
+
+        self.lock = None
+
+    def setup(self):
+        for key in self.dataset_names.keys():
+            self.updates(key, self.spec[key])
+        self.enable_autoskip()
+
+        self.init_datasets()
+
+        # created before workers are started downstream, to be shared with
+        # them
+        self.lock = multiprocessing.Lock()
+
+    def __getstate__(self):
+
+        # the lock can only be shared through inheritance, but this node might
+        # be pickled as part of an error raised in a worker process
+        state = self.__dict__.copy()
+        state['lock'] = None
+        return state
+
+    def prepare(self, request):
+        deps = BatchRequest()
+        for key in self.dataset_names.keys():
+            deps[key] = request[key]
+        return deps
+
+    def init_datasets(self):
+
+        filename = os.path.join(self.output_dir, self.output_filename)
+        logger.debug("Initializing container %s", filename)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with open_graph_container(filename, 'a') as data_file:
+            for graph_key, dataset_name in self.dataset_names.items():
+
+                provided_roi = self.spec[graph_key].roi
+
+                store = GraphStore.create(
+                    data_file,
+                    dataset_name,
+                    provided_roi.dims(),
+                    self.block_size,
+                    self.spec[graph_key].directed,
+                    self.node_attrs,
+                    self.edge_attrs)
+
+                if not provided_roi.unbounded():
+                    store.group.attrs['offset'] = provided_roi.get_offset()
+                    store.group.attrs['shape'] = provided_roi.get_shape()
+
+    def process(self, batch, request):
+
+        filename = os.path.join(self.output_dir, self.output_filename)
+
+        with self.lock, open_graph_container(filename, 'a') as data_file:
+            for graph_key, dataset_name in self.dataset_names.items():
+
+                graph = batch.graphs[graph_key]
+                roi = request[graph_key].roi
+
+                store = GraphStore(data_file[dataset_name])
+                if store.block_size is None:
+                    store.set_block_size(roi.get_shape())
+
+                # nodes stored with earlier batches, possibly by another
+                # worker
+                written_ids = set(store.stored(
+                    [node.id for node in graph.nodes],
+                    [node.location for node in graph.nodes]).tolist())
+
+                # new nodes inside the requested ROI
+                contained = graph.contained_nodes(roi)
+                nodes = [
+                    node for node in graph.nodes
+                    if node.id in contained and node.id not in written_ids
+                ]
+                new_ids = set(node.id for node in nodes)
+
+                # edges of new nodes that have not been stored with their other
+                # node before
+                edges = [
+                    edge for edge in graph.edges
+                    if (edge.u in new_ids or edge.v in new_ids) and not (
+                        edge.u in written_ids or edge.v in written_ids)
+                ]
+
+                logger.debug(
+                    "Writing %d nodes and %d edges of %s",
+                    len(nodes), len(edges), graph_key)
+
+                store.append(
+                    np.array([node.id for node in nodes], dtype=np.int64),
+                    np.array([node.location for node in nodes]),
+                    {
+                        name: np.array([node.attrs[name] for node in nodes])
+                        for name in self.node_attrs
+                    },
+                    np.array([(edge.u, edge.v) for edge in edges]),
+                    np.array([
+                        (graph.node(edge.u).location,
+                         graph.node(edge.v).location)
+                        for edge in edges
+                    ]),
+                    {
+                        name: np.array([edge.all[name] for edge in edges])
+                        for name in self.edge_attrs
+                    })
@@ -1,5 +1,4 @@
 import numpy as np
-from scipy import ndimage
 
 from .batch_filter import BatchFilter
 from gunpowder.array import Array
@@ -67,27 +66,67 @@ class GrowBoundary(BatchFilter):
 
         if only_xy:
             assert len(gt.shape) == 3
-            for z in range(gt.shape[0]):
-                self.__grow(gt[z], None if gt_mask is None else gt_mask[z])
-            return
 
-        # get all foreground voxels by erosion of each component
-        foreground = np.zeros(shape=gt.shape, dtype=np.bool)
+        # A voxel stays foreground if all unmasked voxels within 'steps'
+        # (along the axes, i.e., in a diamond-shaped neighborhood) have its
+        # label. This is the same as eroding each label separately (treating
+        # masked voxels as part of the label), but independent of the number
+        # of labels: the minimal and maximal label in the neighborhood of each
+        # voxel are found by repeatedly comparing with the direct neighbors.
+        axes = range(1, gt.ndim) if only_xy else range(gt.ndim)
+
+        if np.issubdtype(gt.dtype, np.integer):
+            lowest, highest = np.iinfo(gt.dtype).min, np.iinfo(gt.dtype).max
+        else:
+            lowest, highest = -np.inf, np.inf
+
+        # masked voxels are ignored by replacing them with a value that does
+        # not change the min and max
         masked = None
         if gt_mask is not None:
             masked = np.equal(gt_mask, 0)
-        for label in np.unique(gt):
-            if label == self.background:
-                continue
-            label_mask = gt==label
-            # Assume that masked out values are the same as the label we are
-            # eroding in this iteration. This ensures that at the boundary to
-            # a masked region the value blob is not shrinking.
-            if masked is not None:
-                label_mask = np.logical_or(label_mask, masked)
-            eroded_label_mask = ndimage.binary_erosion(label_mask, iterations=self.steps, border_value=1)
-            foreground = np.logical_or(eroded_label_mask, foreground)
+            max_label = np.where(masked, gt.dtype.type(lowest), gt)
+            min_label = np.where(masked, gt.dtype.type(highest), gt)
+        else:
+            max_label = gt.copy()
+            min_label = gt.copy()
+
+        for _ in range(self.steps):
+            self.__filter_neighbors(max_label, np.maximum, axes)
+            self.__filter_neighbors(min_label, np.minimum, axes)
+
+        uniform = min_label == max_label
+        foreground = np.logical_and(uniform, max_label != self.background)
+
+        if masked is not None:
+
+            # masked voxels without unmasked neighbors are kept if there is
+            # any label (in the same section, if only_xy)
+            if only_xy:
+                has_labels = np.any(
+                    gt != self.background,
+                    axis=tuple(range(1, gt.ndim)),
+                    keepdims=True)
+            else:
+                has_labels = np.any(gt != self.background)
+            isolated = np.logical_and(masked, min_label > max_label)
+            foreground |= np.logical_and(isolated, has_labels)
 
         # label new background
         background = np.logical_not(foreground)
         gt[background] = self.background
+
+    def __filter_neighbors(self, array, function, axes):
+        '''Replace each element of 'array' with 'function' applied to it and
+        its direct neighbors along 'axes'. Voxels outside are ignored.'''
+
+        source = array.copy()
+        for axis in axes:
+            lower = [slice(None)]*array.ndim
+            upper = [slice(None)]*array.ndim
+            lower[axis] = slice(None, -1)
+            upper[axis] = slice(1, None)
+            lower = tuple(lower)
+            upper = tuple(upper)
+            function(array[lower], source[upper], out=array[lower])
+            function(array[upper], source[lower], out=array[upper])
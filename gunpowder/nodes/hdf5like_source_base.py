@@ -107,6 +107,7 @@ class Hdf5LikeSource(BatchProvider):
                 batch.arrays[array_key] = Array(
                     self.__read(data_file, self.datasets[array_key], dataset_roi),
                     array_spec)
+                timing.add_array_bytes(batch.arrays[array_key].data.nbytes)
 
         logger.debug("done")
 
@@ -121,6 +121,24 @@ class PreCache(BatchFilter):
 
         return batch
 
+    def get_pool_state(self):
+        '''Get the state of the worker pool as a ``dict`` with keys
+        ``queued``, ``capacity``, ``workers``, ``workers_alive``, and
+        ``watch_dog_alive``. Returns ``None`` if no workers were started,
+        yet.'''
+
+        workers = self.workers
+        if workers is None:
+            return None
+
+        return {
+            'queued': workers.num_queued(),
+            'capacity': workers.capacity(),
+            'workers': workers.num_workers(),
+            'workers_alive': workers.num_workers_alive(),
+            'watch_dog_alive': workers.watch_dog_alive()
+        }
+
     def __run_worker(self, i):
         request = copy.deepcopy(self.current_request)
         # Note that using a precache node breaks determinism in batches recieved since we do not
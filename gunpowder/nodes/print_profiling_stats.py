@@ -1,4 +1,5 @@
 import logging
+import tracemalloc
 
 from .batch_filter import BatchFilter
 from gunpowder.profiling import Timing, TimingSummary, ProfilingStats
@@ -19,11 +20,23 @@ class PrintProfilingStats(BatchFilter):
 
             Collect statistics about that many batch requests and show min,
             max, mean, and median runtimes.
+
+        profile_memory (``bool``, optional):
+
+            If set, trace memory allocations with ``tracemalloc`` while the
+            pipeline is built and additionally show, in MB, the mean net
+            memory allocated (``ALLOC``), the maximal peak of memory allocated
+            (``PEAK``), and the mean size of arrays added to the batch
+            (``ARRAYS``) per node and method. Tracing slows down the pipeline
+            considerably and should only be used to find memory
+            bottlenecks.
     '''
 
-    def __init__(self, every=1):
+    def __init__(self, every=1, profile_memory=False):
 
         self.every = every
+        self.profile_memory = profile_memory
+        self.__started_tracing = False
         self.n = 0
         self.accumulated_stats = ProfilingStats()
         self.__upstream_timing = Timing(self)
@@ -31,6 +44,18 @@ class PrintProfilingStats(BatchFilter):
         self.__downstream_timing = Timing(self)
         self.__downstream_timing_summary = TimingSummary()
 
+    def setup(self):
+
+        if self.profile_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+
+    def teardown(self):
+
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
     def prepare(self, request):
 
         self.__downstream_timing.stop()
@@ -72,6 +97,10 @@ class PrintProfilingStats(BatchFilter):
         stats += "MAX".ljust(10)
         stats += "MEAN".ljust(10)
         stats += "MEDIAN".ljust(10)
+        if self.profile_memory:
+            stats += "ALLOC".ljust(10)
+            stats += "PEAK".ljust(10)
+            stats += "ARRAYS".ljust(10)
         stats += "\n"
 
         summaries = list(self.accumulated_stats.get_timing_summaries().items())
@@ -87,6 +116,10 @@ class PrintProfilingStats(BatchFilter):
                 stats += ("%.2f"%summary.max())[:9].ljust(10)
                 stats += ("%.2f"%summary.mean())[:9].ljust(10)
                 stats += ("%.2f"%summary.median())[:9].ljust(10)
+                if self.profile_memory and summary.memory_profiled():
+                    stats += ("%.2f"%(summary.mean_allocated_bytes()/2**20))[:9].ljust(10)
+                    stats += ("%.2f"%(summary.max_peak_bytes()/2**20))[:9].ljust(10)
+                    stats += ("%.2f"%(summary.mean_array_bytes()/2**20))[:9].ljust(10)
                 stats += "\n"
 
         stats += "\n"
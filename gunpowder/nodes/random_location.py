@@ -137,12 +137,11 @@ class RandomLocation(BatchFilter):
             nonempty_request = BatchRequest({self.ensure_nonempty: graph_spec})
             nonempty_batch = upstream.request_batch(nonempty_request)
 
-            self.points = cKDTree(
-                [p.location for p in nonempty_batch[self.ensure_nonempty].nodes]
-            )
+            locations = nonempty_batch[self.ensure_nonempty].locations
+            self.points = cKDTree(locations)
 
             point_counts = self.points.query_ball_point(
-                [p.location for p in nonempty_batch[self.ensure_nonempty].nodes],
+                locations,
                 r=self.point_balance_radius,
             )
             weights = [1 / len(point_count) for point_count in point_counts]
@@ -10,7 +10,10 @@ from gunpowder.array_spec import ArraySpec
 from gunpowder.batch_request import BatchRequest
 from gunpowder.coordinate import Coordinate
 from gunpowder.freezable import Freezable
-from gunpowder.morphology import enlarge_binary_map, create_ball_kernel
+from gunpowder.morphology import (
+    enlarge_binary_map,
+    create_ball_kernel,
+    stamp_kernel)
 from gunpowder.ndarray import replace
 from gunpowder.graph import GraphKey
 from gunpowder.graph_spec import GraphSpec
@@ -218,7 +221,7 @@ class RasterizeGraph(BatchFilter):
         logger.debug("Data roi in voxels: %s", data_roi)
         logger.debug("Data roi in world units: %s", data_roi*voxel_size)
 
-        if graph.num_vertices == 0:
+        if graph.num_vertices() == 0:
             # If there are no nodes at all, just create an empty matrix.
             rasterized_graph_data = np.zeros(
                 data_roi.get_shape(), dtype=self.spec[self.array].dtype
@@ -226,39 +229,49 @@ class RasterizeGraph(BatchFilter):
         elif mask is not None:
 
             mask_array = batch.arrays[mask].crop(enlarged_vol_roi)
-            # get those component labels in the mask, that contain graph
-            labels = []
-            for i, point in graph.data.items():
-                v = Coordinate(point.location / voxel_size)
-                v -= data_roi.get_begin()
-                labels.append(mask_array.data[v])
-            # Make list unique
-            labels = list(set(labels))
-
-            # zero label should be ignored
-            if 0 in labels:
-                labels.remove(0)
-
-            if len(labels) == 0:
-                logger.debug("Graph and provided object mask do not overlap. No graph to rasterize.")
-                rasterized_graph_data = np.zeros(data_roi.get_shape(),
-                                                  dtype=self.spec[self.array].dtype)
+
+            if self.settings.mode == "ball":
+
+                # all labels at once, each node only stamped where the mask
+                # has the label of the node
+                rasterized_graph_data = self.__rasterize_masked(
+                    graph,
+                    data_roi,
+                    voxel_size,
+                    self.spec[self.array].dtype,
+                    self.settings,
+                    mask_array.data)
+
             else:
-                # create data for the whole graph ROI, "or"ed together over
-                # individual object masks
-                rasterized_graph_data = np.sum(
-                    [
-                        self.__rasterize(
-                            graph,
-                            data_roi,
-                            voxel_size,
-                            self.spec[self.array].dtype,
-                            self.settings,
-                            Array(data=mask_array.data==label, spec=mask_array.spec))
-
-                        for label in labels
-                    ],
-                    axis=0)
+
+                # get those component labels in the mask, that contain graph
+                voxels = (graph.locations/voxel_size).astype(np.int64)
+                voxels -= np.array(data_roi.get_begin())
+                labels = np.unique(mask_array.data[tuple(voxels.T)])
+
+                # zero label should be ignored
+                labels = labels[labels != 0]
+
+                if len(labels) == 0:
+                    logger.debug(
+                        "Graph and provided object mask do not overlap. No "
+                        "graph to rasterize.")
+
+                # "or" individual object masks together, peaks are normalized
+                # per object
+                rasterized_graph_data = np.zeros(
+                    data_roi.get_shape(),
+                    dtype=self.spec[self.array].dtype)
+                for label in labels:
+                    rasterized_graph_data += self.__rasterize(
+                        graph,
+                        data_roi,
+                        voxel_size,
+                        self.spec[self.array].dtype,
+                        self.settings,
+                        Array(
+                            data=mask_array.data==label,
+                            spec=mask_array.spec))
 
         else:
 
@@ -298,30 +311,42 @@ class RasterizeGraph(BatchFilter):
         # prepare output array
         rasterized_graph = np.zeros(data_roi.get_shape(), dtype=dtype)
 
-        # Fast rasterization currently only implemented for mode ball without
-        # inner radius set
+        # Fast rasterization by stamping kernels currently only implemented
+        # for mode ball without inner radius and edges, otherwise the drawn
+        # graph is grown blockwise around the skeleton (see
+        # enlarge_binary_map)
         use_fast_rasterization = (
             settings.mode == "ball"
             and settings.inner_radius_fraction is None
-            and len(list(graph.edges)) == 0
+            and (not settings.edges or len(list(graph.edges)) == 0)
         )
 
         if use_fast_rasterization:
 
-            dims = len(rasterized_graph.shape)
-
             # get structuring element for mode ball
             ball_kernel = create_ball_kernel(settings.radius, voxel_size)
-            radius_voxel = Coordinate(np.array(ball_kernel.shape)/2)
-            data_roi_base = Roi(
-                    offset=Coordinate((0,)*dims),
-                    shape=Coordinate(rasterized_graph.shape))
-            kernel_roi_base = Roi(
-                    offset=Coordinate((0,)*dims),
-                    shape=Coordinate(ball_kernel.shape))
+
+        if not use_fast_rasterization and settings.color_attr is None:
+
+            # all nodes get the same value, draw them at once
+            voxels = (graph.locations/voxel_size).astype(np.int64)
+            voxels -= np.array(data_roi.get_begin())
+            voxels = tuple(voxels.T)
+
+            # skip graph outside of mask
+            if mask is not None:
+                inside = mask[voxels] != 0
+                voxels = tuple(v[inside] for v in voxels)
+
+            rasterized_graph[voxels] = 1
+            nodes = []
+
+        else:
+
+            nodes = graph.nodes
 
         # Rasterize volume either with single voxel or with defined struct elememt
-        for node in graph.nodes:
+        for node in nodes:
 
             # get the voxel coordinate, 'Coordinate' ensures integer
             v = Coordinate(node.location/voxel_size)
@@ -340,17 +365,7 @@ class RasterizeGraph(BatchFilter):
 
             if use_fast_rasterization:
 
-                # Calculate where to crop the kernel mask and the rasterized array
-                shifted_kernel = kernel_roi_base.shift(v - radius_voxel)
-                shifted_data = data_roi_base.shift(-(v - radius_voxel))
-                arr_crop = data_roi_base.intersect(shifted_kernel)
-                kernel_crop = kernel_roi_base.intersect(shifted_data)
-                arr_crop_ind = arr_crop.get_bounding_box()
-                kernel_crop_ind = kernel_crop.get_bounding_box()
-
-                rasterized_graph[arr_crop_ind] = np.logical_or(
-                    ball_kernel[kernel_crop_ind], rasterized_graph[arr_crop_ind]
-                )
+                stamp_kernel(rasterized_graph, ball_kernel, v)
 
             else:
 
@@ -369,24 +384,7 @@ class RasterizeGraph(BatchFilter):
                     c = 1
                 rasterized_graph[v] = c
         if settings.edges:
-            for e in graph.edges:
-                if settings.color_attr is not None:
-                    c = graph.edges[e].get(settings.color_attr)
-                    if c is None:
-                        continue
-                    elif np.isclose(c, 1) and not np.isclose(settings.fg_value, 1):
-                        logger.warning(
-                            f"Edge {e} is being colored with color {c} according to "
-                            f"attribute {settings.color_attr} "
-                            f"but color 1 will be replaced with fg_value: {settings.fg_value}"
-                            )
-
-                u = graph.node(e.u)
-                v = graph.node(e.v)
-                u_coord = Coordinate(u.location / voxel_size)
-                v_coord = Coordinate(v.location / voxel_size)
-                line = draw.line_nd(u_coord, v_coord, endpoint=True)
-                rasterized_graph[line] = 1
+            self.__draw_edges(graph, data_roi, voxel_size, settings, rasterized_graph)
 
         # grow graph
         if not use_fast_rasterization:
@@ -421,3 +419,103 @@ class RasterizeGraph(BatchFilter):
                 rasterized_graph *= mask
 
         return rasterized_graph
+
+    def __rasterize_masked(self, graph, data_roi, voxel_size, dtype, settings, mask):
+        '''Rasterize 'graph' in mode ball, restricted to the object in 'mask'
+        each node is contained in. Equivalent to rasterizing the graph
+        separately for each object and combining the results, but in a single
+        pass over the nodes and a single output array.'''
+
+        shape = data_roi.get_shape()
+        ring_fraction = settings.inner_radius_fraction
+
+        # the object label of each node, nodes outside of objects are skipped
+        voxels = (graph.locations/voxel_size).astype(np.int64)
+        voxels -= np.array(data_roi.get_begin())
+        node_labels = mask[tuple(voxels.T)]
+        voxels = voxels[node_labels != 0]
+        node_labels = node_labels[node_labels != 0]
+
+        rasterized_graph = np.zeros(shape, dtype=dtype)
+
+        if len(node_labels) == 0:
+            logger.debug(
+                "Graph and provided object mask do not overlap. No graph to "
+                "rasterize.")
+            return rasterized_graph
+
+        # edges are drawn into every object they pass through: draw and grow
+        # them once, without mask
+        edges = np.zeros(shape, dtype=np.uint8)
+        if settings.edges:
+            self.__draw_edges(graph, data_roi, voxel_size, settings, edges)
+
+        if edges.any():
+            outer = enlarge_binary_map(
+                edges,
+                settings.radius,
+                voxel_size).astype(bool)
+            if ring_fraction is not None:
+                ring = enlarge_binary_map(
+                    edges,
+                    settings.radius,
+                    voxel_size,
+                    ring_fraction).astype(bool)
+                inner = outer & np.logical_not(ring)
+        else:
+            outer = np.zeros(shape, dtype=bool)
+            inner = np.zeros(shape, dtype=bool)
+
+        # stamp balls (and inner balls) for each node that is not already
+        # part of an edge, only where the mask has the node's label
+        ball_kernel = create_ball_kernel(settings.radius, voxel_size)
+        kernels = [(outer, ball_kernel)]
+        if ring_fraction is not None:
+            ring_kernel = create_ball_kernel(
+                settings.radius,
+                voxel_size,
+                ring_fraction)
+            kernels.append((inner, ball_kernel & np.logical_not(ring_kernel)))
+
+        for v, label in zip(voxels, node_labels):
+
+            if edges[tuple(v)]:
+                continue
+
+            for target, kernel in kernels:
+                stamp_kernel(target, kernel, v, mask=mask, label=label)
+
+        # restrict the grown edges to objects that contain nodes
+        labels = np.unique(node_labels)
+        inside = np.isin(mask, labels)
+        outer &= inside
+
+        if ring_fraction is not None:
+            outer &= np.logical_not(inner)
+
+        rasterized_graph[outer] = 1
+
+        return rasterized_graph
+
+    def __draw_edges(self, graph, data_roi, voxel_size, settings, array):
+        '''Draw the edges of 'graph' as lines into 'array'.'''
+
+        for e in graph.edges:
+            if settings.color_attr is not None:
+                c = graph.edges[e].get(settings.color_attr)
+                if c is None:
+                    continue
+                elif np.isclose(c, 1) and not np.isclose(settings.fg_value, 1):
+                    logger.warning(
+                        f"Edge {e} is being colored with color {c} according to "
+                        f"attribute {settings.color_attr} "
+                        f"but color 1 will be replaced with fg_value: {settings.fg_value}"
+                        )
+
+            u = graph.node(e.u)
+            v = graph.node(e.v)
+            u_coord = Coordinate(u.location / voxel_size) - data_roi.get_begin()
+            v_coord = Coordinate(v.location / voxel_size) - data_roi.get_begin()
+            line = draw.line_nd(u_coord, v_coord, endpoint=True)
+            array[line] = 1
+
@@ -127,6 +127,9 @@ class Scan(BatchFilter):
         # at least that far
         lcm_voxel_size = self.spec.get_lcm_voxel_size(
             self.reference.array_specs.keys())
+        if lcm_voxel_size is None:
+            # graphs only
+            lcm_voxel_size = Coordinate((1,)*self.reference.get_total_roi().dims())
 
         # that's just the minimal size in each dimension
         for key, reference_spec in self.reference.items():
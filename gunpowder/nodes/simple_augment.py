@@ -6,6 +6,7 @@ import numpy as np
 
 from .batch_filter import BatchFilter
 from gunpowder.coordinate import Coordinate
+from gunpowder.profiling import count_allocation
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +48,15 @@ class SimpleAugment(BatchFilter):
             and attempt to weight them appropriately. A weight of 0 means
             this axis will never be transposed, a weight of 1 means this axis
             will always be transposed.
+
+        contiguous (``bool``, optional):
+
+            Mirroring and transposing produces strided views of the upstream
+            data, no data is copied. Nodes that hand arrays to a model (like
+            the ``torch`` :class:`Train` and :class:`Predict`) make them
+            contiguous only once at that point. Set this to ``True`` to copy
+            the arrays into contiguous memory here instead, e.g., if
+            downstream nodes require contiguous data.
     """
 
     def __init__(
@@ -55,12 +65,14 @@ class SimpleAugment(BatchFilter):
         transpose_only=None,
         mirror_probs=None,
         transpose_probs=None,
+        contiguous=False,
     ):
 
         self.mirror_only = mirror_only
         self.mirror_probs = mirror_probs
         self.transpose_only = transpose_only
         self.transpose_probs = transpose_probs
+        self.contiguous = contiguous
         self.mirror_mask = None
         self.dims = None
         self.transpose_dims = None
@@ -102,7 +114,7 @@ class SimpleAugment(BatchFilter):
             for k, v in self.transpose_probs.items():
                 valid = True
                 for i, j in enumerate(k):
-                    if i not in self.transpose_only and i != j:
+                    if i not in self.transpose_dims and i != j:
                         valid = False
                 if valid:
                     self.permutation_dict[k] = v
@@ -179,12 +191,16 @@ class SimpleAugment(BatchFilter):
             num_channels = len(array.data.shape) - self.dims
             channel_slices = (slice(None, None),) * num_channels
 
+            # views only, the data is copied once when it needs to be
+            # contiguous
             array.data = array.data[channel_slices + mirror]
 
             transpose = [t + num_channels for t in self.transpose]
-            array.data = array.data = array.data.transpose(
-                list(range(num_channels)) + transpose
-            )
+            array.data = array.data.transpose(list(range(num_channels)) + transpose)
+
+            if self.contiguous and not array.data.flags.c_contiguous:
+                array.data = np.ascontiguousarray(array.data)
+                count_allocation("array_data")
 
         # graphs
         total_roi_offset = total_roi.get_offset()
@@ -203,40 +219,28 @@ class SimpleAugment(BatchFilter):
                 continue
 
             logger.debug("converting nodes in graph %s", graph_key)
-            for node in list(graph.nodes):
-
-                logger.debug("old location: %s, %s", node.id, node.location)
-
-                # mirror
-                location_in_total_offset = np.asarray(node.location) - total_roi_offset
-                node.location = np.asarray(
-                    [
-                        total_roi_end[dim] - location_in_total_offset[dim]
-                        if m
-                        else node.location[dim]
-                        for dim, m in enumerate(self.mirror)
-                    ],
-                    dtype=graph.spec.dtype,
-                )
-
-                logger.debug("after mirror: %s, %s", node.id, node.location)
-
-                # transpose
-                location_in_total_center = np.asarray(node.location) - total_roi_center
-
-                if self.transpose != list(range(self.dims)):
-                    for d in range(self.dims):
-                        node.location[d] = (
-                            location_in_total_center[self.transpose[d]]
-                            + total_roi_center[d]
-                        )
-
-                logger.debug("after transpose: %s, %s", node.id, node.location)
-
-                # due to the mirroring, points at the lower boundary of the ROI
-                # could fall on the upper one, which excludes them from the ROI
-                if not graph.spec.roi.contains(node.location):
-                    graph.remove_node(node)
+            locations = graph.locations
+
+            # mirror
+            locations = np.where(
+                self.mirror,
+                np.asarray(total_roi_end) - (locations - np.asarray(total_roi_offset)),
+                locations,
+            ).astype(graph.spec.dtype)
+
+            # transpose
+            if self.transpose != list(range(self.dims)):
+                center = np.asarray(total_roi_center)
+                locations = (locations - center)[:, self.transpose] + center
+
+            graph.locations = locations
+
+            # due to the mirroring, points at the lower boundary of the ROI
+            # could fall on the upper one, which excludes them from the ROI
+            contained_nodes = graph.contained_nodes(graph.spec.roi)
+            for node_id in graph.node_ids:
+                if node_id not in contained_nodes:
+                    graph.remove_node(graph.node(node_id))
 
     def __mirror_request(self, request, mirror):
 
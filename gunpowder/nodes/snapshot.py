@@ -1,6 +1,8 @@
+import collections
 import logging
 import numpy as np
 import os
+import threading
 
 from .batch_filter import BatchFilter
 from gunpowder.batch_request import BatchRequest
@@ -60,6 +62,21 @@ class Snapshot(BatchFilter):
         store_value_range (``bool``):
 
             If set to ``True``, store range of values in data set attributes.
+
+        write_in_background (``bool``):
+
+            If set to ``True``, snapshots are written by a separate thread,
+            such that the pipeline does not have to wait for them to be
+            written. The arrays and graphs of a batch are handed over by
+            reference, downstream nodes should therefore not modify them in
+            place.
+
+        max_pending (``int``):
+
+            How many snapshots to keep at most while waiting for the
+            background writer. If the writer falls behind, the oldest pending
+            snapshots are dropped. Only used if ``write_in_background`` is
+            set.
         """
 
     def __init__(
@@ -72,6 +89,8 @@ class Snapshot(BatchFilter):
         compression_type=None,
         dataset_dtypes=None,
         store_value_range=False,
+        write_in_background=False,
+        max_pending=2,
     ):
         self.dataset_names = dataset_names
         self.output_dir = output_dir
@@ -90,8 +109,15 @@ class Snapshot(BatchFilter):
 
         self.mode = "w"
 
+        self.write_in_background = write_in_background
+        self.max_pending = max_pending
+        self.writer = None
+
     def setup(self):
 
+        if self.write_in_background:
+            self.writer = SnapshotWriter(self.__write, self.max_pending)
+
         for key, _ in self.additional_request.items():
             assert key in self.dataset_names, (
                 "%s requested but not in dataset_names"% key)
@@ -128,100 +154,185 @@ class Snapshot(BatchFilter):
 
         return deps
 
+    def teardown(self):
+
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+
     def process(self, batch, request):
 
         if self.record_snapshot:
 
-            try:
-                os.makedirs(self.output_dir)
-            except:
-                pass
-
             snapshot_name = os.path.join(
                 self.output_dir,
                 self.output_filename.format(
                     id=str(batch.id).zfill(8), iteration=int(batch.iteration or 0)
                 ),
             )
-            logger.info("saving to %s" % snapshot_name)
-            if snapshot_name.endswith(".hdf"):
-                open_func = h5py.File
-            elif snapshot_name.endswith(".zarr"):
-                open_func = ZarrFile
+
+            arrays = {
+                key: array
+                for key, array in batch.arrays.items()
+                if key in self.dataset_names
+            }
+            voxel_sizes = {
+                key: self.spec[key].voxel_size
+                for key in arrays.keys()
+            }
+            graphs = {
+                key: graph
+                for key, graph in batch.graphs.items()
+                if key in self.dataset_names
+            }
+
+            args = (snapshot_name, arrays, voxel_sizes, graphs, batch.loss)
+            if self.writer is not None:
+                self.writer.put(*args)
             else:
-                logger.warning("ambiguous file type")
-                open_func = h5py.File
-
-            with open_func(snapshot_name, self.mode) as f:
-                for (array_key, array) in batch.arrays.items():
-
-                    if array_key not in self.dataset_names:
-                        continue
-
-                    ds_name = self.dataset_names[array_key]
-
-                    if array_key in self.dataset_dtypes:
-                        dtype = self.dataset_dtypes[array_key]
-                        dataset = f.create_dataset(
-                            name=ds_name,
-                            data=array.data.astype(dtype),
-                            compression=self.compression_type,
-                        )
-
-                    else:
-                        dataset = f.create_dataset(
-                            name=ds_name,
-                            data=array.data,
-                            compression=self.compression_type,
-                        )
-
-                    if not array.spec.nonspatial:
-                        if array.spec.roi is not None:
-                            dataset.attrs["offset"] = array.spec.roi.get_offset()
-                        dataset.attrs["resolution"] = self.spec[array_key].voxel_size
-
-                    if self.store_value_range:
-                        dataset.attrs["value_range"] = (
-                            np.asscalar(array.data.min()),
-                            np.asscalar(array.data.max()),
-                        )
-
-                    # if array has attributes, add them to the dataset
-                    for attribute_name, attribute in array.attrs.items():
-                        dataset.attrs[attribute_name] = attribute
-
-                for (graph_key, graph) in batch.graphs.items():
-                    if graph_key not in self.dataset_names:
-                        continue
-
-                    ds_name = self.dataset_names[graph_key]
-
-                    node_ids = []
-                    locations = []
-                    edges = []
-                    for node in graph.nodes:
-                        node_ids.append(node.id)
-                        locations.append(node.location)
-                    for edge in graph.edges:
-                        edges.append((edge.u, edge.v))
-
-                    f.create_dataset(
-                        name=f"{ds_name}-ids",
-                        data=np.array(node_ids, dtype=int),
+                self.__write(*args)
+
+        self.n += 1
+
+    def __write(self, snapshot_name, arrays, voxel_sizes, graphs, loss):
+
+        try:
+            os.makedirs(self.output_dir)
+        except:
+            pass
+
+        logger.info("saving to %s" % snapshot_name)
+        if snapshot_name.endswith(".hdf"):
+            open_func = h5py.File
+        elif snapshot_name.endswith(".zarr"):
+            open_func = ZarrFile
+        else:
+            logger.warning("ambiguous file type")
+            open_func = h5py.File
+
+        with open_func(snapshot_name, self.mode) as f:
+            for (array_key, array) in arrays.items():
+
+                ds_name = self.dataset_names[array_key]
+
+                if array_key in self.dataset_dtypes:
+                    dtype = self.dataset_dtypes[array_key]
+                    dataset = f.create_dataset(
+                        name=ds_name,
+                        data=array.data.astype(dtype),
                         compression=self.compression_type,
                     )
-                    f.create_dataset(
-                        name=f"{ds_name}-locations",
-                        data=np.array(locations),
+
+                else:
+                    dataset = f.create_dataset(
+                        name=ds_name,
+                        data=array.data,
                         compression=self.compression_type,
                     )
-                    f.create_dataset(
-                        name=f"{ds_name}-edges",
-                        data=np.array(edges),
-                        compression=self.compression_type,
+
+                if not array.spec.nonspatial:
+                    if array.spec.roi is not None:
+                        dataset.attrs["offset"] = array.spec.roi.get_offset()
+                    dataset.attrs["resolution"] = voxel_sizes[array_key]
+
+                if self.store_value_range:
+                    dataset.attrs["value_range"] = (
+                        array.data.min().item(),
+                        array.data.max().item(),
                     )
 
-                if batch.loss is not None:
-                    f["/"].attrs["loss"] = float(batch.loss)
+                # if array has attributes, add them to the dataset
+                for attribute_name, attribute in array.attrs.items():
+                    dataset.attrs[attribute_name] = attribute
+
+            for (graph_key, graph) in graphs.items():
+
+                ds_name = self.dataset_names[graph_key]
+
+                node_ids = []
+                locations = []
+                edges = []
+                for node in graph.nodes:
+                    node_ids.append(node.id)
+                    locations.append(node.location)
+                for edge in graph.edges:
+                    edges.append((edge.u, edge.v))
+
+                f.create_dataset(
+                    name=f"{ds_name}-ids",
+                    data=np.array(node_ids, dtype=int),
+                    compression=self.compression_type,
+                )
+                f.create_dataset(
+                    name=f"{ds_name}-locations",
+                    data=np.array(locations),
+                    compression=self.compression_type,
+                )
+                f.create_dataset(
+                    name=f"{ds_name}-edges",
+                    data=np.array(edges),
+                    compression=self.compression_type,
+                )
+
+            if loss is not None:
+                f["/"].attrs["loss"] = float(loss)
+
+
+class SnapshotWriter:
+    '''Calls ``write`` in a background thread for snapshots added with
+    :meth:`put`. At most ``max_pending`` snapshots are kept waiting, older
+    ones are dropped.'''
+
+    def __init__(self, write, max_pending):
+
+        self.write = write
+        self.pending = collections.deque(maxlen=max(1, max_pending))
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.error = None
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def put(self, *args):
+
+        with self.condition:
+            self.__check_error()
+            if len(self.pending) == self.pending.maxlen:
+                logger.warning(
+                    "Snapshot writer is falling behind, dropping snapshot %s",
+                    self.pending[0][0])
+            self.pending.append(args)
+            self.condition.notify()
+
+    def stop(self):
+        '''Write all pending snapshots and stop the thread.'''
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+        self.__check_error()
+
+    def __check_error(self):
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Writing a snapshot failed") from error
+
+    def __run(self):
+
+        while True:
+
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                args = self.pending.popleft()
 
-        self.n += 1
+            try:
+                self.write(*args)
+            except Exception as e:
+                logger.exception("Writing snapshot %s failed", args[0])
+                with self.condition:
+                    self.error = e
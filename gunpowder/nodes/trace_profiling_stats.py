@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+
+from .batch_filter import BatchFilter
+
+logger = logging.getLogger(__name__)
+
+class TraceProfilingStats(BatchFilter):
+    '''Record the timings of all nodes upstream of this node in the DAG and
+    write them to a JSON file in the Chrome trace event format. The file can
+    be opened in Perfetto (https://ui.perfetto.dev) or ``chrome://tracing`` to
+    see when each node was running, in which process and thread.
+
+    The trace is written as a JSON array of events, to which new events are
+    appended. The closing bracket is only written when the pipeline is torn
+    down, which trace viewers do not require, i.e., the trace can already be
+    viewed while the pipeline is running.
+
+    Timings of nodes in worker processes (e.g., upstream of a
+    :class:`PreCache`) are collected as well, since they are passed along with
+    each batch.
+
+    Args:
+
+        filename (``string``):
+
+            The file to write the trace to. It will be overwritten when the
+            pipeline is set up.
+
+        every (``int``, optional):
+
+            Append the events of the last batches to the trace every that many
+            batches. If not given, all events are kept in memory and only
+            written when the pipeline is torn down.
+    '''
+
+    def __init__(self, filename, every=None):
+
+        self.filename = filename
+        self.every = every
+        self.n = 0
+        self.events = []
+        self.pids = set()
+        self.num_written = 0
+
+    def setup(self):
+
+        self.n = 0
+        self.events = []
+        self.pids = set()
+        self.num_written = 0
+
+        with open(self.filename, 'w') as f:
+            f.write('[\n')
+
+    def teardown(self):
+
+        self.__write_events()
+
+        with open(self.filename, 'a') as f:
+            f.write('\n]\n')
+
+    def process(self, batch, request):
+
+        summaries = batch.profiling_stats.get_timing_summaries()
+        for summary in summaries.values():
+            for timing in summary.timings:
+                self.__add_events(timing)
+
+        self.n += 1
+        if self.every is not None and self.n % self.every == 0:
+            self.__write_events()
+
+    def __add_events(self, timing):
+
+        pid = timing.get_pid()
+        tid = timing.get_tid()
+        if pid is None:
+            # never started
+            return
+
+        name = timing.get_node_name()
+        if timing.get_method_name() is not None:
+            name += "." + timing.get_method_name()
+
+        args = {"batch": self.n}
+        if timing.memory_profiled():
+            args["allocated_bytes"] = int(timing.allocated_bytes())
+            args["peak_bytes"] = int(timing.peak_bytes())
+        if timing.array_bytes() > 0:
+            args["array_bytes"] = int(timing.array_bytes())
+
+        for start, stop in timing.intervals():
+            self.events.append({
+                "name": name,
+                "cat": timing.get_node_name(),
+                "ph": "X",
+                "ts": start*1e6,
+                "dur": (stop - start)*1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": args
+            })
+
+        if pid not in self.pids:
+            self.pids.add(pid)
+            self.events.append({
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {
+                    "name": (
+                        "main" if pid == os.getpid() else "worker %d" % pid)
+                }
+            })
+
+    def __write_events(self):
+        '''Append all events since the last write to the trace.'''
+
+        if not self.events:
+            return
+
+        logger.info(
+            "appending %d events of %d batches to %s",
+            len(self.events), self.n, self.filename)
+
+        with open(self.filename, 'a') as f:
+            for event in self.events:
+                if self.num_written > 0:
+                    f.write(',\n')
+                json.dump(event, f)
+                self.num_written += 1
+
+        self.events = []
@@ -78,9 +78,23 @@ class Pipeline:
 
         return pipeline
 
-    def setup(self):
+    def setup(self, consistency_checks='full'):
         '''Connect all batch providers in the pipeline and call setup for
-        each, from source to sink.'''
+        each, from source to sink.
+
+        Args:
+
+            consistency_checks (``string``, optional):
+
+                Which nodes should check the batches they provide against
+                the request they answer. ``full`` (default) checks at every
+                node, ``boundary`` only at the output node of this pipeline,
+                and ``off`` disables the checks entirely.
+        '''
+
+        assert consistency_checks in ['full', 'boundary', 'off'], (
+            f"consistency_checks has to be one of 'full', 'boundary', or "
+            f"'off', got {consistency_checks}")
 
         def connect(node):
             for child in node.children:
@@ -89,6 +103,14 @@ class Pipeline:
         # connect all nodes
         self.traverse(connect)
 
+        def set_consistency_checks(node):
+            node.output.enable_consistency_checks(
+                consistency_checks == 'full')
+
+        self.traverse(set_consistency_checks)
+        if consistency_checks == 'boundary':
+            self.output.enable_consistency_checks(True)
+
         # call setup on all nodes
         if not self.initialized:
 
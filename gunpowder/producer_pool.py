@@ -28,6 +28,10 @@ class ProducerPool(object):
         self.__watch_dog = multiprocessing.Process(target=self.__run_watch_dog, args=(callables,))
         self.__stop = multiprocessing.Event()
         self.__result_queue = multiprocessing.Queue(queue_size)
+        self.__queue_size = queue_size
+        self.__num_workers = len(callables)
+        # updated by the watch dog
+        self.__num_workers_alive = multiprocessing.Value('i', 0)
 
     def __del__(self):
         self.stop()
@@ -70,6 +74,32 @@ class ProducerPool(object):
             raise item
         return item
 
+    def num_queued(self):
+        '''Number of results waiting in the queue. Returns ``None`` on
+        platforms that do not support querying the queue size.'''
+
+        try:
+            return self.__result_queue.qsize()
+        except NotImplementedError:
+            return None
+
+    def capacity(self):
+        '''Maximal number of results in the queue.'''
+        return self.__queue_size
+
+    def num_workers(self):
+        '''Number of workers in this pool.'''
+        return self.__num_workers
+
+    def num_workers_alive(self):
+        '''Number of workers found alive by the watch dog at its last
+        check (once per second).'''
+        return self.__num_workers_alive.value
+
+    def watch_dog_alive(self):
+        '''Whether the watch dog of this pool is running.'''
+        return self.__watch_dog is not None and self.__watch_dog.is_alive()
+
     def stop(self):
         '''Stop the pool of producers.
 
@@ -96,8 +126,11 @@ class ProducerPool(object):
             logger.debug("starting %d workers"%len(workers))
             for worker in workers:
                 worker.start()
+            self.__num_workers_alive.value = len(workers)
 
             while not self.__stop.wait(1):
+                self.__num_workers_alive.value = sum(
+                    worker.is_alive() for worker in workers)
                 if os.getppid() != parent_pid:
                     logger.error("parent of producer pool died, shutting down")
                     self.__result_queue.put(ParentDied())
@@ -118,6 +151,7 @@ class ProducerPool(object):
             logger.info("joining workers...")
             for worker in workers:
                 worker.join()
+            self.__num_workers_alive.value = 0
 
             logger.info("done")
 
@@ -1,10 +1,38 @@
+from collections import Counter
 import copy
 import numpy as np
+import os
+import threading
 import time
+import tracemalloc
 
 from .freezable import Freezable
 
+# number of allocations per kind in this process, see count_allocation()
+_allocations = Counter()
+
+# Timings that currently trace the memory peak, see Timing.start()
+_peak_timings = set()
+_peak_lock = threading.Lock()
+
+
+def count_allocation(kind, n=1):
+    '''Register the allocation of ``n`` objects of the given kind (e.g.,
+    ``array_spec`` for a copy of an :class:`ArraySpec`). The allocations are
+    attributed to all :class:`Timings<Timing>` running at the time.'''
+    _allocations[kind] += n
+
+
 class Timing(Freezable):
+    '''Measures the time spent in a node or a method of a node.
+
+    If ``tracemalloc`` is tracing memory allocations (see
+    :class:`PrintProfilingStats`), a Timing also keeps track of the bytes
+    allocated between calls to start() and stop(), and the peak of allocated
+    memory above the level at start(). Timings can be nested: before the
+    global peak of ``tracemalloc`` is reset for a new Timing, it is recorded
+    for all Timings that are still running.
+    '''
 
     def __init__(self, node, method_name=None):
         self.__name = type(node).__name__
@@ -13,20 +41,88 @@ class Timing(Freezable):
         self.__first_start = 0
         self.__last_stop = 0
         self.__time = 0
+        self.__intervals = []
+        self.__pid = None
+        self.__tid = None
+        self.__allocations_at_start = None
+        self.__allocations = Counter()
+        self.__memory_profiled = False
+        self.__memory_at_start = None
+        self.__running_peak = 0
+        self.__allocated_bytes = 0
+        self.__peak_bytes = 0
+        self.__array_bytes = 0
         self.freeze()
 
     def start(self):
         self.__start = time.time()
         if self.__first_start == 0:
             self.__first_start = self.__start
+        self.__pid = os.getpid()
+        self.__tid = threading.get_ident()
+        self.__allocations_at_start = Counter(_allocations)
+        if tracemalloc.is_tracing():
+            self.__memory_profiled = True
+            with _peak_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                for timing in _peak_timings:
+                    timing.__record_peak(peak)
+                tracemalloc.reset_peak()
+                self.__memory_at_start = current
+                self.__running_peak = current
+                _peak_timings.add(self)
 
     def stop(self):
         if self.__start == 0:
             return
         t = time.time()
         self.__time += (t - self.__start)
+        self.__intervals.append((self.__start, t))
         self.__start = 0
         self.__last_stop = t
+        self.__allocations.update(_allocations - self.__allocations_at_start)
+        self.__allocations_at_start = None
+        if self.__memory_at_start is not None:
+            with _peak_lock:
+                _peak_timings.discard(self)
+                if tracemalloc.is_tracing():
+                    current, peak = tracemalloc.get_traced_memory()
+                    self.__record_peak(peak)
+                    self.__allocated_bytes += current - self.__memory_at_start
+                    self.__peak_bytes = max(
+                        self.__peak_bytes,
+                        self.__running_peak - self.__memory_at_start)
+        self.__memory_at_start = None
+
+    def __record_peak(self, peak):
+        self.__running_peak = max(self.__running_peak, peak)
+
+    def allocations(self):
+        '''Number of allocations per kind counted between calls to start()
+        and stop(), see :func:`count_allocation`.'''
+        return Counter(self.__allocations)
+
+    def add_array_bytes(self, nbytes):
+        '''Register the size of arrays added to a batch.'''
+        self.__array_bytes += nbytes
+
+    def memory_profiled(self):
+        '''Whether memory allocations were traced for this Timing.'''
+        return self.__memory_profiled
+
+    def allocated_bytes(self):
+        '''Net bytes allocated between calls to start() and stop(). Only
+        available if :func:`memory_profiled`.'''
+        return self.__allocated_bytes
+
+    def peak_bytes(self):
+        '''Peak of bytes allocated above the level at start(). Only
+        available if :func:`memory_profiled`.'''
+        return self.__peak_bytes
+
+    def array_bytes(self):
+        '''Bytes of arrays added to a batch, see :func:`add_array_bytes`.'''
+        return self.__array_bytes
 
     def elapsed(self):
         '''Accumulated time elapsed between calls to start() and stop().'''
@@ -40,6 +136,19 @@ class Timing(Freezable):
         '''Timestamps of the first call to start() and last call to stop().'''
         return self.__first_start, self.__last_stop
 
+    def intervals(self):
+        '''List of timestamp tuples ``(start, stop)``, one for each pair of
+        calls to start() and stop().'''
+        return list(self.__intervals)
+
+    def get_pid(self):
+        '''ID of the process this Timing was last started in.'''
+        return self.__pid
+
+    def get_tid(self):
+        '''ID of the thread this Timing was last started in.'''
+        return self.__tid
+
     def get_node_name(self):
         return self.__name
 
@@ -79,6 +188,26 @@ class TimingSummary(Freezable):
     def median(self):
         return np.median(self.times)
 
+    def memory_profiled(self):
+        '''Whether any of the Timings traced memory allocations.'''
+        return any(timing.memory_profiled() for timing in self.timings)
+
+    def mean_allocated_bytes(self):
+        return np.mean([t.allocated_bytes() for t in self.timings])
+
+    def max_peak_bytes(self):
+        return np.max([t.peak_bytes() for t in self.timings])
+
+    def mean_array_bytes(self):
+        return np.mean([t.array_bytes() for t in self.timings])
+
+    def allocations(self):
+        '''Total number of allocations per kind over all Timings.'''
+        allocations = Counter()
+        for timing in self.timings:
+            allocations.update(timing.allocations())
+        return allocations
+
 class ProfilingStats(Freezable):
 
     def __init__(self):
@@ -117,6 +246,14 @@ class ProfilingStats(Freezable):
 
         return self.__summaries[(node_name,method_name)]
 
+    def get_allocations(self):
+        '''Get a dictionary (node_name,method_name) -> ``Counter`` of the
+        number of allocations per kind, see :func:`count_allocation`.'''
+        return {
+            id: summary.allocations()
+            for id, summary in self.__summaries.items()
+        }
+
     def span(self):
         '''Timestamps of the first call to start() and last call to stop() over 
         all Timings added.'''
@@ -325,7 +325,8 @@ class Roi(Freezable):
 
     def copy(self):
         '''Create a copy of this ROI.'''
-        return copy.deepcopy(self)
+        # offset and shape are immutable, no need to deepcopy them
+        return Roi(self.__offset, self.__shape)
 
     def __left_min(self, x, y):
 
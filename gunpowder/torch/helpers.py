@@ -0,0 +1,203 @@
+import contextlib
+import itertools
+import numpy as np
+
+from gunpowder.ext import torch
+from gunpowder.profiling import count_allocation
+
+
+def array_to_tensor(data, device):
+    '''Convert a numpy array to a tensor on ``device``.
+
+    Augmentations like :class:`SimpleAugment` produce strided (possibly
+    mirrored) views of the upstream data, which ``torch`` can not wrap. This
+    is the place where those views are made contiguous, i.e., they are copied
+    only once, right before they are handed to the model.
+    '''
+
+    data = np.asarray(data)
+    if not data.flags.c_contiguous:
+        data = np.ascontiguousarray(data)
+        count_allocation('array_data')
+
+    return torch.as_tensor(data, device=device)
+
+
+def autocast(device, precision):
+    '''Context manager to run operations on ``device`` in mixed precision,
+    where ``precision`` is ``"float16"`` or ``"bfloat16"``. Does nothing if
+    ``precision`` is ``None`` or ``"float32"``.'''
+
+    if precision in (None, 'float32'):
+        return contextlib.nullcontext()
+
+    return torch.autocast(device.type, dtype=getattr(torch, precision))
+
+
+def grad_scaler(device):
+    '''Create a ``GradScaler`` for training in ``float16`` on ``device``.
+    Versions of ``torch`` before 2.3 only support it for CUDA devices.'''
+
+    if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+        return torch.amp.GradScaler(device.type)
+
+    assert device.type == 'cuda', (
+        "Training in float16 on %s needs torch>=2.3, use bfloat16 "
+        "instead" % device.type)
+    return torch.cuda.amp.GradScaler()
+
+
+def to_channels_last(x):
+    '''Convert a 4D or 5D tensor to channels-last memory layout. Other
+    tensors are returned unchanged. If ``x`` is a module, all its 4D and 5D
+    parameters and buffers are converted in-place.'''
+
+    if isinstance(x, torch.nn.Module):
+        for tensor in itertools.chain(x.parameters(), x.buffers()):
+            tensor.data = to_channels_last(tensor.data)
+        return x
+
+    memory_format = {
+        4: torch.channels_last,
+        5: torch.channels_last_3d
+    }.get(x.dim())
+    if memory_format is None:
+        return x
+
+    return x.contiguous(memory_format=memory_format)
+
+
+def to_full_precision(tensor):
+    '''Convert half precision tensors (as produced under :func:`autocast`)
+    to ``float32``, such that they can be copied to numpy.'''
+
+    if tensor.dtype in (torch.float16, torch.bfloat16):
+        return tensor.float()
+    return tensor
+
+
+class TensorStager:
+    '''Copy numpy arrays to and from a CUDA device without blocking.
+
+    Arrays are first copied into pinned (page-locked) host buffers, which are
+    reused between calls, and from there to the device on a separate CUDA
+    stream. Each name alternates between ``num_buffers`` buffers, such that
+    filling the buffer for the next upload does not have to wait for the
+    previous one to finish. Tensors are copied back with
+    :meth:`to_numpy`, which waits only once for all of them.
+
+    If ``device`` is not a CUDA device (or staging is not enabled), arrays
+    are converted with :func:`array_to_tensor` and copied back synchronously.
+
+    Args:
+
+        device (``torch.device``):
+
+            The device to copy to.
+
+        num_buffers (``int``, optional):
+
+            How many pinned buffers to use per name.
+
+        enabled (``bool``, optional):
+
+            Whether to stage copies at all.
+    '''
+
+    def __init__(self, device, num_buffers=2, enabled=True):
+
+        self.device = torch.device(device)
+        self.enabled = enabled and self.device.type == 'cuda'
+        self.num_buffers = num_buffers
+
+        # name -> list of (buffer, event of the last copy from it)
+        self.buffers = {}
+        self.uploads = {}
+        self.stream = torch.cuda.Stream(self.device) if self.enabled else None
+
+    def to_device(self, name, data):
+        '''Copy ``data`` to the device, using the buffers of ``name``. The
+        returned tensor can be used on the current stream right away.'''
+
+        if not self.enabled:
+            return array_to_tensor(data, self.device)
+
+        data = np.asarray(data)
+        buffer, event = self.__next_buffer(name, data)
+        if buffer is None:
+            return array_to_tensor(data, self.device)
+
+        # the buffer might still be read by an earlier copy
+        if event is not None:
+            event.synchronize()
+
+        # a single copy, also for non-contiguous views
+        np.copyto(buffer.numpy(), data, casting='no')
+
+        with torch.cuda.stream(self.stream):
+            tensor = buffer.to(self.device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        self.buffers[name][self.uploads[name] % self.num_buffers] = (
+            buffer, event)
+        self.uploads[name] += 1
+
+        current_stream = torch.cuda.current_stream(self.device)
+        current_stream.wait_event(event)
+        tensor.record_stream(current_stream)
+
+        return tensor
+
+    def to_numpy(self, tensors):
+        '''Copy a dictionary of tensors to numpy arrays, waiting only once for
+        all copies to finish.'''
+
+        if not self.enabled:
+            return {
+                name: tensor.detach().cpu().numpy()
+                for name, tensor in tensors.items()
+            }
+
+        host = {}
+        for name, tensor in tensors.items():
+            tensor = tensor.detach()
+            if tensor.device.type != 'cuda':
+                host[name] = tensor
+                continue
+            host[name] = torch.empty(
+                tensor.shape,
+                dtype=tensor.dtype,
+                pin_memory=True)
+            host[name].copy_(tensor, non_blocking=True)
+
+        event = torch.cuda.Event()
+        event.record(torch.cuda.current_stream(self.device))
+        event.synchronize()
+
+        return {name: tensor.numpy() for name, tensor in host.items()}
+
+    def __next_buffer(self, name, data):
+        '''Get the next buffer for ``name`` (reallocated if the shape or type
+        of ``data`` changed), together with the event of the last copy from
+        it. Returns ``None`` for types not supported by torch.'''
+
+        try:
+            dtype = torch.from_numpy(np.empty((0,), dtype=data.dtype)).dtype
+        except TypeError:
+            return None, None
+
+        if name not in self.buffers:
+            self.buffers[name] = [None]*self.num_buffers
+            self.uploads[name] = 0
+
+        slot = self.uploads[name] % self.num_buffers
+        entry = self.buffers[name][slot]
+        if entry is not None:
+            buffer, event = entry
+            if buffer.shape == data.shape and buffer.dtype == dtype:
+                return buffer, event
+            # the old buffer is released once its last copy is done
+            event.synchronize()
+
+        buffer = torch.empty(data.shape, dtype=dtype, pin_memory=True)
+        return buffer, None
@@ -2,9 +2,16 @@ from gunpowder.array import ArrayKey, Array
 from gunpowder.array_spec import ArraySpec
 from gunpowder.ext import torch
 from gunpowder.nodes.generic_predict import GenericPredict
+from gunpowder.torch.helpers import (
+    array_to_tensor,
+    autocast,
+    to_channels_last,
+    to_full_precision,
+)
 
 import logging
-from typing import Dict, Union
+import numpy as np
+from typing import Dict, Optional, Union
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +60,44 @@ class Predict(GenericPredict):
 
         spawn_subprocess (bool, optional): Whether to run ``predict`` in a
             separate process. Default is false.
+
+        precision (``string``, optional):
+
+            Run the model in mixed precision with ``torch.autocast``, using
+            ``"float16"`` or ``"bfloat16"`` for operations that support it.
+            Outputs are converted back to ``float32``. If not given, the
+            precision stored in ``checkpoint`` by :class:`Train` is used, or
+            full precision if there is none.
+
+        channels_last (``bool``, optional):
+
+            Convert the model and all 4D and 5D inputs to channels-last memory
+            layout. If not given, the setting stored in ``checkpoint`` by
+            :class:`Train` is used, or false if there is none.
+
+        compile (``string``, optional):
+
+            Compile the model before the first prediction, either with
+            ``torch.compile`` (``"compile"``) or TorchScript (``"script"``).
+            TorchScript does not support outputs that are retrieved from
+            model attributes. Default is ``None``, i.e., eager execution.
+
+        max_batch_size (``int``, optional):
+
+            Run the model in an inference server process, which predicts the
+            requests of all downstream workers (e.g., of :class:`Scan`)
+            together. Up to this many requests with inputs of the same shape
+            are concatenated along the first (batch) dimension and predicted
+            in a single forward pass. The outputs are split along their first
+            dimension accordingly, i.e., the model has to keep the batch
+            dimension. Default is ``None``, i.e., no inference server.
+
+        batch_timeout (``float``, optional):
+
+            How long the inference server waits (in seconds) for more requests
+            to fill a batch. Default is 0.01.
+
+    Predictions run in ``torch.inference_mode``.
     """
 
     def __init__(
@@ -63,11 +108,27 @@ class Predict(GenericPredict):
         array_specs: Dict[ArrayKey, ArraySpec] = None,
         checkpoint: str = None,
         device="cuda",
-        spawn_subprocess=False
+        spawn_subprocess=False,
+        precision: Optional[str] = None,
+        channels_last: Optional[bool] = None,
+        compile: Optional[str] = None,
+        max_batch_size: Optional[int] = None,
+        batch_timeout: float = 0.01,
     ):
 
         self.array_specs = array_specs if array_specs is not None else {}
 
+        assert precision in (None, "float32", "float16", "bfloat16"), (
+            f"Unsupported precision {precision}, use 'float32', 'float16', "
+            "or 'bfloat16'"
+        )
+        assert compile in (None, "compile", "script"), (
+            f"Unsupported compile mode {compile}, use 'compile' or 'script'"
+        )
+        assert compile != "script" or all(
+            isinstance(key, int) for key in outputs
+        ), "TorchScript models only support tuple indices as outputs"
+
         if model.training:
             logger.warning(
                 "Model is in training mode during prediction. "
@@ -78,12 +139,18 @@ class Predict(GenericPredict):
             inputs,
             outputs,
             array_specs,
-            spawn_subprocess=spawn_subprocess)
+            spawn_subprocess=spawn_subprocess,
+            max_batch_size=max_batch_size,
+            batch_timeout=batch_timeout)
 
         self.device_string = device
         self.device = None  # to be set in start()
         self.model = model
         self.checkpoint = checkpoint
+        self.precision = precision
+        self.channels_last = channels_last
+        self.compile = compile
+        self.forward = None  # to be set in start()
 
         self.intermediate_layers = {}
         self.register_hooks()
@@ -109,21 +176,89 @@ class Predict(GenericPredict):
             checkpoint = torch.load(self.checkpoint, map_location=self.device)
             if "model_state_dict" in checkpoint:
                 self.model.load_state_dict(checkpoint["model_state_dict"])
+                # use the execution modes the model was trained with
+                if self.precision is None:
+                    self.precision = checkpoint.get("precision")
+                if self.channels_last is None:
+                    self.channels_last = checkpoint.get("channels_last")
             else:
                 self.model.load_state_dict()
 
+        if self.channels_last:
+            to_channels_last(self.model)
+
+        if self.compile == "script":
+            self.forward = torch.jit.script(self.model)
+        elif self.compile == "compile":
+            self.forward = torch.compile(self.model)
+        else:
+            self.forward = self.model
+
     def predict(self, batch, request):
         inputs = self.get_inputs(batch)
-        with torch.no_grad():
-            out = self.model.forward(**inputs)
+        with torch.inference_mode(), autocast(self.device, self.precision):
+            out = self.forward(**inputs)
         outputs = self.get_outputs(out, request)
         self.update_batch(batch, request, outputs)
 
+    def predict_batches(self, batches, requests):
+
+        # only inputs of the same shape can be concatenated
+        shapes = set(
+            tuple(batch[value].data.shape for value in self.inputs.values())
+            for batch in batches
+        )
+        if len(batches) == 1 or len(shapes) > 1:
+            super(Predict, self).predict_batches(batches, requests)
+            return
+
+        inputs = self.to_model_inputs(
+            {
+                key: np.concatenate([batch[value].data for batch in batches])
+                for key, value in self.inputs.items()
+            }
+        )
+        with torch.inference_mode(), autocast(self.device, self.precision):
+            out = self.forward(**inputs)
+        requested = set(
+            key for request in requests for key in request.array_specs.keys()
+        )
+        outputs = self.get_outputs(out, requested)
+
+        # split the outputs along the batch dimension
+        size = next(iter(shapes))[0][0]
+        for array_key, tensor in outputs.items():
+            assert tensor.shape[0] == size * len(batches), (
+                f"Output {array_key} of shape {tuple(tensor.shape)} can not be "
+                f"split into {len(batches)} batches of size {size}"
+            )
+            outputs[array_key] = to_full_precision(tensor.detach()).cpu()
+        for i, (batch, request) in enumerate(zip(batches, requests)):
+            self.update_batch(
+                batch,
+                request,
+                {
+                    array_key: tensor[i * size:(i + 1) * size]
+                    for array_key, tensor in outputs.items()
+                    if array_key in request
+                },
+            )
+
     def get_inputs(self, batch):
+        return self.to_model_inputs(
+            {key: batch[value].data for key, value in self.inputs.items()}
+        )
+
+    def to_model_inputs(self, arrays):
         model_inputs = {
-            key: torch.as_tensor(batch[value].data, device=self.device)
-            for key, value in self.inputs.items()
+            key: array_to_tensor(data, self.device)
+            for key, data in arrays.items()
         }
+        if self.channels_last:
+            model_inputs = {
+                key: to_channels_last(value)
+                for key, value in model_inputs.items()
+            }
         return model_inputs
 
     def register_hooks(self):
@@ -156,7 +291,8 @@ class Predict(GenericPredict):
         for array_key, tensor in requested_outputs.items():
             spec = self.spec[array_key].copy()
             spec.roi = request[array_key].roi
-            batch.arrays[array_key] = Array(tensor.cpu().detach().numpy(), spec)
+            tensor = to_full_precision(tensor.detach())
+            batch.arrays[array_key] = Array(tensor.cpu().numpy(), spec)
 
     def stop(self):
         pass
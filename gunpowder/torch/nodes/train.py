@@ -5,6 +5,13 @@ from gunpowder.array import ArrayKey, Array
 from gunpowder.array_spec import ArraySpec
 from gunpowder.ext import torch, tensorboardX, NoSuchModule
 from gunpowder.nodes.generic_train import GenericTrain
+from gunpowder.torch.helpers import (
+    TensorStager,
+    autocast,
+    grad_scaler,
+    to_channels_last,
+    to_full_precision,
+)
 
 from typing import Dict, Union, Optional
 
@@ -78,6 +85,54 @@ class Train(GenericTrain):
         spawn_subprocess (``bool``, optional):
         
             Whether to run the ``train_step`` in a separate process. Default is false.
+
+        stage_transfers (``bool``, optional):
+
+            If set, inputs are copied to the GPU through reusable pinned host
+            buffers on a separate CUDA stream, without blocking. Inputs that
+            are only needed by the loss are uploaded while the forward pass
+            is running. Requested outputs, gradients, and the loss are copied
+            back together, with a single synchronization. Has no effect if
+            CUDA is not available. Default is false.
+
+        micro_batches (``int``, optional):
+
+            Split each batch into this many micro-batches along the first
+            dimension of all inputs, and run the model on one at a time. The
+            gradients are accumulated over the micro-batches, before the
+            optimizer makes a step. Use this together with :class:`Stack` to
+            train on batches that do not fit into memory at once. Requested
+            outputs and gradients are concatenated over the micro-batches.
+            Default is 1.
+
+        accumulate_gradients (``int``, optional):
+
+            Accumulate the gradients of this many consecutive batches before
+            the optimizer makes a step, i.e., increase the effective batch
+            size by this factor without changing the pipeline. The loss is
+            scaled such that the accumulated gradient is the one of the mean
+            loss. ``batch.iteration`` still counts batches, i.e., the optimizer
+            makes a step in every ``accumulate_gradients``-th iteration.
+            Checkpoints are only created right after a step, i.e., in the first
+            such iteration after every ``save_every`` iterations. Default is 1.
+
+        precision (``string``, optional):
+
+            Run the forward pass and the loss in mixed precision with
+            ``torch.autocast``, using ``"float16"`` or ``"bfloat16"`` for
+            operations that support it. With ``"float16"``, the loss is scaled
+            with a ``GradScaler`` to avoid underflowing gradients. Requested
+            outputs are converted back to ``float32``. Default is ``None``,
+            i.e., full precision.
+
+        channels_last (``bool``, optional):
+
+            Convert the model and all 4D and 5D inputs to channels-last memory
+            layout, which is faster for convolutions on many devices. Default
+            is false.
+
+    The ``precision`` and ``channels_last`` settings are stored in the
+    checkpoints, together with the state of the ``GradScaler``.
     """
 
     def __init__(
@@ -95,8 +150,18 @@ class Train(GenericTrain):
         log_dir: str = None,
         log_every: int = 1,
         spawn_subprocess: bool = False,
+        stage_transfers: bool = False,
+        micro_batches: int = 1,
+        accumulate_gradients: int = 1,
+        precision: Optional[str] = None,
+        channels_last: bool = False,
     ):
 
+        assert precision in (None, "float32", "float16", "bfloat16"), (
+            f"Unsupported precision {precision}, use 'float32', 'float16', "
+            "or 'bfloat16'"
+        )
+
         if not model.training:
             logger.warning(
                 "Model is in evaluation mode during training. "
@@ -119,6 +184,14 @@ class Train(GenericTrain):
         self.loss_inputs = loss_inputs
         self.checkpoint_basename = checkpoint_basename
         self.save_every = save_every
+        self.stage_transfers = stage_transfers
+        self.stager = None
+        self.micro_batches = micro_batches
+        self.accumulate_gradients = accumulate_gradients
+        self.accumulated_steps = 0
+        self.precision = precision
+        self.channels_last = channels_last
+        self.scaler = None  # only for float16, set in start()
 
         self.iteration = 0
 
@@ -174,6 +247,12 @@ class Train(GenericTrain):
             ) from e
         if isinstance(self.loss, torch.nn.Module):
             self.loss = self.loss.to(self.device)
+        if self.channels_last:
+            to_channels_last(self.model)
+
+        # gradients of float16 losses are scaled to avoid underflows
+        if self.precision == "float16":
+            self.scaler = grad_scaler(self.device)
 
         checkpoint, self.iteration = self._get_latest_checkpoint(
             self.checkpoint_basename
@@ -187,6 +266,15 @@ class Train(GenericTrain):
             checkpoint = torch.load(checkpoint, map_location=self.device)
             self.model.load_state_dict(checkpoint["model_state_dict"])
             self.optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+            if self.scaler is not None and "scaler_state_dict" in checkpoint:
+                self.scaler.load_state_dict(checkpoint["scaler_state_dict"])
+            if checkpoint.get("precision") != self.precision:
+                logger.info(
+                    "Checkpoint was trained with precision %s, continuing "
+                    "with %s",
+                    checkpoint.get("precision"),
+                    self.precision,
+                )
 
         else:
 
@@ -194,19 +282,158 @@ class Train(GenericTrain):
 
         logger.info("Using device %s", self.device)
 
+        # without staging, this falls back to synchronous copies
+        self.stager = TensorStager(self.device, enabled=self.stage_transfers)
+        if self.stage_transfers and not self.use_cuda:
+            logger.info("CUDA is not available, inputs will not be staged")
+
     def train_step(self, batch, request):
 
         inputs = self.__collect_provided_inputs(batch)
         requested_outputs = self.__collect_requested_outputs(request)
 
+        # Some inputs to the loss should come from the batch, not the model
+        provided_loss_inputs = self.__collect_provided_loss_inputs(batch)
+
+        if self.accumulated_steps == 0:
+            self.optimizer.zero_grad()
+
+        # split the batch into micro-batches along the first axis, each
+        # contributing to the gradient according to its size
+        if self.micro_batches > 1:
+            batch_size = self.__get_batch_size(inputs, provided_loss_inputs)
+            assert batch_size >= self.micro_batches, (
+                f"Can not split a batch of size {batch_size} into "
+                f"{self.micro_batches} micro-batches"
+            )
+            bounds = np.linspace(
+                0, batch_size, self.micro_batches + 1).astype(int)
+            parts = [slice(b, e) for b, e in zip(bounds[:-1], bounds[1:])]
+            weights = [
+                (e - b) / batch_size for b, e in zip(bounds[:-1], bounds[1:])
+            ]
+        else:
+            parts = [slice(None)]
+            weights = [1.0]
+
+        part_outputs = []
+        part_gradients = []
+        loss = 0
+        for i, (part, weight) in enumerate(zip(parts, weights)):
+
+            # the loss is scaled such that the accumulated gradient is that of
+            # the mean loss over all micro-batches and accumulated batches
+            scale = weight / self.accumulate_gradients
+
+            outputs, part_loss = self.__forward_backward(
+                {k: v[part] for k, v in inputs.items()},
+                {k: v[part] for k, v in provided_loss_inputs.items()},
+                request,
+                scale,
+                i,
+            )
+
+            loss = loss + part_loss.detach().float() * weight
+            part_outputs.append(
+                {
+                    array_key: to_full_precision(outputs[array_name].detach())
+                    for array_key, array_name in requested_outputs.items()
+                }
+            )
+            # gradients are w.r.t. the loss of the whole batch, undo only the
+            # scaling for accumulation and of the GradScaler
+            gradient_scale = self.accumulate_gradients
+            if self.scaler is not None:
+                gradient_scale /= self.scaler.get_scale()
+            part_gradients.append(
+                {
+                    array_key: to_full_precision(gradient) * gradient_scale
+                    if gradient_scale != 1
+                    else to_full_precision(gradient)
+                    for array_key, gradient in self.__get_gradients(
+                        request, outputs
+                    ).items()
+                }
+            )
+
+        self.accumulated_steps += 1
+        if self.accumulated_steps == self.accumulate_gradients:
+            if self.scaler is not None:
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+            else:
+                self.optimizer.step()
+            self.accumulated_steps = 0
+            optimizer_stepped = True
+        else:
+            optimizer_stepped = False
+        self.iteration += 1
+
+        # copy requested model outputs, gradients, and the loss back at once
+        host_tensors = {"loss": loss}
+        for tensors in [part_outputs, part_gradients]:
+            for array_key in tensors[0].keys():
+                if len(tensors) == 1:
+                    host_tensors[array_key] = tensors[0][array_key]
+                else:
+                    host_tensors[array_key] = torch.cat(
+                        [t[array_key] for t in tensors])
+
+        host_arrays = self.stager.to_numpy(host_tensors)
+
+        for array_key, data in host_arrays.items():
+            if array_key == "loss":
+                continue
+            spec = self.spec[array_key].copy()
+            spec.roi = request[array_key].roi
+            batch.arrays[array_key] = Array(data, spec)
+
+        batch.loss = host_arrays["loss"]
+        batch.iteration = self.iteration
+
+        # a multiple of save_every was reached since the last optimizer step
+        if (
+            optimizer_stepped
+            and batch.iteration % self.save_every < self.accumulate_gradients
+        ):
+
+            checkpoint_name = self._checkpoint_name(
+                self.checkpoint_basename, batch.iteration
+            )
+
+            logger.info("Creating checkpoint %s", checkpoint_name)
+
+            checkpoint = {
+                "model_state_dict": self.model.state_dict(),
+                "optimizer_state_dict": self.optimizer.state_dict(),
+                "precision": self.precision,
+                "channels_last": self.channels_last,
+            }
+            if self.scaler is not None:
+                checkpoint["scaler_state_dict"] = self.scaler.state_dict()
+
+            torch.save(checkpoint, checkpoint_name)
+
+        if self.summary_writer and batch.iteration % self.log_every == 0:
+            self.summary_writer.add_scalar("loss", batch.loss, batch.iteration)
+
+    def __forward_backward(self, inputs, provided_loss_inputs, request, scale, part):
+        """Run the model and the loss on one (micro-)batch and compute the
+        gradients of the loss, multiplied with ``scale``. Returns the model
+        outputs and the (unscaled) loss."""
+
         # keys are argument names of model forward pass
         device_inputs = {
-            k: torch.as_tensor(v, device=self.device) for k, v in inputs.items()
+            k: self.stager.to_device((part, k), v) for k, v in inputs.items()
         }
+        if self.channels_last:
+            device_inputs = {
+                k: to_channels_last(v) for k, v in device_inputs.items()
+            }
 
         # get outputs. Keys are tuple indices or model attr names as in self.outputs
-        self.optimizer.zero_grad()
-        model_outputs = self.model(**device_inputs)
+        with autocast(self.device, self.precision):
+            model_outputs = self.model(**device_inputs)
         if isinstance(model_outputs, tuple):
             outputs = {i: model_outputs[i] for i in range(len(model_outputs))}
         elif isinstance(model_outputs, torch.Tensor):
@@ -218,11 +445,8 @@ class Train(GenericTrain):
             )
         outputs.update(self.intermediate_layers)
 
-        # Some inputs to the loss should come from the batch, not the model
-        provided_loss_inputs = self.__collect_provided_loss_inputs(batch)
-
         device_loss_inputs = {
-            k: torch.as_tensor(v, device=self.device)
+            k: self.stager.to_device((part, "loss", k), v)
             for k, v in provided_loss_inputs.items()
         }
 
@@ -257,18 +481,18 @@ class Train(GenericTrain):
             "loss inputs: %s %s",
             [v.shape for v in device_loss_args],
             {k: v.shape for k, v in device_loss_kwargs.items()})
-        loss = self.loss(*device_loss_args, **device_loss_kwargs)
-        loss.backward()
-        self.optimizer.step()
+        with autocast(self.device, self.precision):
+            loss = self.loss(*device_loss_args, **device_loss_kwargs)
+        scaled_loss = loss * scale if scale != 1 else loss
+        if self.scaler is not None:
+            scaled_loss = self.scaler.scale(scaled_loss)
+        scaled_loss.backward()
 
-        # add requested model outputs to batch
-        for array_key, array_name in requested_outputs.items():
-            spec = self.spec[array_key].copy()
-            spec.roi = request[array_key].roi
-            batch.arrays[array_key] = Array(
-                outputs[array_name].cpu().detach().numpy(), spec
-            )
+        return outputs, loss
+
+    def __get_gradients(self, request, outputs):
 
+        gradients = {}
         for array_name, array_key in self.gradients.items():
             if array_key not in request:
                 continue
@@ -280,41 +504,22 @@ class Train(GenericTrain):
                 raise RuntimeError(
                     "only ints and strings are supported as gradients keys"
                 )
-            spec = self.spec[array_key].copy()
-            spec.roi = request[array_key].roi
-            batch.arrays[array_key] = Array(
-                tensor.grad.cpu().detach().numpy(), spec
-            )
+            gradients[array_key] = tensor.grad
 
-        for array_key, array_name in requested_outputs.items():
-            spec = self.spec[array_key].copy()
-            spec.roi = request[array_key].roi
-            batch.arrays[array_key] = Array(
-                outputs[array_name].cpu().detach().numpy(), spec
-            )
-
-        batch.loss = loss.cpu().detach().numpy()
-        self.iteration += 1
-        batch.iteration = self.iteration
-
-        if batch.iteration % self.save_every == 0:
-
-            checkpoint_name = self._checkpoint_name(
-                self.checkpoint_basename, batch.iteration
-            )
-
-            logger.info("Creating checkpoint %s", checkpoint_name)
+        return gradients
 
-            torch.save(
-                {
-                    "model_state_dict": self.model.state_dict(),
-                    "optimizer_state_dict": self.optimizer.state_dict(),
-                },
-                checkpoint_name,
-            )
+    def __get_batch_size(self, *arrays):
 
-        if self.summary_writer and batch.iteration % self.log_every == 0:
-            self.summary_writer.add_scalar("loss", batch.loss, batch.iteration)
+        sizes = set(
+            v.shape[0]
+            for a in arrays
+            for v in a.values()
+        )
+        assert len(sizes) == 1, (
+            "To split batches into micro-batches, all inputs need to have the "
+            f"same size in the first dimension, got {sizes}"
+        )
+        return sizes.pop()
 
     def __collect_requested_outputs(self, request):
 
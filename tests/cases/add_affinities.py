@@ -125,3 +125,40 @@ class TestAddAffinities(ProviderTest):
                             self.assertEqual(affs_mask.data[(n,)+p], 0.0, (
                                 "%s or %s are masked, but mask is not 0"%
                                 (p, pn)))
+
+    def test_seg_to_affgraph(self):
+
+        from gunpowder.nodes.add_affinities import seg_to_affgraph
+
+        for shape, neighborhood in [
+                ((10, 12), [(-1, 0), (0, -1), (2, 3)]),
+                ((4, 5, 6, 7), [(-1, 0, 0, 0), (0, 0, 0, -3), (1, -1, 2, 0)])]:
+
+            seg = np.random.randint(0, 3, size=shape).astype(np.uint64)
+            mask = np.random.randint(0, 2, size=shape)
+            voxel_roi = Roi((0,)*len(shape), shape)
+
+            affs, affs_mask = seg_to_affgraph(
+                seg,
+                neighborhood,
+                dtype=np.uint8,
+                labels_mask=mask,
+                affinities_mask=True,
+                num_workers=2)
+
+            self.assertEqual(affs.dtype, np.uint8)
+            self.assertEqual(affs.shape, (len(neighborhood),) + shape)
+
+            for p in product(*[range(d) for d in shape]):
+                p = Coordinate(p)
+                for n, offset in enumerate(neighborhood):
+                    pn = p + Coordinate(offset)
+                    if not voxel_roi.contains(pn):
+                        self.assertEqual(affs[(n,) + p], 0)
+                        continue
+                    self.assertEqual(
+                        affs[(n,) + p],
+                        seg[p] == seg[pn] and seg[p] != 0)
+                    self.assertEqual(
+                        affs_mask[(n,) + p],
+                        mask[p] != 0 and mask[pn] != 0)
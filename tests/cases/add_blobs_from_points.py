@@ -0,0 +1,119 @@
+from .provider_test import ProviderTest
+from gunpowder import (
+    ArrayKey,
+    ArraySpec,
+    Array,
+    Batch,
+    BatchProvider,
+    BatchRequest,
+    Graph,
+    GraphKey,
+    GraphSpec,
+    Node,
+    Roi,
+    build,
+)
+from gunpowder.contrib import AddBlobsFromPoints
+from gunpowder.contrib.nodes.add_blobs_from_points import BlobPlacer
+import numpy as np
+
+
+class BlobTestSource(BatchProvider):
+    def __init__(self, labels, points, voxel_size):
+        self.labels = labels
+        self.points = points
+        self.voxel_size = voxel_size
+
+    def setup(self):
+
+        roi = Roi((0, 0, 0), (40, 40, 40))
+        self.provides(self.labels, ArraySpec(roi=roi, voxel_size=self.voxel_size))
+        self.provides(self.points, GraphSpec(roi=roi))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        roi = request[self.labels].roi
+        shape = roi.get_shape() / self.voxel_size
+        data = np.ones(shape, dtype=np.uint64)
+        data[:, :, shape[2] // 2 :] = 2
+        spec = self.spec[self.labels].copy()
+        spec.roi = roi
+        batch[self.labels] = Array(data, spec)
+
+        nodes = [
+            Node(1, location=np.array([10, 10, 10]), attrs={"synapse_id": 3}),
+            Node(2, location=np.array([20, 20, 18]), attrs={"synapse_id": 4}),
+            Node(3, location=np.array([30, 30, 30]), attrs={"synapse_id": 5}),
+            Node(4, location=np.array([38, 20, 20]), attrs={"synapse_id": 6}),
+        ]
+        batch[self.points] = Graph(
+            [n for n in nodes if request[self.points].roi.contains(n.location)],
+            [],
+            GraphSpec(roi=request[self.points].roi),
+        )
+
+        return batch
+
+
+class TestAddBlobsFromPoints(ProviderTest):
+    def test_output(self):
+
+        labels = ArrayKey("BLOB_LABELS")
+        points = GraphKey("BLOB_POINTS")
+        blobs = ArrayKey("BLOBS")
+        voxel_size = (2, 2, 2)
+
+        pipeline = BlobTestSource(labels, points, voxel_size) + AddBlobsFromPoints(
+            {
+                "blobs": {
+                    "points_key": points,
+                    "output_array_key": blobs,
+                    "output_array_dtype": "int64",
+                    "radius": 4,
+                    "output_voxel_size": voxel_size,
+                    "restrictive_mask_key": labels,
+                }
+            }
+        )
+
+        request = BatchRequest()
+        request[blobs] = ArraySpec(roi=Roi((0, 0, 0), (40, 40, 40)))
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        data = batch[blobs].data
+        kernel = BlobPlacer(4, voxel_size, dtype="int64").sphere_map
+
+        # a complete blob
+        self.assertTrue((data[3:8, 3:8, 3:8] == 3 * kernel).all())
+
+        # a blob restricted to its label
+        self.assertTrue((data[8:13, 8:13, 7:10] == 4 * kernel[:, :, :3]).all())
+        self.assertTrue((data[8:13, 8:13, 10:12] == 0).all())
+
+        # a blob that does not fit is not placed
+        self.assertEqual((data == 6).sum(), 0)
+        self.assertEqual(batch[blobs].attrs["synapse_ids"], [3, 4, 5, 6])
+
+    def test_place_all(self):
+
+        placer = BlobPlacer(1, (1, 1, 1), dtype="uint64")
+        mask = np.zeros((10, 10, 10), dtype=np.uint8)
+        locations = [(4, 4, 4), (4, 4, 5), (0, 5, 5)]
+
+        # overlapping blobs are added up
+        matrix = np.zeros((10, 10, 10), dtype=np.uint64)
+        placed = placer.place_all(matrix, locations, [1, 2, 3], mask)
+        self.assertEqual(list(placed), [True, True, False])
+        self.assertEqual(matrix[4, 4, 4], 3)
+        self.assertEqual(matrix[4, 4, 3], 1)
+        self.assertEqual(matrix[4, 4, 6], 2)
+
+        # or placed in separate layers
+        layers = np.zeros((2, 10, 10, 10), dtype=np.uint64)
+        placer.place_all(layers, locations, [1, 2, 3], mask)
+        self.assertEqual(layers[0].sum(), 7)
+        self.assertEqual(layers[1].sum(), 14)
@@ -394,6 +394,49 @@ class TestAddVectorMap(ProviderTest):
                     ).all()
                 )
 
+    def test_output_without_stayinside(self):
+
+        voxel_size = Coordinate((20, 2, 2))
+        radius_phys = 30
+
+        ArrayKey("GT_VECTORS_MAP_PRESYN")
+        GraphKey("PRESYN")
+        GraphKey("POSTSYN")
+
+        pipeline = AddVectorMapTestSource() + AddVectorMap(
+            src_and_trg_points={
+                ArrayKeys.GT_VECTORS_MAP_PRESYN: (GraphKeys.PRESYN, GraphKeys.POSTSYN)
+            },
+            voxel_sizes={ArrayKeys.GT_VECTORS_MAP_PRESYN: voxel_size},
+            radius_phys=radius_phys,
+            partner_criterion="min_distance",
+        )
+
+        roi = Roi((1000, 1000, 1000), (400, 400, 400))
+        request = BatchRequest()
+        request[GraphKeys.PRESYN] = GraphSpec(roi=roi)
+        request[GraphKeys.POSTSYN] = GraphSpec(roi=roi)
+        request[ArrayKeys.GT_VECTORS_MAP_PRESYN] = ArraySpec(roi=roi)
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        vector_map = batch.arrays[ArrayKeys.GT_VECTORS_MAP_PRESYN].data
+        postsyn_locs = [
+            n.location.tolist() for n in batch.graphs[GraphKeys.POSTSYN].nodes
+        ]
+
+        # every vector points from its voxel to a partner location
+        voxels = np.array(np.nonzero(np.any(vector_map != 0, axis=0))).T
+        self.assertTrue(len(voxels) > 0)
+        for voxel in voxels:
+            trg_loc = (
+                np.asarray(roi.get_offset())
+                + voxel * voxel_size
+                + vector_map[(slice(None),) + tuple(voxel)]
+            )
+            self.assertIn(trg_loc.tolist(), postsyn_locs)
+
 
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(TestAddVectorMap)
@@ -157,3 +157,115 @@ class TestBalanceLabels(ProviderTest):
 
                     self.assertAlmostEqual((scale*mask*affs).sum(), w_pos*num_pos, 3)
                     self.assertAlmostEqual((scale*mask*(1-affs)).sum(), w_neg*num_neg, 3)
+
+
+class FixedLabelsSource(BatchProvider):
+
+    def __init__(self, labels, mask):
+        self.labels = labels
+        self.mask = mask
+
+    def setup(self):
+
+        spec = ArraySpec(
+            roi=Roi((0, 0), self.labels.shape),
+            voxel_size=(1, 1))
+        self.provides(ArrayKeys.GT_LABELS, spec.copy())
+        self.provides(ArrayKeys.GT_MASK, spec.copy())
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, data in [
+                (ArrayKeys.GT_LABELS, self.labels),
+                (ArrayKeys.GT_MASK, self.mask)]:
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(data.copy(), spec)
+        return batch
+
+
+class TestBalanceLabelsWeights(ProviderTest):
+
+    def balance(self, labels, mask=None, **kwargs):
+
+        if mask is None:
+            mask = np.ones_like(labels)
+
+        pipeline = FixedLabelsSource(labels, mask) + BalanceLabels(
+            labels=ArrayKeys.GT_LABELS,
+            scales=ArrayKeys.LOSS_SCALE,
+            mask=ArrayKeys.GT_MASK,
+            **kwargs)
+
+        request = BatchRequest()
+        request[ArrayKeys.LOSS_SCALE] = ArraySpec(
+            roi=Roi((0, 0), labels.shape))
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        return batch.arrays[ArrayKeys.LOSS_SCALE].data
+
+    def test_slabs(self):
+
+        labels = np.array([
+            [0, 0, 0, 1, 1, 2],
+            [0, 0, 0, 1, 1, 2],
+            [0, 0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 1, 1]], dtype=np.uint8)
+
+        scale = self.balance(
+            labels,
+            slab=(2, -1),
+            num_classes=3,
+            clipmin=None,
+            clipmax=None)
+
+        # upper slab: 6 x class 0, 4 x class 1, 2 x class 2 of 12 voxels,
+        # weight is 1/(num_classes*frac)
+        w_upper = {0: 1/(3*6/12), 1: 1/(3*4/12), 2: 1/(3*2/12)}
+        # lower slab: 9 x class 0, 3 x class 1
+        w_lower = {0: 1/(3*9/12), 1: 1/(3*3/12)}
+
+        for (y, x), label in np.ndenumerate(labels):
+            w = w_upper if y < 2 else w_lower
+            self.assertAlmostEqual(scale[y, x], w[label], 5)
+
+    def test_mask(self):
+
+        labels = np.array([
+            [1, 1, 0, 0, 0],
+            [0, 0, 0, 0, 1]], dtype=np.uint8)
+        mask = np.array([
+            [1, 1, 1, 1, 0],
+            [0, 0, 1, 1, 1]], dtype=np.uint8)
+
+        scale = self.balance(labels, mask)
+
+        # 7 voxels masked in: 3 x class 1, 4 x class 0
+        w = {0: 1/(2*4/7), 1: 1/(2*3/7)}
+
+        for (y, x), label in np.ndenumerate(labels):
+            expected = w[label] if mask[y, x] else 0
+            self.assertAlmostEqual(scale[y, x], expected, 5)
+
+    def test_clip(self):
+
+        # a single positive of 40 voxels
+        labels = np.zeros((4, 10), dtype=np.uint8)
+        labels[0, 0] = 1
+
+        # default: fractions 1/40 and 39/40 are clipped to 0.05 and 0.95
+        scale = self.balance(labels)
+        self.assertAlmostEqual(scale[0, 0], 1/(2*0.05), 5)
+        self.assertAlmostEqual(scale[1, 1], 1/(2*0.95), 5)
+
+        scale = self.balance(labels, clipmin=0.1, clipmax=0.9)
+        self.assertAlmostEqual(scale[0, 0], 1/(2*0.1), 5)
+        self.assertAlmostEqual(scale[1, 1], 1/(2*0.9), 5)
+
+        # without clipping
+        scale = self.balance(labels, clipmin=None, clipmax=None)
+        self.assertAlmostEqual(scale[0, 0], 1/(2/40), 5)
+        self.assertAlmostEqual(scale[1, 1], 1/(2*39/40), 5)
@@ -0,0 +1,78 @@
+from .provider_test import ProviderTest
+from gunpowder import (
+    BatchProvider,
+    BatchFilter,
+    BatchRequest,
+    Batch,
+    Node,
+    Edge,
+    Graph,
+    GraphSpec,
+    GraphKey,
+    Roi,
+    build,
+)
+from gunpowder.pipeline import PipelineRequestError
+
+import numpy as np
+
+
+class StrayNodeSource(BatchProvider):
+    '''Provides a graph with an edge outside of the requested ROI.'''
+
+    def __init__(self, graph_key):
+        self.graph_key = graph_key
+
+    def setup(self):
+
+        self.provides(self.graph_key, GraphSpec(roi=Roi((0, 0, 0), (100, 100, 100))))
+
+    def provide(self, request):
+
+        roi = request[self.graph_key].roi
+        nodes = [
+            Node(0, location=np.array(roi.get_begin(), dtype=np.float32)),
+            Node(1, location=np.array(roi.get_end(), dtype=np.float32)),
+            Node(2, location=np.array(roi.get_end(), dtype=np.float32) + 1),
+        ]
+        edges = [Edge(1, 2)]
+
+        batch = Batch()
+        batch[self.graph_key] = Graph(nodes, edges, GraphSpec(roi=roi))
+        return batch
+
+
+class PassThrough(BatchFilter):
+
+    def process(self, batch, request):
+        pass
+
+
+class TestConsistencyChecks(ProviderTest):
+
+    def test_levels(self):
+
+        graph_key = GraphKey("STRAY_GRAPH")
+        request = BatchRequest()
+        request[graph_key] = GraphSpec(roi=Roi((10, 10, 10), (10, 10, 10)))
+
+        source = StrayNodeSource(graph_key)
+        pipeline = source + PassThrough()
+
+        with build(pipeline):
+            with self.assertRaises(PipelineRequestError):
+                pipeline.request_batch(request)
+
+        # the stray nodes are removed by the crop in PassThrough, the output of
+        # the pipeline is consistent
+        with build(pipeline, consistency_checks='boundary'):
+            batch = pipeline.request_batch(request)
+            self.assertEqual(batch[graph_key].num_vertices(), 1)
+
+        with build(source, consistency_checks='off'):
+            batch = source.request_batch(request)
+            self.assertEqual(batch[graph_key].num_vertices(), 3)
+
+        with build(source, consistency_checks='boundary'):
+            with self.assertRaises(Exception):
+                source.request_batch(request)
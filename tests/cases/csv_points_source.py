@@ -0,0 +1,116 @@
+from .provider_test import ProviderTest
+from gunpowder import (
+    BatchRequest,
+    CsvPointsSource,
+    GraphKey,
+    GraphSpec,
+    Roi,
+    build,
+)
+import numpy as np
+import os
+
+
+class TestCsvPointsSource(ProviderTest):
+
+    def write_points(self, filename, points):
+
+        with open(filename, 'w') as f:
+            for point in points:
+                f.write(', '.join(str(v) for v in point) + '\n')
+
+    def request_points(self, source, points_key, roi):
+
+        request = BatchRequest()
+        request[points_key] = GraphSpec(roi=roi)
+        with build(source):
+            batch = source.request_batch(request)
+        return [
+            (node.id, tuple(node.location))
+            for node in batch[points_key].nodes
+        ]
+
+    def test_index(self):
+
+        filename = self.path_to('points.csv')
+        points_key = GraphKey('POINTS')
+
+        np.random.seed(42)
+        points = np.random.randint(0, 100, size=(1000, 3))
+        self.write_points(filename, points)
+
+        rois = [
+            Roi((0, 0, 0), (100, 100, 100)),
+            Roi((10, 20, 30), (15, 25, 35)),
+            Roi((50, 0, 90), (1, 100, 10)),
+            Roi((0, 0, 0), (100, 100, 1)),
+        ]
+
+        for scale in [None, 2]:
+
+            source = CsvPointsSource(filename, points_key, scale=scale)
+            indexed = CsvPointsSource(
+                filename, points_key, scale=scale, use_index=True)
+
+            with build(source), build(indexed):
+                self.assertEqual(source.spec, indexed.spec)
+                provided_roi = source.spec[points_key].roi
+
+            for roi in rois:
+                if scale is not None:
+                    roi = (roi*scale).intersect(provided_roi)
+                expected = self.request_points(source, points_key, roi)
+                result = self.request_points(indexed, points_key, roi)
+                self.assertEqual(result, expected)
+
+        self.assertTrue(
+            os.path.isfile(self.path_to('points.csv.index', 'meta.json')))
+
+        # a changed file invalidates the index
+        self.write_points(filename, points[:10])
+        os.utime(filename, ns=(0, 0))
+        indexed = CsvPointsSource(filename, points_key, use_index=True)
+        with build(indexed):
+            provided_roi = indexed.spec[points_key].roi
+        result = self.request_points(indexed, points_key, provided_roi)
+        self.assertEqual(len(result), 10)
+
+    def test_index_planar(self):
+
+        from gunpowder.nodes.csv_points_source import CsvPointsIndex
+
+        filename = self.path_to('points_planar.csv')
+
+        # all points in the plane z=5, and in a thin slab along y
+        np.random.seed(42)
+        points = np.random.randint(0, 10000, size=(6400, 3))
+        points[:, 1] %= 10
+        points[:, 2] = 5
+        self.write_points(filename, points)
+
+        index = CsvPointsIndex(filename, points_per_cell=64)
+
+        # 100 cells along x, a single one along the flat dimensions
+        self.assertEqual(list(index.grid_shape), [101, 1, 1])
+
+        rows, _ = index.query((1000, 0, 0), (2000, 10, 10))
+        expected = np.sum((points[:, 0] >= 1000) & (points[:, 0] < 2000))
+        self.assertEqual(len(rows), expected)
+
+    def test_ids(self):
+
+        filename = self.path_to('points_with_ids.csv')
+        points_key = GraphKey('POINTS')
+
+        self.write_points(filename, [
+            (1, 1, 10),
+            (5, 5, 11),
+            (9, 9, 12),
+        ])
+
+        source = CsvPointsSource(
+            filename, points_key, ndims=2, id_dim=2, use_index=True)
+        result = self.request_points(
+            source, points_key, Roi((1, 1), (5, 5)))
+
+        self.assertEqual([i for i, _ in result], [10, 11])
@@ -0,0 +1,170 @@
+from .provider_test import ProviderTest
+from gunpowder import (
+    ArrayKey,
+    ArraySpec,
+    Array,
+    Batch,
+    BatchProvider,
+    BatchRequest,
+    DefectAugment,
+    Roi,
+    build,
+)
+import numpy as np
+
+
+class ConstantSource(BatchProvider):
+    def __init__(self, values, roi, dtype=np.float32):
+        self.values = values
+        self.roi = roi
+        self.dtype = dtype
+
+    def setup(self):
+        for key in self.values:
+            self.provides(
+                key,
+                ArraySpec(
+                    roi=self.roi,
+                    voxel_size=(1, 1, 1),
+                    dtype=self.dtype,
+                    interpolatable=True,
+                ),
+            )
+
+    def provide(self, request):
+        batch = Batch()
+        for key, value in self.values.items():
+            if key not in request:
+                continue
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            shape = spec.roi.get_shape()
+            batch[key] = Array(np.full(shape, value, dtype=self.dtype), spec)
+        return batch
+
+
+class RampSource(ConstantSource):
+    def provide(self, request):
+        batch = super().provide(request)
+        for key in self.values:
+            data = batch[key].data
+            ramp = np.linspace(0, 1, data.shape[-1])
+            batch[key].data = (data * ramp).astype(self.dtype)
+        return batch
+
+
+class TestDefectAugment(ProviderTest):
+    def test_output(self):
+
+        raw = ArrayKey("DEFECT_RAW")
+        artifacts = ArrayKey("DEFECT_ARTIFACTS")
+        artifacts_mask = ArrayKey("DEFECT_ARTIFACTS_MASK")
+
+        request = BatchRequest()
+        request[raw] = ArraySpec(roi=Roi((0, 0, 0), (10, 20, 20)))
+
+        for pool_size in [0, 3]:
+
+            artifact_source = ConstantSource(
+                {artifacts: 0.5, artifacts_mask: 0.5},
+                Roi((0, 0, 0), (100, 100, 100)),
+            )
+            pipeline = ConstantSource(
+                {raw: 1.0}, Roi((0, 0, 0), (10, 20, 20))
+            ) + DefectAugment(
+                raw,
+                prob_missing=0.3,
+                prob_low_contrast=0.3,
+                prob_artifact=0.4,
+                contrast_scale=0.5,
+                artifact_source=artifact_source,
+                artifacts=artifacts,
+                artifacts_mask=artifacts_mask,
+                artifact_pool_size=pool_size,
+            )
+
+            with build(pipeline):
+                for _ in range(5):
+                    data = pipeline.request_batch(request)[raw].data
+
+                    # every section was augmented in one of three ways
+                    sections = set(np.unique(data.reshape(10, -1), axis=1).flatten())
+                    self.assertTrue(sections.issubset({0.0, 1.0, 0.75}))
+                    self.assertTrue((data.reshape(10, -1) == data[:, :1, :1].reshape(10, 1)).all())
+
+    def test_low_contrast(self):
+
+        raw = ArrayKey("DEFECT_RAW")
+
+        request = BatchRequest()
+        request[raw] = ArraySpec(roi=Roi((0, 0, 0), (10, 20, 21)))
+
+        pipeline = RampSource({raw: 1.0}, Roi((0, 0, 0), (10, 20, 21))) + DefectAugment(
+            raw, prob_missing=0.0, prob_low_contrast=1.0, contrast_scale=0.5
+        )
+
+        with build(pipeline):
+            data = pipeline.request_batch(request)[raw].data
+
+        # each section is scaled around its mean of 0.5
+        expected = 0.5 + 0.5 * (np.linspace(0, 1, 21) - 0.5)
+        self.assertTrue(np.allclose(data, expected))
+
+    def test_low_contrast_uint8(self):
+
+        raw = ArrayKey("DEFECT_RAW")
+
+        request = BatchRequest()
+        request[raw] = ArraySpec(roi=Roi((0, 0, 0), (10, 20, 21)))
+
+        pipeline = RampSource(
+            {raw: 200}, Roi((0, 0, 0), (10, 20, 21)), dtype=np.uint8
+        ) + DefectAugment(
+            raw, prob_missing=0.0, prob_low_contrast=1.0, contrast_scale=0.5
+        )
+
+        with build(pipeline):
+            data = pipeline.request_batch(request)[raw].data
+
+        ramp = (200 * np.linspace(0, 1, 21)).astype(np.uint8)
+        mean = ramp.mean()
+        expected = np.round(mean + 0.5 * (ramp - mean)).astype(np.uint8)
+        self.assertEqual(data.dtype, np.uint8)
+        self.assertTrue((data == expected).all())
+
+    def test_artifact_pool_shapes(self):
+
+        raw = ArrayKey("DEFECT_RAW")
+        artifacts = ArrayKey("DEFECT_ARTIFACTS")
+        artifacts_mask = ArrayKey("DEFECT_ARTIFACTS_MASK")
+
+        artifact_source = ConstantSource(
+            {artifacts: 0.5, artifacts_mask: 0.5},
+            Roi((0, 0, 0), (100, 100, 100)),
+        )
+        pipeline = ConstantSource(
+            {raw: 1.0}, Roi((0, 0, 0), (10, 60, 60))
+        ) + DefectAugment(
+            raw,
+            prob_missing=0.0,
+            prob_low_contrast=0.0,
+            prob_artifact=0.5,
+            prob_deform=0.2,
+            deformation_strength=3,
+            artifact_source=artifact_source,
+            artifacts=artifacts,
+            artifacts_mask=artifacts_mask,
+            artifact_pool_size=3,
+        )
+
+        with build(pipeline):
+            # different section shapes are cropped from the same pool
+            for size in [10, 20, 14, 30]:
+
+                request = BatchRequest()
+                request[raw] = ArraySpec(
+                    roi=Roi((0, 10, 10), (10, size, size)))
+                data = pipeline.request_batch(request)[raw].data
+
+                self.assertEqual(data.shape, (10, size, size))
+                self.assertTrue(((data >= 0.0) & (data <= 1.0)).all())
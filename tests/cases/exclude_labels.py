@@ -0,0 +1,62 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+import numpy as np
+
+
+class ExcludeLabelsTestSource(BatchProvider):
+
+    def setup(self):
+
+        self.provides(
+            ArrayKeys.GT_LABELS, ArraySpec(
+                roi=Roi((0, 0, 0), (10, 40, 40)),
+                voxel_size=(1, 2, 2)))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        roi = request[ArrayKeys.GT_LABELS].roi
+        data = np.zeros((10, 20, 20), dtype=np.uint64)
+        data[:, :, :5] = 1
+        data[:, :, 5:10] = 2
+        data[:, :, 10:] = 3
+
+        spec = self.spec[ArrayKeys.GT_LABELS].copy()
+        spec.roi = roi
+        batch.arrays[ArrayKeys.GT_LABELS] = Array(data, spec)
+
+        return batch
+
+
+class TestExcludeLabels(ProviderTest):
+
+    def test_output(self):
+
+        ArrayKey('GT_IGNORE')
+
+        pipeline = (
+            ExcludeLabelsTestSource() +
+            ExcludeLabels(
+                ArrayKeys.GT_LABELS,
+                exclude=[2, 3],
+                ignore_mask=ArrayKeys.GT_IGNORE,
+                ignore_mask_erode=5))
+
+        request = BatchRequest()
+        request.add(ArrayKeys.GT_LABELS, (10, 40, 40))
+        request.add(ArrayKeys.GT_IGNORE, (10, 40, 40))
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        labels = batch[ArrayKeys.GT_LABELS].data
+        ignore = batch[ArrayKeys.GT_IGNORE].data
+
+        self.assertEqual(list(np.unique(labels)), [0, 1])
+        self.assertTrue((labels[:, :, :5] == 1).all())
+
+        # excluded labels are ignored further than 5 world units away from
+        # included labels
+        self.assertTrue((ignore[:, :, :7] == 1).all())
+        self.assertTrue((ignore[:, :, 7:] == 0).all())
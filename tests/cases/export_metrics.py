@@ -0,0 +1,61 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+import json
+import time
+import urllib.request
+
+
+class Delay(BatchFilter):
+
+    def process(self, batch, request):
+        time.sleep(0.01)
+
+
+class TestExportMetrics(ProviderTest):
+
+    def test_metrics(self):
+
+        filename = self.path_to('metrics.json')
+        export_metrics = ExportMetrics(port=0, filename=filename, interval=0.1)
+
+        pipeline = (
+            self.test_source +
+            Delay() +
+            PreCache(cache_size=4, num_workers=2) +
+            export_metrics
+        )
+
+        with build(pipeline):
+
+            for i in range(5):
+                pipeline.request_batch(self.test_request)
+
+            url = 'http://localhost:%d/metrics' % export_metrics.port
+            with urllib.request.urlopen(url) as response:
+                content = response.read().decode()
+
+            self.assertIn('gunpowder_batches_total 5', content)
+            self.assertIn(
+                'gunpowder_node_latency_seconds_count'
+                '{node="Delay",method="process"} 5',
+                content)
+            self.assertIn('gunpowder_precache_workers{index="0"} 2', content)
+            self.assertIn('gunpowder_precache_capacity{index="0"} 4', content)
+
+            # wait for the JSON file to be written
+            time.sleep(0.5)
+            with open(filename) as f:
+                metrics = json.load(f)
+            self.assertEqual(metrics['batches_total'], 5)
+
+        # written once more on teardown
+        with open(filename) as f:
+            metrics = json.load(f)
+
+        self.assertEqual(metrics['batches_total'], 5)
+        self.assertGreater(metrics['batches_per_second'], 0)
+        latency = [
+            l for l in metrics['latencies']
+            if l['node'] == 'Delay' and l['method'] == 'process'][0]
+        self.assertGreaterEqual(latency['p50'], 0.01)
+        self.assertEqual(latency['count'], 5)
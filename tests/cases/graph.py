@@ -184,6 +184,34 @@ class TestGraphs(ProviderTest):
         self.assertTrue(g.spec.directed)
         self.assertFalse(sub_g.spec.directed)
 
+    def test_crop_dangling(self):
+        g = Graph(self.nodes, self.edges, self.spec)
+
+        sub_g = g.crop(Roi(Coordinate([1, 1, 1]), Coordinate([2, 2, 2])))
+        self.assertCountEqual([n.id for n in sub_g.nodes], [0, 1, 2, 3])
+        self.assertCountEqual(
+            [(e.u, e.v) for e in sub_g.edges], [(0, 1), (1, 2), (2, 3)]
+        )
+
+        # modifying the cropped graph does not modify the original
+        for node in sub_g.nodes:
+            node.location += 10
+        for node in g.nodes:
+            self.assertTrue(all(np.isclose(node.location, [node.id] * 3)))
+
+    def test_trim(self):
+        g = Graph(self.nodes, self.edges, self.spec)
+        roi = Roi(Coordinate([1, 1, 1]), Coordinate([2, 2, 2]))
+
+        trimmed = g.trim(roi)
+        # edge (0, 1) leaves roi exactly at node 1, so node 0 is removed without
+        # replacement, node 3 is replaced by a temporary node on the boundary
+        self.assertCountEqual([n.original_id for n in trimmed.nodes], [1, 2, None])
+        for node in trimmed.nodes:
+            self.assertTrue(roi.contains(node.location))
+        self.assertEqual(trimmed.num_edges(), 2)
+        self.assertEqual(g.num_vertices(), 5)
+
 
 def test_nodes():
 
@@ -211,3 +239,43 @@ def test_nodes():
 
     for node in graph.nodes:
         assert all(np.isclose(node.location, replacement_locations[node.id]))
+
+
+def test_locations():
+
+    nodes = [
+        Node(id=i, location=np.array([i, 2 * i, 3 * i], dtype=np.float32))
+        for i in range(4)
+    ]
+    spec = GraphSpec(roi=Roi((0, 0, 0), (10, 10, 10)))
+    graph = Graph(nodes, [Edge(0, 1)], spec)
+
+    locations = graph.locations
+    assert locations.shape == (4, 3)
+    assert locations.dtype == np.float32
+    for node_id, location in zip(graph.node_ids, locations):
+        assert all(np.isclose(location, [node_id, 2 * node_id, 3 * node_id]))
+
+    graph.shift(np.array([1, 1, 1]))
+    for node in graph.nodes:
+        assert all(np.isclose(node.location, [node.id + 1, 2 * node.id + 1, 3 * node.id + 1]))
+
+    # swap first two axes and shift back
+    matrix = np.array([[0, 1, 0], [1, 0, 0], [0, 0, 1]])
+    graph.affine_transform(matrix, offset=np.array([-1, -1, -1]))
+    for node in graph.nodes:
+        assert node.location.dtype == np.float32
+        assert all(np.isclose(node.location, [2 * node.id, node.id, 3 * node.id]))
+
+    # assigned locations are copied per node
+    locations = np.zeros((4, 3), dtype=np.float32)
+    graph.locations = locations
+    locations += 1
+    graph.node(0).location += 5
+    for node in graph.nodes:
+        expected = 5 if node.id == 0 else 0
+        assert all(np.isclose(node.location, [expected] * 3))
+
+    empty = Graph([], [], GraphSpec(roi=Roi((0, 0, 0), (10, 10, 10))))
+    assert empty.locations.shape == (0, 3)
+    empty.shift(np.array([1, 1, 1]))
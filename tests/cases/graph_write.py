@@ -0,0 +1,135 @@
+from .provider_test import ProviderTest
+from gunpowder import (
+    BatchProvider,
+    BatchRequest,
+    Batch,
+    Edge,
+    Graph,
+    GraphKey,
+    GraphSource,
+    GraphSpec,
+    GraphWrite,
+    Node,
+    Roi,
+    Scan,
+    build,
+)
+from gunpowder.ext import zarr, h5py, NoSuchModule
+from unittest import skipIf
+import copy
+import numpy as np
+
+
+class GraphWriteTestSource(BatchProvider):
+
+    def __init__(self, key, graph):
+        self.key = key
+        self.graph = graph
+
+    def setup(self):
+        self.provides(self.key, self.graph.spec)
+
+    def provide(self, request):
+        batch = Batch()
+        batch[self.key] = copy.deepcopy(
+            self.graph.crop(request[self.key].roi))
+        return batch
+
+
+def random_graph(num_nodes, roi):
+
+    np.random.seed(42)
+    locations = np.random.randint(
+        roi.get_begin(),
+        roi.get_end(),
+        size=(num_nodes, roi.dims())).astype(np.float32)
+    nodes = [
+        Node(
+            id=i*3 + 1,
+            location=location,
+            attrs={'radius': float(i % 5), 'color': np.array([i, i + 1])})
+        for i, location in enumerate(locations)
+    ]
+    # a few long chains through the whole ROI
+    edges = [
+        Edge(nodes[i].id, nodes[i + 1].id, attrs={'weight': float(i)})
+        for i in range(num_nodes - 1)
+        if i % 50 != 49
+    ]
+
+    return Graph(nodes, edges, GraphSpec(roi=roi, directed=True))
+
+
+def to_sets(graph):
+
+    nodes = set(
+        (node.id, tuple(node.location), node.attrs['radius'],
+         tuple(node.attrs['color']))
+        for node in graph.nodes)
+    edges = set(
+        (edge.u, edge.v, edge.all['weight'])
+        for edge in graph.edges)
+    return nodes, edges
+
+
+class TestGraphWrite(ProviderTest):
+
+    def write_and_read(self, filename, num_workers=1):
+
+        path = self.path_to(filename)
+        key = GraphKey('TEST_GRAPH')
+        roi = Roi((0, 0, 0), (100, 100, 100))
+        graph = random_graph(500, roi)
+
+        chunk_request = BatchRequest()
+        chunk_request[key] = GraphSpec(roi=Roi((0, 0, 0), (20, 25, 30)))
+
+        pipeline = (
+            GraphWriteTestSource(key, graph) +
+            GraphWrite(
+                {key: 'graphs/test'},
+                output_filename=path,
+                node_attrs=['radius', 'color'],
+                edge_attrs=['weight']) +
+            Scan(chunk_request, num_workers=num_workers))
+
+        with build(pipeline):
+            request = BatchRequest()
+            request[key] = GraphSpec(roi=roi)
+            pipeline.request_batch(request)
+
+        source = GraphSource(path, {key: 'graphs/test'})
+
+        with build(source):
+
+            self.assertEqual(source.spec[key].roi, roi)
+            self.assertTrue(source.spec[key].directed)
+
+            for read_roi in [
+                    roi,
+                    Roi((0, 0, 0), (20, 25, 30)),
+                    Roi((13, 27, 41), (31, 17, 29)),
+                    Roi((50, 50, 50), (1, 1, 1))]:
+
+                request = BatchRequest()
+                request[key] = GraphSpec(roi=read_roi)
+                batch = source.request_batch(request)
+
+                expected = to_sets(graph.crop(read_roi))
+                self.assertEqual(to_sets(batch[key]), expected)
+
+    @skipIf(isinstance(zarr, NoSuchModule), 'zarr is not installed')
+    def test_zarr(self):
+        self.write_and_read('graph_write_test.zarr')
+
+    @skipIf(isinstance(h5py, NoSuchModule), 'h5py is not installed')
+    def test_hdf(self):
+        self.write_and_read('graph_write_test.hdf')
+
+    @skipIf(isinstance(zarr, NoSuchModule), 'zarr is not installed')
+    def test_zarr_workers(self):
+        self.write_and_read('graph_write_test_workers.zarr', num_workers=3)
+
+    @skipIf(isinstance(h5py, NoSuchModule), 'h5py is not installed')
+    def test_hdf_workers(self):
+        self.write_and_read('graph_write_test_workers.hdf', num_workers=3)
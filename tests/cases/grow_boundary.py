@@ -0,0 +1,75 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+import numpy as np
+
+
+class GrowBoundaryTestSource(BatchProvider):
+
+    def setup(self):
+
+        self.provides(
+            ArrayKeys.GT_LABELS, ArraySpec(
+                roi=Roi((0, 0, 0), (3, 6, 6)),
+                voxel_size=(1, 1, 1)))
+        self.provides(
+            ArrayKeys.GT_MASK, ArraySpec(
+                roi=Roi((0, 0, 0), (3, 6, 6)),
+                voxel_size=(1, 1, 1)))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        labels = np.zeros((3, 6, 6), dtype=np.uint64)
+        labels[:, :, :3] = 1
+        labels[:, :, 3:] = 2**60 + 1
+
+        mask = np.ones((3, 6, 6), dtype=np.uint8)
+        mask[:, :3, :] = 0
+
+        for key, data in [
+                (ArrayKeys.GT_LABELS, labels),
+                (ArrayKeys.GT_MASK, mask)]:
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(data, spec)
+
+        return batch
+
+
+class TestGrowBoundary(ProviderTest):
+
+    def test_output(self):
+
+        request = BatchRequest()
+        request.add(ArrayKeys.GT_LABELS, (3, 6, 6))
+        request.add(ArrayKeys.GT_MASK, (3, 6, 6))
+
+        pipeline = (
+            GrowBoundaryTestSource() +
+            GrowBoundary(ArrayKeys.GT_LABELS, steps=1, only_xy=True))
+
+        with build(pipeline):
+            labels = pipeline.request_batch(request)[ArrayKeys.GT_LABELS].data
+
+        # the boundary grows on both sides, but not at the batch border
+        self.assertTrue((labels[:, :, 2:4] == 0).all())
+        self.assertTrue((labels[:, :, :2] == 1).all())
+        self.assertTrue((labels[:, :, 4:] == 2**60 + 1).all())
+
+        pipeline = (
+            GrowBoundaryTestSource() +
+            GrowBoundary(
+                ArrayKeys.GT_LABELS,
+                mask=ArrayKeys.GT_MASK,
+                steps=1))
+
+        with build(pipeline):
+            labels = pipeline.request_batch(request)[ArrayKeys.GT_LABELS].data
+
+        # the boundary does not grow into the masked region
+        self.assertTrue((labels[:, 3:, 2:4] == 0).all())
+        self.assertTrue((labels[:, :3, 2] == 1).all())
+        self.assertTrue((labels[:, :3, 3] == 2**60 + 1).all())
+        self.assertTrue((labels[:, :, :2] == 1).all())
+        self.assertTrue((labels[:, :, 4:] == 2**60 + 1).all())
@@ -0,0 +1,107 @@
+import unittest
+
+import numpy as np
+from skimage import draw
+
+from gunpowder.morphology import (
+    create_ball_kernel,
+    enlarge_binary_map,
+    kernel_cache_info,
+    set_kernel_cache_size,
+    stamp_kernel,
+)
+import gunpowder.morphology as morphology
+
+
+class TestMorphology(unittest.TestCase):
+
+    def test_ball_kernel(self):
+
+        kernel = create_ball_kernel(5, (2, 1, 1))
+        self.assertEqual(kernel.shape, (7, 11, 11))
+        self.assertEqual(kernel[3, 5, 5], 1)
+        self.assertEqual(kernel[3, 5, 10], 1)
+        self.assertEqual(kernel[0, 5, 5], 0)
+        self.assertFalse(kernel.flags.writeable)
+
+        # anisotropic radius
+        kernel = create_ball_kernel((4, 2), (1, 1))
+        self.assertEqual(kernel.shape, (9, 5))
+        self.assertEqual(kernel[0, 2], 1)
+        self.assertEqual(kernel[4, 0], 1)
+        self.assertEqual(kernel[0, 1], 0)
+
+        # ring
+        ring = create_ball_kernel(5, (1, 1), ring_fraction=0.5)
+        self.assertEqual(ring[5, 5], 0)
+        self.assertEqual(ring[5, 7], 0)
+        self.assertEqual(ring[5, 8], 1)
+        self.assertEqual(ring[5, 10], 1)
+
+    def test_kernel_cache(self):
+
+        set_kernel_cache_size(2)
+        try:
+            a = create_ball_kernel(3, (1, 1))
+            self.assertIs(create_ball_kernel(3.0, np.array([1, 1])), a)
+            create_ball_kernel(4, (1, 1))
+            create_ball_kernel(5, (1, 1))
+            info = kernel_cache_info()
+            self.assertEqual(info.hits, 1)
+            self.assertEqual(info.currsize, 2)
+            # least recently used kernel got evicted
+            self.assertIsNot(create_ball_kernel(3, (1, 1)), a)
+        finally:
+            set_kernel_cache_size(128)
+
+    def test_stamp_kernel(self):
+
+        array = np.zeros((10, 10), dtype=np.uint8)
+        mask = np.zeros((10, 10), dtype=np.uint64)
+        mask[:, 5:] = 2
+        kernel = create_ball_kernel(2, (1, 1))
+
+        stamp_kernel(array, kernel, (0, 4), mask=mask, label=2)
+        self.assertEqual(array.sum(), 3)
+        self.assertEqual(array[:, 5:].sum(), 3)
+
+        stamp_kernel(array, kernel, (9, 9))
+        self.assertEqual(array[9, 7], 1)
+        self.assertEqual(array[7, 9], 1)
+
+        # no overlap
+        stamp_kernel(array, kernel, (-5, -5))
+
+    def test_enlarge_binary_map(self):
+
+        shape = (20, 50, 50)
+        binary_map = np.zeros(shape, dtype=np.uint8)
+        for begin, end in [((1, 2, 3), (15, 40, 20)), ((10, 45, 45), (19, 0, 30))]:
+            binary_map[draw.line_nd(begin, end, endpoint=True)] = 1
+
+        for radius, voxel_size, ring_fraction in [
+                (np.array([3.0]), (1, 1, 1), None),
+                (np.array([40.0, 40.0, 20.0]), (40, 4, 4), 0.25),
+                (np.array([2.5]), (1, 1, 1), 0.5)]:
+
+            expected = enlarge_binary_map(
+                binary_map,
+                radius,
+                voxel_size,
+                ring_fraction,
+                blockwise=False)
+
+            # force stamping and blockwise distance transforms
+            for edt_cost, stamp_overhead in [(1e9, 500), (20, 1e12)]:
+                morphology._EDT_COST = edt_cost
+                morphology._STAMP_OVERHEAD = stamp_overhead
+                try:
+                    enlarged = enlarge_binary_map(
+                        binary_map,
+                        radius,
+                        voxel_size,
+                        ring_fraction)
+                finally:
+                    morphology._EDT_COST = 20
+                    morphology._STAMP_OVERHEAD = 500
+                np.testing.assert_array_equal(enlarged, expected)
@@ -1,6 +1,9 @@
 from .provider_test import ProviderTest
 from gunpowder import *
+import json
+import os
 import time
+import numpy as np
 
 class DelayNode(BatchFilter):
 
@@ -48,3 +51,190 @@ class TestProfiling(ProviderTest):
         # is the upstream time correct?
         self.assertGreaterEqual(profiling_stats.span_time(), 0.1+0.2+0.2+0.3) # total time spend upstream
         self.assertLessEqual(profiling_stats.span_time(), 0.1+0.2+0.2+0.3 + 0.1) # plus bit of tolerance
+
+class GrowNode(BatchFilter):
+
+    def prepare(self, request):
+
+        deps = BatchRequest()
+        deps[ArrayKeys.RAW] = request[ArrayKeys.RAW].copy()
+        deps[ArrayKeys.RAW].roi = deps[ArrayKeys.RAW].roi.grow((1, 1, 1), (1, 1, 1))
+        return deps
+
+    def process(self, batch, request):
+        pass
+
+class TestAllocations(ProviderTest):
+
+    def test_allocations(self):
+
+        num_nodes = 15
+
+        pipeline = self.test_source
+        for _ in range(num_nodes):
+            pipeline += GrowNode()
+
+        with build(pipeline):
+            batch = pipeline.request_batch(self.test_request)
+
+        allocations = batch.profiling_stats.get_allocations()[('GrowNode', 'process')]
+
+        # one spec per crop to the downstream request, attrs and data are
+        # never copied
+        self.assertEqual(allocations['array_spec'], num_nodes)
+        self.assertEqual(allocations['array_attrs'], 0)
+        self.assertEqual(allocations['array_data'], 0)
+
+        # attrs are copied on access
+        cropped = batch[ArrayKeys.RAW].crop(Roi((21, 21, 21), (5, 5, 5)), copy=False)
+        cropped.attrs['foo'] = 'bar'
+        self.assertNotIn('foo', batch[ArrayKeys.RAW].attrs)
+
+        # the source keeps its attrs, also when referenced before a crop
+        attrs = batch[ArrayKeys.RAW].attrs
+        batch[ArrayKeys.RAW].crop(Roi((21, 21, 21), (5, 5, 5)), copy=False)
+        attrs['bar'] = 'baz'
+        self.assertIn('bar', batch[ArrayKeys.RAW].attrs)
+        self.assertTrue(
+            np.shares_memory(cropped.data, batch[ArrayKeys.RAW].data))
+
+class AllocateNode(BatchFilter):
+
+    def setup(self):
+        self.provides(ArrayKeys.GT_LABELS, self.spec[ArrayKeys.RAW].copy())
+
+    def prepare(self, request):
+        deps = BatchRequest()
+        deps[ArrayKeys.RAW] = request[ArrayKeys.GT_LABELS].copy()
+        return deps
+
+    def process(self, batch, request):
+
+        # a temporary of 8MB
+        temp = np.ones((2**20,), dtype=np.float64)
+        del temp
+
+        spec = batch[ArrayKeys.RAW].spec.copy()
+        spec.roi = request[ArrayKeys.GT_LABELS].roi
+        outputs = Batch()
+        outputs[ArrayKeys.GT_LABELS] = Array(batch[ArrayKeys.RAW].data.copy(), spec)
+        return outputs
+
+class TestMemoryProfiling(ProviderTest):
+
+    def test_memory_profiling(self):
+
+        request = BatchRequest()
+        request[ArrayKeys.GT_LABELS] = ArraySpec(roi=Roi((0, 0, 0), (100, 100, 100)))
+
+        pipeline = (
+            self.test_source +
+            AllocateNode() +
+            PrintProfilingStats(profile_memory=True)
+        )
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        summary = batch.profiling_stats.get_timing_summary('AllocateNode', 'process')
+        self.assertTrue(summary.memory_profiled())
+        self.assertGreaterEqual(summary.max_peak_bytes(), 2**23)
+        self.assertEqual(summary.mean_array_bytes(), 100**3)
+
+        # memory is not traced without profile_memory
+        pipeline = self.test_source + AllocateNode()
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        summary = batch.profiling_stats.get_timing_summary('AllocateNode', 'process')
+        self.assertFalse(summary.memory_profiled())
+        self.assertEqual(summary.mean_array_bytes(), 100**3)
+
+    def test_nested_peaks(self):
+
+        import tracemalloc
+        from gunpowder.profiling import Timing
+
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+
+        try:
+            outer = Timing(self)
+            inner = Timing(self)
+
+            outer.start()
+            # a temporary of 8MB before the inner timing starts
+            temp = np.ones((2**20,), dtype=np.float64)
+            del temp
+            inner.start()
+            inner.stop()
+            outer.stop()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        self.assertGreaterEqual(outer.peak_bytes(), 2**23)
+        self.assertLess(inner.peak_bytes(), 2**23)
+
+class TestTraceProfiling(ProviderTest):
+
+    def test_trace(self):
+
+        filename = self.path_to('trace.json')
+
+        pipeline = (
+            self.test_source +
+            DelayNode(0.01, 0.02) +
+            PreCache(cache_size=2, num_workers=2) +
+            DelayNode(0.01, 0.02) +
+            TraceProfilingStats(filename)
+        )
+
+        with build(pipeline):
+            for i in range(3):
+                pipeline.request_batch(self.test_request)
+
+        with open(filename) as f:
+            trace = json.load(f)
+
+        events = [e for e in trace if e['ph'] == 'X']
+        processes = [e for e in trace if e['ph'] == 'M']
+
+        delay_events = [e for e in events if e['name'] == 'DelayNode.process']
+        self.assertEqual(len(delay_events), 6)
+        for event in delay_events:
+            self.assertGreaterEqual(event['dur'], 0.02*1e6)
+
+        # the upstream DelayNode ran in PreCache workers
+        pids = set(e['pid'] for e in delay_events)
+        self.assertIn(os.getpid(), pids)
+        self.assertGreater(len(pids), 1)
+        self.assertEqual(pids, set(p['pid'] for p in processes))
+
+    def test_trace_every(self):
+
+        filename = self.path_to('trace_every.json')
+
+        pipeline = (
+            self.test_source +
+            DelayNode(0.0, 0.0) +
+            TraceProfilingStats(filename, every=1)
+        )
+
+        with build(pipeline):
+            for i in range(3):
+                pipeline.request_batch(self.test_request)
+
+                # events of all batches so far have been appended, only the
+                # closing bracket is missing
+                with open(filename) as f:
+                    trace = json.loads(f.read() + ']')
+                delay_events = [
+                    e for e in trace if e['name'] == 'DelayNode.process']
+                self.assertEqual(len(delay_events), i + 1)
+
+        with open(filename) as f:
+            trace = json.load(f)
+        self.assertEqual(
+            len([e for e in trace if e['name'] == 'DelayNode.process']), 3)
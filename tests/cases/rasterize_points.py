@@ -269,6 +269,71 @@ class TestRasterizePoints(ProviderTest):
             self.assertEqual(rasterized[1, 0, 0], 1)
             self.assertEqual(rasterized[2, 0, 0], 0)
 
+    def test_mask(self):
+
+        graph_key = GraphKey("TEST_GRAPH_MASKED")
+        labels_key = ArrayKey("TEST_GRAPH_LABELS")
+        array_key = ArrayKey("RASTERIZED_MASKED")
+
+        roi = Roi((0, 0, 0), (10, 10, 20))
+        nodes = [
+            Node(id=1, location=np.array((5.5, 5.5, 8.5))),
+            Node(id=2, location=np.array((5.5, 5.5, 16.5))),
+        ]
+        labels = np.ones((10, 10, 20), dtype=np.uint64)
+        labels[:, :, 10:] = 2
+
+        class Source(BatchProvider):
+
+            def __init__(self, edges):
+                self.graph = Graph(nodes, edges, GraphSpec(roi=roi))
+
+            def setup(self):
+                self.provides(graph_key, GraphSpec(roi=roi))
+                self.provides(
+                    labels_key,
+                    ArraySpec(roi=roi, voxel_size=(1, 1, 1)))
+
+            def provide(self, request):
+                batch = Batch()
+                graph_roi = request[graph_key].roi
+                batch[graph_key] = self.graph.crop(graph_roi).trim(graph_roi)
+                labels_roi = request[labels_key].roi
+                spec = self.spec[labels_key].copy()
+                spec.roi = labels_roi
+                batch[labels_key] = Array(labels[labels_roi.to_slices()], spec)
+                return batch
+
+        for edges in [[], [Edge(1, 2)]]:
+
+            pipeline = Source(edges) + RasterizeGraph(
+                graph_key,
+                array_key,
+                ArraySpec(voxel_size=(1, 1, 1)),
+                RasterizationSettings(radius=3, mask=labels_key),
+            )
+
+            with build(pipeline):
+
+                request = BatchRequest()
+                request[array_key] = ArraySpec(roi=roi)
+
+                rasterized = pipeline.request_batch(request)[array_key].data
+
+            self.assertEqual(rasterized[5, 5, 5], 1)
+            self.assertEqual(rasterized[5, 5, 9], 1)
+            self.assertEqual(rasterized[5, 5, 13], 1)
+            self.assertEqual(rasterized[5, 5, 19], 1)
+
+            if edges:
+                # edges are rasterized in all objects
+                self.assertTrue(np.all(rasterized[5, 5, 5:20] == 1))
+            else:
+                # balls don't cross into other objects
+                self.assertEqual(rasterized[5, 5, 10], 0)
+                self.assertEqual(rasterized[5, 5, 11], 0)
+                self.assertEqual(rasterized[5, 5, 12], 0)
+
     def test_with_edge(self):
         graph_with_edge = GraphKey("TEST_GRAPH_WITH_EDGE")
         array_with_edge = ArrayKey("RASTERIZED_EDGE")
@@ -294,3 +359,50 @@ class TestRasterizePoints(ProviderTest):
             assert (
                 rasterized.sum() == 10
             ), f"rasterized has ones at: {np.where(rasterized==1)}"
+
+    def test_with_edge_offset(self):
+
+        graph_key = GraphKey("TEST_GRAPH_WITH_EDGE_OFFSET")
+        array_key = ArrayKey("RASTERIZED_EDGE_OFFSET")
+
+        # a long edge in a ROI not starting at the origin, sparse enough for
+        # blockwise growing
+        roi = Roi((100, 100, 100), (100, 100, 100))
+        nodes = [
+            Node(id=1, location=np.array((110.5, 150.5, 150.5))),
+            Node(id=2, location=np.array((189.5, 150.5, 150.5))),
+        ]
+        graph = Graph(nodes, [Edge(1, 2)], GraphSpec(roi=roi))
+
+        class Source(BatchProvider):
+
+            def setup(self):
+                self.provides(graph_key, GraphSpec(roi=roi))
+
+            def provide(self, request):
+                batch = Batch()
+                batch[graph_key] = graph.crop(request[graph_key].roi).trim(
+                    request[graph_key].roi)
+                return batch
+
+        pipeline = Source() + RasterizeGraph(
+            graph_key,
+            array_key,
+            ArraySpec(voxel_size=(1, 1, 1)),
+            settings=RasterizationSettings(3, inner_radius_fraction=0.5),
+        )
+
+        with build(pipeline):
+            request = BatchRequest()
+            request[array_key] = ArraySpec(roi=roi)
+
+            rasterized = pipeline.request_batch(request)[array_key].data
+
+        z, y, x = np.nonzero(rasterized)
+        self.assertEqual(z.min(), 7)
+        self.assertEqual(z.max(), 92)
+        self.assertTrue(np.all(np.abs(y - 50) <= 3))
+        self.assertTrue(np.all(np.abs(x - 50) <= 3))
+        # hollow along the edge
+        self.assertEqual(rasterized[50, 50, 50], 0)
+        self.assertEqual(rasterized[50, 50, 53], 1)
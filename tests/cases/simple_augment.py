@@ -257,3 +257,37 @@ def test_mismatched_voxel_multiples():
         data = batch[test_array].data
 
         assert data[1, 2] == 1, f"{data}"
+
+
+def test_contiguous():
+
+    test_array = ArrayKey("TEST_ARRAY")
+    data = np.arange(36, dtype=np.float32).reshape(6, 6)
+    source = ArraySource(
+        test_array,
+        Array(data, ArraySpec(roi=Roi((0, 0), (6, 6)), voxel_size=(1, 1))),
+    )
+
+    request = BatchRequest()
+    request[test_array] = ArraySpec(roi=Roi((0, 0), (6, 6)))
+
+    for contiguous in [False, True]:
+
+        pipeline = source + SimpleAugment(
+            mirror_probs=[1, 1],
+            transpose_probs={(1, 0): 1},
+            contiguous=contiguous,
+        )
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        augmented = batch[test_array].data
+        assert (augmented == data[::-1, ::-1].T).all()
+
+        # views, unless contiguous data is requested
+        assert augmented.flags.c_contiguous == contiguous
+        allocations = batch.profiling_stats.get_allocations()[
+            ("SimpleAugment", "process")
+        ]
+        assert allocations["array_data"] == (1 if contiguous else 0)
@@ -16,8 +16,10 @@ from gunpowder import (
     Roi,
     build,
 )
+from gunpowder.nodes.snapshot import SnapshotWriter
 import numpy as np
 
+import threading
 import unittest
 import tempfile
 import shutil
@@ -114,3 +116,70 @@ class TestSnapshot(unittest.TestCase):
 
             assert not snapshot_file_path.exists()
 
+
+    def test_background(self):
+
+        test_array = ArrayKey("TEST_ARRAY")
+        array_spec = ArraySpec(
+            roi=Roi((0, 0, 0), (5, 5, 5)), voxel_size=Coordinate((1, 1, 1))
+        )
+        test_graph = GraphKey("TEST_GRAPH")
+        graph_spec = GraphSpec(roi=Roi((0, 0, 0), (5, 5, 5)))
+
+        pipeline = ExampleSource(
+            [test_graph, test_array], [graph_spec, array_spec], every=1
+        ) + Snapshot(
+            {test_array: "volumes/array"},
+            output_dir=str(self.test_dir),
+            output_filename="snapshot_{iteration}_{id}.hdf",
+            store_value_range=True,
+            write_in_background=True,
+        )
+
+        request = BatchRequest()
+        request[test_array] = ArraySpec(roi=Roi((0, 0, 0), (5, 5, 5)))
+        request[test_graph] = GraphSpec(roi=Roi((0, 0, 0), (5, 5, 5)))
+
+        with build(pipeline):
+            pipeline.request_batch(request)
+
+        # all pending snapshots are written on teardown
+        snapshot_file_paths = list(Path(self.test_dir).glob("snapshot_0_*.hdf"))
+        assert len(snapshot_file_paths) == 1
+        with h5py.File(snapshot_file_paths[0], "r") as f:
+            assert tuple(f["volumes/array"].attrs["value_range"]) == (0, 0)
+
+    def test_writer_drops_oldest(self):
+
+        written = []
+        blocked = threading.Event()
+        release = threading.Event()
+
+        def write(name):
+            blocked.set()
+            release.wait()
+            written.append(name)
+
+        writer = SnapshotWriter(write, max_pending=2)
+
+        # the first snapshot blocks the writer, the second gets dropped
+        writer.put("a")
+        blocked.wait()
+        for name in ["b", "c", "d"]:
+            writer.put(name)
+
+        release.set()
+        writer.stop()
+
+        assert written == ["a", "c", "d"]
+
+    def test_writer_errors(self):
+
+        def write(name):
+            raise IOError("disk full")
+
+        writer = SnapshotWriter(write, max_pending=2)
+        writer.put("a")
+
+        with self.assertRaises(RuntimeError):
+            writer.stop()
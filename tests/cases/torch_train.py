@@ -11,6 +11,8 @@ from gunpowder import (
     Batch,
     Scan,
     PreCache,
+    SimpleAugment,
+    Unsqueeze,
     build,
 )
 from gunpowder.ext import torch, NoSuchModule
@@ -19,6 +21,7 @@ from unittest import skipIf, expectedFailure
 import numpy as np
 
 import logging
+import os
 
 
 class ExampleTorchTrain2DSource(BatchProvider):
@@ -227,6 +230,45 @@ class TestTorchPredict(ProviderTest):
             assert np.isclose(batch2[d_pred].data, 2 * (1 + 4 + 9))
 
 
+@skipIf(isinstance(torch, NoSuchModule), "torch is not installed")
+class TestTorchPredictViews(ProviderTest):
+    def test_mirrored(self):
+
+        a = ArrayKey("A")
+        b = ArrayKey("B")
+        d_pred = ArrayKey("D_PREDICTED")
+
+        class ExampleModel(torch.nn.Module):
+            def forward(self, a, b):
+                return (a * b).sum()
+
+        # mirrored views can not be converted to tensors directly
+        pipeline = (
+            ExampleTorchTrainSource()
+            + SimpleAugment(mirror_probs=[1, 1], transpose_only=[])
+            + Predict(
+                model=ExampleModel(),
+                inputs={"a": a, "b": b},
+                outputs={0: d_pred},
+                array_specs={d_pred: ArraySpec(nonspatial=True)},
+            )
+        )
+
+        request = BatchRequest(
+            {
+                a: ArraySpec(roi=Roi((0, 0), (2, 2))),
+                b: ArraySpec(roi=Roi((0, 0), (2, 2))),
+                d_pred: ArraySpec(nonspatial=True),
+            }
+        )
+
+        with build(pipeline):
+            batch = pipeline.request_batch(request)
+
+        self.assertFalse(batch[a].data.flags.c_contiguous)
+        self.assertTrue(np.isclose(batch[d_pred].data, 1 + 4 + 9))
+
+
 class ExampleModel(torch.nn.Module):
     def __init__(self):
         super(ExampleModel, self).__init__()
@@ -311,3 +353,372 @@ class TestTorchPredictMultiprocessing(ProviderTest):
 
             batch = pipeline.request_batch(request)
             assert pred in batch
+
+    def test_server(self):
+
+        a = ArrayKey("A")
+        pred = ArrayKey("PRED")
+
+        reference_request = BatchRequest()
+        reference_request[a] = ArraySpec(roi=Roi((0, 0), (7, 7)))
+        reference_request[pred] = ArraySpec(roi=Roi((1, 1), (5, 5)))
+
+        request = BatchRequest(
+            {
+                a: ArraySpec(roi=Roi((0, 0), (17, 17))),
+                pred: ArraySpec(roi=Roi((0, 0), (15, 15))),
+            }
+        )
+
+        # a model that keeps the batch dimension
+        torch.manual_seed(42)
+        model = torch.nn.Conv2d(1, 1, 3).eval()
+
+        predictions = []
+        for max_batch_size, num_workers in [(None, 1), (3, 4)]:
+
+            pipeline = (
+                ExampleTorchTrain2DSource()
+                + Unsqueeze([a])
+                + Unsqueeze([a])
+                + Predict(
+                    model=model,
+                    inputs={"input": a},
+                    outputs={0: pred},
+                    array_specs={pred: ArraySpec()},
+                    device="cpu",
+                    max_batch_size=max_batch_size,
+                )
+                + Scan(reference_request, num_workers=num_workers)
+            )
+
+            with build(pipeline):
+                batch = pipeline.request_batch(request)
+
+            self.assertEqual(batch[pred].data.shape, (1, 1, 15, 15))
+            predictions.append(batch[pred].data)
+
+        self.assertTrue(np.allclose(predictions[0], predictions[1], atol=1e-6))
+
+    def test_server_died(self):
+
+        from gunpowder.nodes.generic_predict import (
+            InferenceServer,
+            PredictProcessDied,
+        )
+
+        server = InferenceServer(
+            lambda: None, lambda batches, requests: None, lambda: None, 1, 0.01
+        )
+        server.start()
+
+        # all slots are taken by other clients when the server dies
+        for _ in range(2):
+            server.free_slots.get()
+        server.process.terminate()
+        server.process.join()
+
+        with self.assertRaises(PredictProcessDied):
+            server.predict({}, BatchRequest())
+
+        server.process = None
+
+
+@skipIf(isinstance(torch, NoSuchModule), "torch is not installed")
+class TestTorchTrainStaging(ProviderTest):
+    def test_output(self):
+
+        a = ArrayKey("A")
+        b = ArrayKey("B")
+        c = ArrayKey("C")
+        c_pred = ArrayKey("C_PREDICTED")
+
+        class ExampleModel(torch.nn.Module):
+            def __init__(self):
+                super(ExampleModel, self).__init__()
+                self.linear = torch.nn.Linear(4, 1, False)
+
+            def forward(self, a, b):
+                a = a.reshape(-1)
+                b = b.reshape(-1)
+                return self.linear(a * b)
+
+        model = ExampleModel()
+        loss = torch.nn.MSELoss()
+        optimizer = torch.optim.SGD(model.parameters(), lr=1e-7, momentum=0.999)
+
+        # staging falls back to synchronous copies without CUDA
+        pipeline = (
+            ExampleTorchTrainSource()
+            + SimpleAugment(mirror_probs=[1, 1], transpose_only=[])
+            + Train(
+                model=model,
+                optimizer=optimizer,
+                loss=loss,
+                inputs={"a": a, "b": b},
+                loss_inputs={0: c_pred, 1: c},
+                outputs={0: c_pred},
+                array_specs={c_pred: ArraySpec(nonspatial=True)},
+                checkpoint_basename=self.path_to("model"),
+                save_every=100,
+                stage_transfers=True,
+            )
+        )
+
+        request = BatchRequest(
+            {
+                a: ArraySpec(roi=Roi((0, 0), (2, 2))),
+                b: ArraySpec(roi=Roi((0, 0), (2, 2))),
+                c: ArraySpec(nonspatial=True),
+                c_pred: ArraySpec(nonspatial=True),
+            }
+        )
+
+        with build(pipeline):
+
+            batch = pipeline.request_batch(request)
+
+            for i in range(10):
+                loss1 = batch.loss
+                batch = pipeline.request_batch(request)
+                loss2 = batch.loss
+                self.assertLess(loss2, loss1)
+                self.assertTrue(np.isclose(
+                    (batch[c_pred].data - batch[c].data)**2,
+                    loss2))
+
+    @skipIf(
+        isinstance(torch, NoSuchModule) or not torch.cuda.is_available(),
+        "CUDA is not available")
+    def test_stager(self):
+
+        from gunpowder.torch.helpers import TensorStager
+
+        stager = TensorStager(torch.device("cuda"))
+
+        data = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+        for i in range(3):
+            # mirrored, non-contiguous views
+            view = (data + i)[:, ::-1]
+            tensor = stager.to_device("data", view)
+            result = stager.to_numpy({"data": tensor * 2})["data"]
+            self.assertTrue(np.array_equal(result, view * 2))
+
+
+class ExampleTorchBatchedSource(BatchProvider):
+    def setup(self):
+
+        self.provides(ArrayKeys.X, ArraySpec(nonspatial=True))
+        self.provides(ArrayKeys.Y, ArraySpec(nonspatial=True))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        x = np.arange(15, dtype=np.float32).reshape(5, 3) / 10
+        y = x.sum(axis=1, keepdims=True)
+
+        batch.arrays[ArrayKeys.X] = Array(x, self.spec[ArrayKeys.X].copy())
+        batch.arrays[ArrayKeys.Y] = Array(y, self.spec[ArrayKeys.Y].copy())
+
+        return batch
+
+
+@skipIf(isinstance(torch, NoSuchModule), "torch is not installed")
+class TestTorchTrainAccumulation(ProviderTest):
+    def train(self, num_batches, **kwargs):
+
+        kwargs.setdefault("save_every", 1000)
+
+        x = ArrayKey("X")
+        y = ArrayKey("Y")
+        y_pred = ArrayKey("Y_PREDICTED")
+        y_grad = ArrayKey("Y_GRADIENT")
+
+        torch.manual_seed(42)
+        model = torch.nn.Linear(3, 1)
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+
+        pipeline = ExampleTorchBatchedSource() + Train(
+            model=model,
+            optimizer=optimizer,
+            loss=torch.nn.MSELoss(),
+            inputs={"input": x},
+            loss_inputs={0: y_pred, 1: y},
+            outputs={0: y_pred},
+            gradients={0: y_grad},
+            array_specs={
+                y_pred: ArraySpec(nonspatial=True),
+                y_grad: ArraySpec(nonspatial=True),
+            },
+            checkpoint_basename=self.path_to("model"),
+            **kwargs,
+        )
+
+        request = BatchRequest(
+            {
+                x: ArraySpec(nonspatial=True),
+                y: ArraySpec(nonspatial=True),
+                y_pred: ArraySpec(nonspatial=True),
+                y_grad: ArraySpec(nonspatial=True),
+            }
+        )
+
+        with build(pipeline):
+            batches = [pipeline.request_batch(request) for _ in range(num_batches)]
+
+        return batches, model.weight.detach().numpy().copy()
+
+    def test_micro_batches(self):
+
+        batches, weight = self.train(2)
+        micro_batches, micro_weight = self.train(2, micro_batches=2)
+
+        for batch, micro_batch in zip(batches, micro_batches):
+            self.assertAlmostEqual(batch.loss, micro_batch.loss, places=5)
+            for key in [ArrayKeys.Y_PREDICTED, ArrayKeys.Y_GRADIENT]:
+                self.assertTrue(
+                    np.allclose(batch[key].data, micro_batch[key].data, atol=1e-6)
+                )
+        self.assertTrue(np.allclose(weight, micro_weight, atol=1e-6))
+
+    def test_accumulate_gradients(self):
+
+        # the same batch twice, accumulated, equals a single step
+        batches, weight = self.train(1)
+        accumulated, accumulated_weight = self.train(2, accumulate_gradients=2)
+
+        self.assertEqual(accumulated[0].iteration, 1)
+        self.assertEqual(accumulated[1].iteration, 2)
+        self.assertAlmostEqual(batches[0].loss, accumulated[1].loss, places=5)
+        self.assertTrue(
+            np.allclose(
+                batches[0][ArrayKeys.Y_GRADIENT].data,
+                accumulated[1][ArrayKeys.Y_GRADIENT].data,
+            )
+        )
+        self.assertTrue(np.allclose(weight, accumulated_weight, atol=1e-6))
+
+    def test_accumulate_gradients_checkpoints(self):
+
+        # steps in iterations 2, 4, and 6, the first ones at or after
+        # iterations 3 and 6 create checkpoints
+        batches, _ = self.train(6, accumulate_gradients=2, save_every=3)
+
+        self.assertEqual([batch.iteration for batch in batches], [1, 2, 3, 4, 5, 6])
+        for iteration in range(1, 7):
+            self.assertEqual(
+                os.path.exists(self.path_to("model_checkpoint_%d" % iteration)),
+                iteration in [4, 6],
+            )
+
+
+class ExampleTorchImageSource(BatchProvider):
+    def setup(self):
+
+        self.provides(ArrayKeys.X, ArraySpec(nonspatial=True))
+        self.provides(ArrayKeys.Y, ArraySpec(nonspatial=True))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        x = np.random.RandomState(42).rand(2, 3, 8, 8).astype(np.float32)
+        y = x.mean(axis=1, keepdims=True)
+
+        batch.arrays[ArrayKeys.X] = Array(x, self.spec[ArrayKeys.X].copy())
+        batch.arrays[ArrayKeys.Y] = Array(y, self.spec[ArrayKeys.Y].copy())
+
+        return batch
+
+
+@skipIf(isinstance(torch, NoSuchModule), "torch is not installed")
+class TestTorchExecutionModes(ProviderTest):
+    def test_train(self):
+
+        x = ArrayKey("X")
+        y = ArrayKey("Y")
+        y_pred = ArrayKey("Y_PREDICTED")
+
+        torch.manual_seed(42)
+        model = torch.nn.Conv2d(3, 1, 3, padding=1)
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+
+        pipeline = ExampleTorchImageSource() + Train(
+            model=model,
+            optimizer=optimizer,
+            loss=torch.nn.MSELoss(),
+            inputs={"input": x},
+            loss_inputs={0: y_pred, 1: y},
+            outputs={0: y_pred},
+            array_specs={y_pred: ArraySpec(nonspatial=True)},
+            checkpoint_basename=self.path_to("model"),
+            save_every=20,
+            precision="bfloat16",
+            channels_last=True,
+        )
+
+        request = BatchRequest(
+            {
+                x: ArraySpec(nonspatial=True),
+                y: ArraySpec(nonspatial=True),
+                y_pred: ArraySpec(nonspatial=True),
+            }
+        )
+
+        with build(pipeline):
+            losses = []
+            for i in range(20):
+                batch = pipeline.request_batch(request)
+                losses.append(batch.loss)
+
+        self.assertEqual(batch[y_pred].data.dtype, np.float32)
+        self.assertTrue(model.weight.is_contiguous(memory_format=torch.channels_last))
+        self.assertLess(np.mean(losses[-5:]), np.mean(losses[:5]))
+
+        checkpoint = torch.load(self.path_to("model_checkpoint_20"))
+        self.assertEqual(checkpoint["precision"], "bfloat16")
+        self.assertTrue(checkpoint["channels_last"])
+        # gradients are only scaled for float16
+        self.assertNotIn("scaler_state_dict", checkpoint)
+
+    def test_predict(self):
+
+        x = ArrayKey("X")
+        y = ArrayKey("Y")
+        y_pred = ArrayKey("Y_PREDICTED")
+
+        torch.manual_seed(42)
+        model = torch.nn.Conv2d(3, 1, 3, padding=1).eval()
+
+        request = BatchRequest(
+            {
+                x: ArraySpec(nonspatial=True),
+                y_pred: ArraySpec(nonspatial=True),
+            }
+        )
+
+        predictions = []
+        for kwargs in [
+            {},
+            {"compile": "script", "channels_last": True},
+            {"precision": "bfloat16"},
+        ]:
+
+            pipeline = ExampleTorchImageSource() + Predict(
+                model=model,
+                inputs={"input": x},
+                outputs={0: y_pred},
+                array_specs={y_pred: ArraySpec(nonspatial=True)},
+                device="cpu",
+                **kwargs,
+            )
+
+            with build(pipeline):
+                batch = pipeline.request_batch(request)
+
+            self.assertEqual(batch[y_pred].data.dtype, np.float32)
+            predictions.append(batch[y_pred].data)
+
+        self.assertTrue(np.allclose(predictions[0], predictions[1], atol=1e-5))
+        self.assertTrue(np.allclose(predictions[0], predictions[2], atol=5e-2))